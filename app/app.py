@@ -1,30 +1,100 @@
 import os
+import sys
+import tempfile
+import time
 from pathlib import Path
 
 import streamlit as st
 from annotated_text import annotated_text
 
-from ojd_daps_skills.pipeline.extract_skills.extract_skills import ExtractSkills
+from app_utils import (
+    ADVERT_ID_COLUMNS,
+    ADVERT_TEXT_COLUMNS,
+    DEFAULT_BATCH_SIZE,
+    EXTRACTION_CACHE,
+    EXTRACTION_POOL,
+    MODEL_REGISTRY,
+    PHRASE_CACHE,
+    ExtractionQueueFull,
+    ExtractionTimeout,
+    cached_extract_skills,
+    cached_map_to_taxonomies,
+    extract_skills_by_sentence,
+    extract_skills_in_batches,
+    extracted_skills_to_json,
+    guess_column,
+    read_adverts,
+)
 
 PROJECT_DIR = Path(__file__).resolve().parents[1]
+# The stage timings are shared with the dashboard, in shared/stage_timings.py
+SHARED_DIR = os.path.join(PROJECT_DIR, "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.append(SHARED_DIR)
+from stage_timings import show_timing_panel, timings_for
+
+TIMINGS = timings_for("SKILLS_EXTRACTOR")
 app_folder = os.path.join(PROJECT_DIR, "app/")
 
 st.set_page_config(
     page_title="Nesta Skills Extractor", page_icon=os.path.join(app_folder, "images/nesta_logo.png"),
 )
 
-def hash_config_name(es):
-    # custom hash function in order to use st.cache
-    return es.taxonomy_name
-    
-@st.cache(hash_funcs={ExtractSkills: hash_config_name})
+TIMINGS.start_rerun()
+TIMINGS.add_cache("extraction", EXTRACTION_CACHE.stats)
+TIMINGS.add_cache("phrase", PHRASE_CACHE.stats)
+
+# With SKILLS_EXTRACTOR_WORKERS set, extraction runs in a pool of worker
+# processes that load their own models. Otherwise both taxonomies' models load
+# in background threads when the first session starts, and are then shared
+# by every session
+if EXTRACTION_POOL is not None:
+    EXTRACTION_POOL.start()
+else:
+    MODEL_REGISTRY.start()
+
+
+@TIMINGS.timed()
 def load_model(app_mode):
-    if app_mode == esco_tax:
-        es = ExtractSkills(config_name="extract_skills_esco", local=True)
-    elif app_mode == lightcast_tax:
-        es = ExtractSkills(config_name="extract_skills_lightcast", local=True)
-    es.load()
-    return es
+    """The extractor for app_mode: a stand-in that runs in the worker pool, or
+    the shared in-process model (None while it is still loading)"""
+    if EXTRACTION_POOL is not None:
+        return EXTRACTION_POOL.extractor(app_mode)
+    return MODEL_REGISTRY.get(app_mode)
+
+
+def show_queue_position(placeholder):
+    """on_wait callback for the worker pool, reporting progress in placeholder"""
+
+    def on_wait(queue_position, waited):
+        if queue_position > 0:
+            placeholder.info(
+                f"⏳ {queue_position} request(s) ahead of yours ({waited:.0f}s)..."
+            )
+        else:
+            placeholder.info(f"🤖 Running algorithms... ({waited:.0f}s)")
+
+    return on_wait
+
+
+def show_phrase_cache_stats():
+    phrase_cache_stats = PHRASE_CACHE.stats()
+    st.caption(
+        f"{phrase_cache_stats['total_hit_rate']:.0%} of skill phrases have been mapped "
+        f"from the phrase cache ({phrase_cache_stats.get('disk_items', 0)} phrases cached)"
+    )
+
+
+def show_taxonomy_skills(advert_skills, taxonomy):
+    st.markdown(f"**The _{taxonomy}_ taxonomy skills are**: ")
+    annotated_text(
+        *[
+            highlight
+            for s in advert_skills["SKILL"]
+            for highlight in [(s[1][0], "", "#FDB633"), " "]
+        ]
+    )
+
 
 col1, col2 = st.columns([45, 55])
 
@@ -65,43 +135,212 @@ If you would like to explore how the algorithm can provide new insights on the U
 
 esco_tax = "ESCO"
 lightcast_tax = "Lightcast"
-app_mode = st.selectbox("🗺️ Choose a taxonomy to map onto", [esco_tax, lightcast_tax])
-txt = st.text_area(
-    "✨ Add your job advert text here ... or try out the phrase 'You must have strong communication skills.'",
-    "",
+compare_tax = "Compare ESCO and Lightcast"
+app_mode = st.selectbox(
+    "🗺️ Choose a taxonomy to map onto", [esco_tax, lightcast_tax, compare_tax]
+)
+# In comparison mode skills are extracted once and mapped to both taxonomies
+taxonomies = [esco_tax, lightcast_tax] if app_mode == compare_tax else [app_mode]
+
+single_mode = "A single job advert"
+batch_mode = "Upload a file of job adverts"
+input_mode = st.radio(
+    "📄 What would you like to extract skills from?",
+    [single_mode, batch_mode],
+    horizontal=True,
 )
-es = load_model(app_mode)
-
-button = st.button("Extract Skills")
-
-if button:
-    txt = txt.replace("\n", ". ")
-    with st.spinner("🤖 Running algorithms..."):
-
-        extracted_skills = es.extract_skills(txt)
-
-    if "SKILL" in extracted_skills[0].keys():
-        st.success(f"{len(extracted_skills[0]['SKILL'])} skill(s) extracted!", icon="💃")
-        st.markdown(f"**The extracted skills are:** ")
-        annotated_text(
-            *[
-                highlight
-                for s in extracted_skills[0]["SKILL"]
-                for highlight in [(s[0], "", "#F6A4B7"), " "]
-            ]
-        )
-        st.markdown("")  # Add a new line
-        st.markdown(f"**The _{app_mode}_ taxonomy skills are**: ")
-        annotated_text(
-            *[
-                highlight
-                for s in extracted_skills[0]["SKILL"]
-                for highlight in [(s[1][0], "", "#FDB633"), " "]
-            ]
-        )
-
-    else:
-        st.warning("No skills were found in the job advert", icon="⚠️")
+
+extractors = {taxonomy: load_model(taxonomy) for taxonomy in taxonomies}
+models_ready = all(es is not None for es in extractors.values())
+for taxonomy, es in extractors.items():
+    model_stats = MODEL_REGISTRY.stats()[taxonomy]
+    if es is None:
+        if model_stats["status"] == MODEL_REGISTRY.FAILED:
+            st.error(
+                f"The {taxonomy} model failed to load: {model_stats['error']}", icon="🚨"
+            )
+        else:
+            st.info(
+                f"⏳ The {taxonomy} model is still loading "
+                f"({model_stats['load_seconds'] or 0:.0f}s so far). "
+                "You can add your job advert while you wait.",
+            )
+if not models_ready and not any(
+    MODEL_REGISTRY.status(taxonomy) == MODEL_REGISTRY.FAILED for taxonomy in taxonomies
+):
+    st.button("🔄 Check again")
+
+if input_mode == single_mode:
+    txt = st.text_area(
+        "✨ Add your job advert text here ... or try out the phrase 'You must have strong communication skills.'",
+        "",
+    )
+
+    button = st.button("Extract Skills", disabled=not models_ready)
+
+    if button:
+        queue_status = st.empty()
+        if EXTRACTION_POOL is not None:
+            for es in extractors.values():
+                es.on_wait = show_queue_position(queue_status)
+        try:
+            with st.spinner("🤖 Running algorithms..."), TIMINGS.stage(
+                "extract_skills", cache=EXTRACTION_CACHE
+            ):
+
+                # Extracted sentence by sentence through the extraction cache,
+                # so after an edit only the changed sentences are re-extracted
+                if app_mode == compare_tax:
+                    extracted_skills = extract_skills_by_sentence(
+                        extractors, txt, cached_map_to_taxonomies
+                    )
+                else:
+                    extracted_skills = extract_skills_by_sentence(
+                        extractors[app_mode], txt
+                    )
+        except (ExtractionQueueFull, ExtractionTimeout) as e:
+            extracted_skills = None
+            st.warning(f"The Skills Extractor is busy, please try again shortly. ({e})", icon="⏳")
+        queue_status.empty()
+
+        if extracted_skills is None:
+            pass
+        elif app_mode == compare_tax and "SKILL" in extracted_skills[0][esco_tax]:
+            advert_skills = extracted_skills[0]
+            st.success(
+                f"{len(advert_skills[esco_tax]['SKILL'])} skill(s) extracted!", icon="💃"
+            )
+            st.markdown(f"**The extracted skills are:** ")
+            annotated_text(
+                *[
+                    highlight
+                    for s in advert_skills[esco_tax]["SKILL"]
+                    for highlight in [(s[0], "", "#F6A4B7"), " "]
+                ]
+            )
+            st.markdown("")  # Add a new line
+            for column, taxonomy in zip(st.columns(len(taxonomies)), taxonomies):
+                with column:
+                    show_taxonomy_skills(advert_skills[taxonomy], taxonomy)
+
+        elif app_mode != compare_tax and "SKILL" in extracted_skills[0].keys():
+            st.success(f"{len(extracted_skills[0]['SKILL'])} skill(s) extracted!", icon="💃")
+            st.markdown(f"**The extracted skills are:** ")
+            annotated_text(
+                *[
+                    highlight
+                    for s in extracted_skills[0]["SKILL"]
+                    for highlight in [(s[0], "", "#F6A4B7"), " "]
+                ]
+            )
+            st.markdown("")  # Add a new line
+            show_taxonomy_skills(extracted_skills[0], app_mode)
+
+        else:
+            st.warning("No skills were found in the job advert", icon="⚠️")
+
+        if extracted_skills is not None:
+            show_phrase_cache_stats()
+
+else:
+    uploaded_file = st.file_uploader(
+        "📂 Upload a csv or jsonl file with one job advert per row", type=["csv", "jsonl"]
+    )
+
+    if uploaded_file is not None:
+        adverts = read_adverts(uploaded_file)
+        st.caption(f"{len(adverts)} job adverts found in {uploaded_file.name}")
+
+        col1, col2, col3 = st.columns([40, 40, 20])
+        with col1:
+            text_column = st.selectbox(
+                "Job advert text column",
+                list(adverts.columns),
+                index=guess_column(adverts, ADVERT_TEXT_COLUMNS),
+            )
+        with col2:
+            id_column = st.selectbox(
+                "Job advert id column",
+                ["(row number)"] + list(adverts.columns),
+                # Offset by one for the "(row number)" option
+                index=guess_column(adverts, ADVERT_ID_COLUMNS, default=-1) + 1,
+            )
+        with col3:
+            batch_size = st.number_input(
+                "Batch size", min_value=1, max_value=1024, value=DEFAULT_BATCH_SIZE
+            )
+
+        if st.button("Extract Skills", disabled=not models_ready):
+            texts = adverts[text_column].tolist()
+            if id_column == "(row number)":
+                advert_ids = list(range(len(adverts)))
+            else:
+                advert_ids = adverts[id_column].tolist()
+
+            progress_bar = st.progress(0)
+            progress_text = st.empty()
+            if EXTRACTION_POOL is not None:
+                for es in extractors.values():
+                    es.on_wait = show_queue_position(progress_text)
+            if app_mode == compare_tax:
+                # Each line holds the skills mapped to each taxonomy
+                es, extract = extractors, cached_map_to_taxonomies
+            else:
+                es, extract = extractors[app_mode], cached_extract_skills
+
+            # Stream each batch to disk as it finishes rather than holding every
+            # result as python objects; only the finished jsonl bytes are kept
+            results_file = tempfile.NamedTemporaryFile(
+                mode="w", suffix=".jsonl", delete=False
+            )
+            start_time = time.perf_counter()
+            num_done = 0
+            try:
+                with results_file:
+                    for num_done, extracted_skills in extract_skills_in_batches(
+                        es,
+                        texts,
+                        batch_size,
+                        TIMINGS.timed("extract_skills", cache=EXTRACTION_CACHE)(extract),
+                    ):
+                        batch_ids = advert_ids[num_done - len(extracted_skills) : num_done]
+                        for advert_id, advert_skills in zip(batch_ids, extracted_skills):
+                            results_file.write(
+                                extracted_skills_to_json(advert_id, advert_skills)
+                            )
+                        elapsed = time.perf_counter() - start_time
+                        progress_bar.progress(num_done / len(texts))
+                        progress_text.markdown(
+                            f"{num_done}/{len(texts)} job adverts processed "
+                            f"({num_done / elapsed:.1f} adverts/sec)"
+                        )
+            except (ExtractionQueueFull, ExtractionTimeout) as e:
+                st.warning(
+                    f"The Skills Extractor is busy, stopped after {num_done} job adverts. ({e})",
+                    icon="⏳",
+                )
+            finally:
+                # The download button sends the whole file anyway, so keep its
+                # bytes in session state and leave nothing in the temp dir
+                with open(results_file.name, "rb") as results:
+                    st.session_state["batch_results"] = {
+                        "data": results.read(),
+                        "file_name": f"{Path(uploaded_file.name).stem}_{'_'.join(taxonomies)}_skills.jsonl",
+                    }
+                os.remove(results_file.name)
+            if num_done == len(texts):
+                st.success(f"Skills extracted from {len(texts)} job adverts!", icon="💃")
+            show_phrase_cache_stats()
+
+        # Kept in session state so the download survives the rerun the button triggers
+        batch_results = st.session_state.get("batch_results")
+        if batch_results:
+            st.download_button(
+                "⬇️ Download extracted skills (jsonl)",
+                batch_results["data"],
+                file_name=batch_results["file_name"],
+                mime="application/jsonl",
+            )
 
 st.write("")
 st.markdown("""---""")
@@ -113,3 +352,5 @@ st.markdown(
 """,
 unsafe_allow_html=True,
 )
+
+show_timing_panel(TIMINGS)
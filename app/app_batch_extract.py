@@ -0,0 +1,363 @@
+"""Extract skills from a large file of job adverts, without the streamlit app.
+
+    python app/app_batch_extract.py adverts.jsonl skills.jsonl --taxonomy ESCO --workers 4
+
+Adverts are streamed from a jsonl or parquet file in chunks and extracted by
+a pool of worker processes (each with its own loaded models), so memory use
+doesn't grow with the size of the corpus. Results are appended to a jsonl
+file in input order, one line per advert as in the app's batch mode. A
+checkpoint file next to the output records how far the run got; running
+the same command again resumes from the last checkpoint. Use --restart to
+start again from the beginning.
+"""
+import argparse
+import collections
+import itertools
+import json
+import os
+import time
+
+from app_utils import (
+    ADVERT_ID_COLUMNS,
+    ADVERT_TEXT_COLUMNS,
+    TAXONOMY_CONFIGS,
+    ExtractionPool,
+    _worker_extract_skills,
+    _worker_map_to_taxonomies,
+    extract_and_map_skills,
+    extracted_skills_to_json,
+    load_extract_skills,
+    map_to_taxonomies,
+    normalise_advert_text,
+)
+
+DEFAULT_CHUNK_SIZE = 256
+# Chunks between checkpoints
+DEFAULT_CHECKPOINT_EVERY = 10
+
+
+def _pick_column(columns, column, candidates):
+    if column is not None:
+        if column not in columns:
+            raise ValueError(f"Column {column} not found, the columns are {columns}")
+        return column
+    lower_columns = {str(c).lower(): c for c in columns}
+    for candidate in candidates:
+        if candidate in lower_columns:
+            return lower_columns[candidate]
+    return None
+
+
+def read_jsonl_adverts(path, text_column=None, id_column=None, skip=0):
+    """(advert id, text) for each advert (non-blank line) of a jsonl file
+    after the first skip adverts. Without an id column the id is the advert's
+    number. Blank lines aren't counted, so skip matches the adverts yielded
+    by an earlier run."""
+    advert_num = -1
+    with open(path, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            advert_num += 1
+            advert = json.loads(line)
+            if advert_num == 0 or text_column is None:
+                text_column = _pick_column(list(advert), text_column, ADVERT_TEXT_COLUMNS)
+                id_column = _pick_column(list(advert), id_column, ADVERT_ID_COLUMNS)
+                if text_column is None:
+                    raise ValueError(
+                        f"No advert text column found in {path}, use --text_column"
+                    )
+            if advert_num < skip:
+                continue
+            yield (
+                advert[id_column] if id_column is not None else advert_num,
+                advert.get(text_column),
+            )
+
+
+def read_parquet_adverts(
+    path, text_column=None, id_column=None, skip=0, batch_size=DEFAULT_CHUNK_SIZE
+):
+    """(advert id, text) for each row of a parquet file after the first skip,
+    read one record batch at a time. Without an id column the id is the row
+    number."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading parquet files needs pyarrow (pip install pyarrow)")
+
+    parquet_file = pq.ParquetFile(path)
+    columns = parquet_file.schema_arrow.names
+    text_column = _pick_column(columns, text_column, ADVERT_TEXT_COLUMNS)
+    id_column = _pick_column(columns, id_column, ADVERT_ID_COLUMNS)
+    if text_column is None:
+        raise ValueError(f"No advert text column found in {path}, use --text_column")
+
+    row_num = 0
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size,
+        columns=[c for c in (id_column, text_column) if c is not None],
+    ):
+        if row_num + batch.num_rows <= skip:
+            row_num += batch.num_rows
+            continue
+        texts = batch.column(text_column).to_pylist()
+        if id_column is not None:
+            advert_ids = batch.column(id_column).to_pylist()
+        else:
+            advert_ids = range(row_num, row_num + batch.num_rows)
+        for advert_id, text in zip(advert_ids, texts):
+            if row_num >= skip:
+                yield advert_id, text
+            row_num += 1
+
+
+def read_advert_stream(path, **kwargs):
+    if path.endswith(".parquet"):
+        return read_parquet_adverts(path, **kwargs)
+    elif path.endswith((".jsonl", ".json")):
+        return read_jsonl_adverts(path, **kwargs)
+    else:
+        raise ValueError(
+            f'{path} has wrong file extension! Only supports "*.jsonl" or "*.parquet"'
+        )
+
+
+def chunked(iterable, chunk_size):
+    """Lists of up to chunk_size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def checkpoint_path(output_path):
+    return output_path + ".checkpoint.json"
+
+
+def load_checkpoint(output_path):
+    try:
+        with open(checkpoint_path(output_path), "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(output_path, checkpoint):
+    tmp_path = checkpoint_path(output_path) + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, checkpoint_path(output_path))
+
+
+def per_advert(mapped_skills):
+    """[{taxonomy: extracted skills}] from map_to_taxonomies' {taxonomy: [extracted skills]}"""
+    taxonomies = list(mapped_skills)
+    return [
+        dict(zip(taxonomies, advert_skills))
+        for advert_skills in zip(*mapped_skills.values())
+    ]
+
+
+class InlineExtractor:
+    """Extracts chunks in this process (--workers 0)"""
+
+    def __init__(self, taxonomies):
+        self.extractors = {
+            taxonomy: load_extract_skills(TAXONOMY_CONFIGS[taxonomy])
+            for taxonomy in taxonomies
+        }
+
+    def extract(self, texts):
+        if len(self.extractors) == 1:
+            (es,) = self.extractors.values()
+            return extract_and_map_skills(es, texts)
+        return per_advert(map_to_taxonomies(self.extractors, texts))
+
+    def close(self):
+        """Nothing to release; the models go with the extractor"""
+
+
+class PoolExtractor:
+    """Extracts chunks in an ExtractionPool, keeping up to two chunks per
+    worker in flight and returning results in submission order"""
+
+    def __init__(self, taxonomies, workers):
+        self.taxonomies = taxonomies
+        self.pool = ExtractionPool(
+            max_workers=workers,
+            max_queued=workers,
+            taxonomy_configs={taxonomy: TAXONOMY_CONFIGS[taxonomy] for taxonomy in taxonomies},
+        )
+        self.max_in_flight = 2 * workers
+
+    def close(self):
+        """Shut the pool's worker processes down"""
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _submit(self, texts):
+        """(ticket, future) of the chunk"""
+        if len(self.taxonomies) == 1:
+            return self.pool.submit(
+                _worker_extract_skills, TAXONOMY_CONFIGS[self.taxonomies[0]], texts
+            )
+        return self.pool.submit(
+            _worker_map_to_taxonomies, self.pool.taxonomy_configs, texts
+        )
+
+    def _result(self, submitted):
+        # Through pool.result so the chunk's place in the pool is freed before
+        # the next chunk is submitted
+        result = self.pool.result(*submitted, timeout=None)
+        return result if len(self.taxonomies) == 1 else per_advert(result)
+
+    def extract_chunks(self, chunks):
+        """(chunk, extracted skills) for each chunk, in order"""
+        in_flight = collections.deque()
+        for chunk in chunks:
+            if len(in_flight) >= self.max_in_flight:
+                done_chunk, submitted = in_flight.popleft()
+                yield done_chunk, self._result(submitted)
+            in_flight.append((chunk, self._submit([text for _, text in chunk])))
+        while in_flight:
+            done_chunk, submitted = in_flight.popleft()
+            yield done_chunk, self._result(submitted)
+
+
+def run(
+    input_path,
+    output_path,
+    taxonomies=("ESCO",),
+    workers=os.cpu_count(),
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+    text_column=None,
+    id_column=None,
+    restart=False,
+):
+    """Extract skills from every advert in input_path into output_path,
+    resuming from output_path's checkpoint if there is one"""
+    taxonomies = list(taxonomies)
+    run_info = {"input": os.path.abspath(input_path), "taxonomies": taxonomies}
+    checkpoint = None if restart else load_checkpoint(output_path)
+    if checkpoint is not None:
+        if {k: checkpoint.get(k) for k in run_info} != run_info:
+            raise ValueError(
+                f"{checkpoint_path(output_path)} is for a different run, use --restart"
+            )
+        if checkpoint.get("complete"):
+            print(f"{output_path} is already complete ({checkpoint['adverts_done']} adverts)")
+            return checkpoint
+        print(f"Resuming after {checkpoint['adverts_done']} adverts")
+    else:
+        checkpoint = {**run_info, "adverts_done": 0, "output_bytes": 0, "complete": False}
+
+    chunks = chunked(
+        (
+            (advert_id, normalise_advert_text(text))
+            for advert_id, text in read_advert_stream(
+                input_path,
+                text_column=text_column,
+                id_column=id_column,
+                skip=checkpoint["adverts_done"],
+            )
+        ),
+        chunk_size,
+    )
+    if workers > 0:
+        extractor = PoolExtractor(taxonomies, workers)
+        extracted_chunks = extractor.extract_chunks(chunks)
+    else:
+        extractor = InlineExtractor(taxonomies)
+        extracted_chunks = (
+            (chunk, extractor.extract([text for _, text in chunk])) for chunk in chunks
+        )
+
+    try:
+        # Drop anything written after the last checkpoint before appending
+        with open(output_path, "a") as output:
+            output.truncate(checkpoint["output_bytes"])
+        start_time = time.perf_counter()
+        num_done = 0
+        with open(output_path, "a") as output:
+            for chunk_num, (chunk, extracted_skills) in enumerate(extracted_chunks, 1):
+                output.writelines(
+                    extracted_skills_to_json(advert_id, advert_skills)
+                    for (advert_id, _), advert_skills in zip(chunk, extracted_skills)
+                )
+                num_done += len(chunk)
+                if chunk_num % checkpoint_every == 0:
+                    output.flush()
+                    os.fsync(output.fileno())
+                    checkpoint["adverts_done"] += num_done
+                    checkpoint["output_bytes"] = output.tell()
+                    save_checkpoint(output_path, checkpoint)
+                    elapsed = time.perf_counter() - start_time
+                    print(
+                        f"{checkpoint['adverts_done']} adverts done "
+                        f"({num_done / elapsed:.1f} adverts/sec)"
+                    )
+                    num_done, start_time = 0, time.perf_counter()
+            output.flush()
+            os.fsync(output.fileno())
+            checkpoint["adverts_done"] += num_done
+            checkpoint["output_bytes"] = output.tell()
+    finally:
+        # Stop the worker processes, which each hold loaded models, on errors too
+        extractor.close()
+    checkpoint["complete"] = True
+    save_checkpoint(output_path, checkpoint)
+    print(f"Skills extracted from {checkpoint['adverts_done']} adverts into {output_path}")
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input_path", help="jsonl or parquet file of job adverts")
+    parser.add_argument("output_path", help="jsonl file to write the extracted skills to")
+    parser.add_argument(
+        "--taxonomy",
+        nargs="+",
+        default=["ESCO"],
+        choices=list(TAXONOMY_CONFIGS),
+        help="Taxonomies to map onto; with more than one, skills are extracted once and mapped to each",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Worker processes (0 to extract in this process)",
+    )
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--checkpoint_every",
+        type=int,
+        default=DEFAULT_CHECKPOINT_EVERY,
+        help="Chunks between checkpoints",
+    )
+    parser.add_argument("--text_column", default=None)
+    parser.add_argument("--id_column", default=None)
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore any checkpoint and start again"
+    )
+    args = parser.parse_args()
+
+    run(
+        args.input_path,
+        args.output_path,
+        taxonomies=args.taxonomy,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        checkpoint_every=args.checkpoint_every,
+        text_column=args.text_column,
+        id_column=args.id_column,
+        restart=args.restart,
+    )
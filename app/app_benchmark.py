@@ -0,0 +1,366 @@
+"""Benchmark skill extraction latency and throughput on a bundled corpus of synthetic job adverts.
+
+    python app/app_benchmark.py --taxonomy ESCO Lightcast --batch_size 1 8 32 --output results.json
+    python app/app_benchmark.py --compare baseline.json results.json --report report.md
+
+Times the app's extraction path, load_extract_skills (as load_model does)
+then es.extract_skills, by taxonomy, advert length bucket and batch size.
+Both a cold model (a fresh process: import, load and first call) and a warm
+one (repeated calls after a warm-up) are covered, and the app's caches are
+bypassed. Each taxonomy runs in its own spawned processes, so models never
+share memory or warm each other up.
+
+The corpus (app/benchmark_adverts.jsonl) is generated from a fixed seed with
+--generate_corpus, so runs on different machines or library versions see
+the same adverts. Results are written as json with p50/p95/p99 call
+latencies and adverts per second (a percentile is null when there were too
+few calls to estimate it); --compare reports the change between two result
+files and exits with an error if any p95 (or p50, where there is no p95) got
+slower than --tolerance allows.
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from app_utils import (
+    LIBRARY_VERSION,
+    TAXONOMY_CONFIGS,
+    load_extract_skills,
+    normalise_advert_text,
+)
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_adverts.jsonl")
+
+# Advert length buckets, in words
+LENGTH_BUCKETS = {
+    "short": (20, 60),
+    "medium": (60, 200),
+    "long": (200, 500),
+    "very_long": (500, 1200),
+}
+ADVERTS_PER_BUCKET = 48
+
+BATCH_SIZES = [1, 8, 32]
+DEFAULT_REPEATS = 3
+DEFAULT_COLD_RUNS = 5
+# Allowed p95 increase before --compare reports a regression
+DEFAULT_TOLERANCE = 0.20
+PERCENTILES = [50, 95, 99]
+# Calls needed for each percentile: at least one call above p95 or p99
+MIN_CALLS = {50: 3, 95: 20, 99: 100}
+
+_TITLES = [
+    "Care Assistant",
+    "Software Developer",
+    "Accounts Assistant",
+    "Warehouse Operative",
+    "Primary School Teacher",
+    "Marketing Executive",
+    "HGV Driver",
+    "Registered Nurse",
+    "Customer Service Advisor",
+    "Project Manager",
+]
+_SKILL_SENTENCES = [
+    "You will need excellent communication skills and a positive attitude.",
+    "Experience with Python, SQL and cloud computing is essential.",
+    "The role involves managing budgets and preparing financial reports.",
+    "You must be able to work well in a team and on your own initiative.",
+    "Knowledge of health and safety regulations is desirable.",
+    "Strong organisational skills and attention to detail are required.",
+    "You will provide personal care and support to residents.",
+    "Experience of stock control and using a forklift truck would be an advantage.",
+    "The successful candidate will plan and deliver engaging lessons.",
+    "You will build relationships with stakeholders and manage suppliers.",
+    "A full UK driving licence and a good knowledge of local roads is needed.",
+    "You will analyse data and present insights to senior managers.",
+    "Problem solving and time management skills are key to this role.",
+    "Experience of social media marketing and content creation is preferred.",
+    "You will administer medication and maintain accurate patient records.",
+    "Excellent customer service skills and a friendly manner are essential.",
+]
+_OTHER_SENTENCES = [
+    "We are a growing company based in the heart of the city.",
+    "This is a full time, permanent position with flexible hours.",
+    "We offer a competitive salary, pension scheme and 25 days holiday.",
+    "Please apply with your CV and a covering letter.",
+    "Interviews will be held next month.",
+    "We are an equal opportunities employer and welcome all applications.",
+    "Free parking is available on site.",
+    "The working pattern is Monday to Friday with occasional weekends.",
+]
+
+
+def generate_corpus(path=CORPUS_PATH, seed=0):
+    """Write ADVERTS_PER_BUCKET synthetic adverts per length bucket to path"""
+    rng = random.Random(seed)
+    with open(path, "w") as file:
+        for bucket, (min_words, max_words) in LENGTH_BUCKETS.items():
+            for i in range(ADVERTS_PER_BUCKET):
+                target_words = rng.randint(min_words, max_words - 1)
+                sentences = [f"We are looking for a {rng.choice(_TITLES)} to join our team."]
+                num_words = len(sentences[0].split())
+                while num_words < target_words:
+                    sentence = rng.choice(
+                        _SKILL_SENTENCES if rng.random() < 0.6 else _OTHER_SENTENCES
+                    )
+                    if num_words + len(sentence.split()) >= max_words:
+                        break
+                    sentences.append(sentence)
+                    num_words += len(sentence.split())
+                advert = {
+                    "id": f"{bucket}-{i}",
+                    "length_bucket": bucket,
+                    "description": " ".join(sentences),
+                }
+                file.write(json.dumps(advert) + "\n")
+
+
+def read_corpus(path=CORPUS_PATH):
+    """{length bucket: [advert text, ...]}"""
+    corpus = {bucket: [] for bucket in LENGTH_BUCKETS}
+    with open(path, "r") as file:
+        for line in file:
+            if line.strip():
+                advert = json.loads(line)
+                corpus[advert["length_bucket"]].append(
+                    normalise_advert_text(advert["description"])
+                )
+    return corpus
+
+
+def _batches(texts, batch_size):
+    return [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+
+
+def summarise(latencies, num_adverts):
+    """Percentiles (in seconds) of call latencies, None where there are fewer
+    than MIN_CALLS, and adverts per second"""
+    latencies = np.asarray(latencies, dtype=np.float64)
+    summary = {
+        f"p{percentile}": float(np.percentile(latencies, percentile))
+        if len(latencies) >= MIN_CALLS[percentile]
+        else None
+        for percentile in PERCENTILES
+    }
+    summary["mean"] = float(latencies.mean())
+    summary["calls"] = len(latencies)
+    summary["adverts_per_second"] = num_adverts / float(latencies.sum())
+    return summary
+
+
+def run_cold(taxonomy, length_bucket, batch_size, corpus_path=CORPUS_PATH):
+    """Load time and first call latency of a model in this (fresh) process"""
+    batch = read_corpus(corpus_path)[length_bucket][:batch_size]
+    start = time.perf_counter()
+    es = load_extract_skills(TAXONOMY_CONFIGS[taxonomy])
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    es.extract_skills(batch)
+    return load_seconds, time.perf_counter() - start
+
+
+def run_warm(taxonomy, batch_sizes, repeats, corpus_path=CORPUS_PATH):
+    """[result] for each length bucket and batch size, with the model loaded
+    and warmed up first"""
+    corpus = read_corpus(corpus_path)
+    es = load_extract_skills(TAXONOMY_CONFIGS[taxonomy])
+    # Warm up on every bucket, so lazily built structures don't count
+    es.extract_skills([texts[0] for texts in corpus.values() if texts])
+    results = []
+    for length_bucket, texts in corpus.items():
+        for batch_size in batch_sizes:
+            latencies = []
+            for _ in range(repeats):
+                for batch in _batches(texts, batch_size):
+                    start = time.perf_counter()
+                    es.extract_skills(batch)
+                    latencies.append(time.perf_counter() - start)
+            results.append(
+                {
+                    "taxonomy": taxonomy,
+                    "length_bucket": length_bucket,
+                    "batch_size": batch_size,
+                    "model": "warm",
+                    **summarise(latencies, repeats * len(texts)),
+                }
+            )
+    return results
+
+
+def _in_fresh_process(fn, *args):
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def run(
+    taxonomies=tuple(TAXONOMY_CONFIGS),
+    batch_sizes=BATCH_SIZES,
+    repeats=DEFAULT_REPEATS,
+    cold_runs=DEFAULT_COLD_RUNS,
+    corpus_path=CORPUS_PATH,
+):
+    """{"run": environment, "results": [result, ...]}"""
+    results = []
+    for taxonomy in taxonomies:
+        for length_bucket in LENGTH_BUCKETS:
+            for batch_size in batch_sizes if cold_runs > 0 else []:
+                runs = [
+                    _in_fresh_process(
+                        run_cold, taxonomy, length_bucket, batch_size, corpus_path
+                    )
+                    for _ in range(cold_runs)
+                ]
+                result = {
+                    "taxonomy": taxonomy,
+                    "length_bucket": length_bucket,
+                    "batch_size": batch_size,
+                    "model": "cold",
+                    **summarise([first_call for _, first_call in runs], batch_size * cold_runs),
+                    "load_seconds": float(np.median([load for load, _ in runs])),
+                }
+                results.append(result)
+                print(format_result(result))
+        for result in _in_fresh_process(run_warm, taxonomy, batch_sizes, repeats, corpus_path):
+            results.append(result)
+            print(format_result(result))
+    return {
+        "run": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "library_version": LIBRARY_VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeats": repeats,
+            "cold_runs": cold_runs,
+        },
+        "results": results,
+    }
+
+
+def _key(result):
+    return (result["taxonomy"], result["length_bucket"], result["batch_size"], result["model"])
+
+
+def _ms(seconds):
+    return "n/a" if seconds is None else f"{seconds * 1000:.1f}"
+
+
+def format_result(result):
+    load = f", load {result['load_seconds']:.1f}s" if "load_seconds" in result else ""
+    return (
+        f"{result['taxonomy']} {result['length_bucket']} x{result['batch_size']} "
+        f"{result['model']}: p50 {_ms(result['p50'])} ms, "
+        f"p95 {_ms(result['p95'])} ms, p99 {_ms(result['p99'])} ms "
+        f"({result['calls']} calls), {result['adverts_per_second']:.1f} adverts/s{load}"
+    )
+
+
+def compare(baseline, results, tolerance=DEFAULT_TOLERANCE):
+    """(markdown report of results against baseline, [regressions])"""
+    baseline_results = {_key(result): result for result in baseline["results"]}
+    lines = [
+        f"Baseline: {baseline['run']['time']} (library {baseline['run']['library_version']}), "
+        f"results: {results['run']['time']} (library {results['run']['library_version']})",
+        "",
+        "| taxonomy | length | batch | model | calls | p50 ms | p95 ms | p99 ms "
+        "| adverts/s | change |",
+        "|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    regressions = []
+    for result in results["results"]:
+        before = baseline_results.get(_key(result))
+        change, metric = "", None
+        if before is not None:
+            # p95, or the median where there were too few calls for a p95
+            metric = next(
+                (m for m in ["p95", "p50"] if result[m] is not None and before[m] is not None),
+                None,
+            )
+        if metric is not None:
+            relative = result[metric] / before[metric] - 1
+            change = f"{metric} {relative:+.0%}"
+            if relative > tolerance:
+                change += " REGRESSION"
+                regressions.append(
+                    f"{' '.join(map(str, _key(result)))} {metric} {_ms(before[metric])} ms "
+                    f"-> {_ms(result[metric])} ms ({relative:+.0%})"
+                )
+        lines.append(
+            f"| {result['taxonomy']} | {result['length_bucket']} | {result['batch_size']} "
+            f"| {result['model']} | {result['calls']} | {_ms(result['p50'])} "
+            f"| {_ms(result['p95'])} | {_ms(result['p99'])} "
+            f"| {result['adverts_per_second']:.1f} | {change} |"
+        )
+    return "\n".join(lines) + "\n", regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--taxonomy", nargs="+", default=list(TAXONOMY_CONFIGS), choices=list(TAXONOMY_CONFIGS)
+    )
+    parser.add_argument("--batch_size", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument(
+        "--repeats", type=int, default=DEFAULT_REPEATS, help="Passes over the corpus per warm benchmark"
+    )
+    parser.add_argument(
+        "--cold_runs",
+        type=int,
+        default=DEFAULT_COLD_RUNS,
+        help="Fresh processes per cold benchmark (0 to skip cold benchmarks)",
+    )
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--output", default=None, help="json file to write the results to")
+    parser.add_argument(
+        "--generate_corpus", action="store_true", help="(Re)generate the corpus and exit"
+    )
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASELINE", "RESULTS"),
+        default=None,
+        help="Compare two result files instead of running",
+    )
+    parser.add_argument("--report", default=None, help="Markdown file for the --compare report")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.generate_corpus:
+        generate_corpus(args.corpus)
+        print(f"Corpus written to {args.corpus}")
+    elif args.compare:
+        with open(args.compare[0], "r") as file:
+            baseline = json.load(file)
+        with open(args.compare[1], "r") as file:
+            results = json.load(file)
+        report, regressions = compare(baseline, results, args.tolerance)
+        print(report)
+        if args.report:
+            with open(args.report, "w") as file:
+                file.write(report)
+        if regressions:
+            print("REGRESSIONS:\n" + "\n".join(regressions))
+            sys.exit(1)
+    else:
+        results = run(
+            args.taxonomy,
+            args.batch_size,
+            repeats=args.repeats,
+            cold_runs=args.cold_runs,
+            corpus_path=args.corpus,
+        )
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=2)
+            print(f"Results written to {args.output}")
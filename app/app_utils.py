@@ -0,0 +1,927 @@
+import concurrent.futures
+import contextlib
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from importlib import metadata
+
+import pandas as pd
+
+# Columns that usually hold the advert text in an uploaded file, in order of preference
+ADVERT_TEXT_COLUMNS = ["description", "job_description", "full_text", "text", "advert"]
+ADVERT_ID_COLUMNS = ["id", "job_id", "advert_id"]
+
+DEFAULT_BATCH_SIZE = 32
+
+# Abbreviations whose full stop doesn't end a sentence
+ABBREVIATIONS = (
+    "e.g. eg. i.e. ie. etc. approx. incl. vs. inc. ltd. dr. mr. mrs. ms. no."
+).split()
+# Sentence boundaries in normalised advert text; line breaks are already "." by then
+SENTENCE_BOUNDARY = re.compile(
+    r"(?<=[.!?])"
+    + "".join(rf"(?<!\b{re.escape(abbreviation)})" for abbreviation in ABBREVIATIONS)
+    + r"\s+",
+    re.IGNORECASE,
+)
+
+EXTRACTION_CACHE_DIR = os.environ.get(
+    "SKILLS_EXTRACTOR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".extraction_cache"),
+)
+EXTRACTION_CACHE_MEMORY_ITEMS = 2048
+EXTRACTION_CACHE_DISK_BYTES = 512 * 1024 * 1024
+
+# Raw skill phrase to taxonomy skill mappings, shared by the app and any workers
+PHRASE_CACHE_PATH = os.path.join(EXTRACTION_CACHE_DIR, "phrase_mappings.sqlite3")
+PHRASE_CACHE_MEMORY_ITEMS = 20000
+PHRASE_CACHE_DISK_ITEMS = 500000
+
+# Extractor config for each taxonomy offered in the app
+TAXONOMY_CONFIGS = {
+    "ESCO": "extract_skills_esco",
+    "Lightcast": "extract_skills_lightcast",
+}
+
+# Extraction worker processes; 0 runs extraction in the streamlit script thread
+EXTRACTION_WORKERS = int(os.environ.get("SKILLS_EXTRACTOR_WORKERS", 0))
+# Requests allowed to wait for a free worker before new ones are turned away
+EXTRACTION_MAX_QUEUED = int(os.environ.get("SKILLS_EXTRACTOR_MAX_QUEUED", 16))
+EXTRACTION_TIMEOUT = float(os.environ.get("SKILLS_EXTRACTOR_TIMEOUT", 120))
+
+try:
+    LIBRARY_VERSION = metadata.version("ojd-daps-skills")
+except metadata.PackageNotFoundError:
+    LIBRARY_VERSION = "unknown"
+
+
+def clean_advert_text(txt):
+    """Light cleaning applied to every advert before extraction"""
+    return txt.replace("\n", ". ")
+
+
+def read_adverts(uploaded_file):
+    """DataFrame of job adverts from an uploaded csv or jsonl file"""
+    if uploaded_file.name.endswith(".csv"):
+        return pd.read_csv(uploaded_file)
+    elif uploaded_file.name.endswith((".jsonl", ".json")):
+        return pd.read_json(uploaded_file, lines=True)
+    else:
+        raise ValueError(
+            f'{uploaded_file.name} has wrong file extension! Only supports "*.csv" or "*.jsonl"'
+        )
+
+
+def guess_column(adverts, candidates, default=0):
+    """Index of the first candidate column in adverts (default if none match)"""
+    columns = [str(column).lower() for column in adverts.columns]
+    for candidate in candidates:
+        if candidate in columns:
+            return columns.index(candidate)
+    return default
+
+
+def load_extract_skills(config_name):
+    """A loaded ExtractSkills for config_name"""
+    # Imported here so the app can render while the library is imported
+    from ojd_daps_skills.pipeline.extract_skills.extract_skills import ExtractSkills
+
+    es = ExtractSkills(config_name=config_name, local=True)
+    es.load()
+    return es
+
+
+class ModelRegistry:
+    """One resident, loaded ExtractSkills per taxonomy, shared by all sessions.
+
+    start() loads every taxonomy in its own background thread, so no session
+    waits on a cold model load; get() returns None until a model is ready.
+    """
+
+    LOADING, READY, FAILED = "loading", "ready", "failed"
+
+    def __init__(self, taxonomy_configs=TAXONOMY_CONFIGS, load_model=load_extract_skills):
+        self.taxonomy_configs = taxonomy_configs
+        self._load_model = load_model
+        self._lock = threading.Lock()
+        self._started = False
+        self._models = {}
+        self._ready = {taxonomy: threading.Event() for taxonomy in taxonomy_configs}
+        self._status = {taxonomy: self.LOADING for taxonomy in taxonomy_configs}
+        self._errors = {}
+        self._load_started = {}
+        self._load_seconds = {}
+
+    def start(self):
+        """Start loading every taxonomy's model (only the first call does anything)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for taxonomy in self.taxonomy_configs:
+            threading.Thread(
+                target=self._load, args=(taxonomy,), name=f"load-{taxonomy}", daemon=True
+            ).start()
+
+    def _load(self, taxonomy):
+        self._load_started[taxonomy] = time.perf_counter()
+        try:
+            model = self._load_model(self.taxonomy_configs[taxonomy])
+        except Exception as e:
+            with self._lock:
+                self._status[taxonomy] = self.FAILED
+                self._errors[taxonomy] = repr(e)
+        else:
+            with self._lock:
+                self._models[taxonomy] = model
+                self._status[taxonomy] = self.READY
+        finally:
+            self._load_seconds[taxonomy] = (
+                time.perf_counter() - self._load_started[taxonomy]
+            )
+            self._ready[taxonomy].set()
+
+    def status(self, taxonomy):
+        return self._status[taxonomy]
+
+    def get(self, taxonomy, timeout=0):
+        """The loaded model, waiting up to timeout seconds (None: wait for
+        as long as loading takes); None if it isn't ready by then"""
+        self._ready[taxonomy].wait(timeout)
+        return self._models.get(taxonomy)
+
+    def stats(self):
+        """{taxonomy: {"status", "load_seconds" (so far, if loading), "error"}}"""
+        now = time.perf_counter()
+        stats = {}
+        for taxonomy in self.taxonomy_configs:
+            load_seconds = self._load_seconds.get(taxonomy)
+            if load_seconds is None and taxonomy in self._load_started:
+                load_seconds = now - self._load_started[taxonomy]
+            stats[taxonomy] = {
+                "status": self._status[taxonomy],
+                "load_seconds": load_seconds,
+                "error": self._errors.get(taxonomy),
+            }
+        return stats
+
+
+MODEL_REGISTRY = ModelRegistry()
+
+
+class ExtractionQueueFull(RuntimeError):
+    """Raised when the extraction queue has no room for another request"""
+
+
+class ExtractionTimeout(RuntimeError):
+    """Raised when an extraction request doesn't finish in time"""
+
+
+# ExtractSkills instances of a worker process, by config name
+_worker_models = {}
+
+
+def _init_worker(config_names):
+    for config_name in config_names:
+        _worker_models[config_name] = load_extract_skills(config_name)
+
+
+def _worker_model(config_name):
+    if config_name not in _worker_models:
+        _worker_models[config_name] = load_extract_skills(config_name)
+    return _worker_models[config_name]
+
+
+def _worker_extract_skills(config_name, job_adverts):
+    return extract_and_map_skills(_worker_model(config_name), job_adverts)
+
+
+def _worker_map_to_taxonomies(taxonomy_configs, job_adverts):
+    extractors = {
+        taxonomy: _worker_model(config_name)
+        for taxonomy, config_name in taxonomy_configs.items()
+    }
+    return map_to_taxonomies(extractors, job_adverts)
+
+
+class ExtractionPool:
+    """Runs extract_skills in worker processes that each hold their own loaded
+    ExtractSkills for every taxonomy, so extraction uses all cores and
+    the streamlit server threads stay free.
+
+    At most max_workers requests run and max_queued wait; further requests
+    raise ExtractionQueueFull straight away (backpressure).
+    """
+
+    def __init__(
+        self,
+        max_workers=EXTRACTION_WORKERS,
+        max_queued=EXTRACTION_MAX_QUEUED,
+        taxonomy_configs=TAXONOMY_CONFIGS,
+    ):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.taxonomy_configs = taxonomy_configs
+        self._lock = threading.Lock()
+        self._executor = None
+        self._tickets = itertools.count()
+        self._pending = OrderedDict()  # ticket: future, in submission order
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def start(self):
+        """Start the worker processes, which load the models as they start"""
+        with self._lock:
+            if self._executor is not None:
+                return
+            # spawn rather than fork: the streamlit server process runs threads
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(list(self.taxonomy_configs.values()),),
+            )
+        # The executor only starts processes as work arrives
+        for _ in range(self.max_workers):
+            self._executor.submit(len, ())
+
+    def shutdown(self):
+        """Stop the worker processes, cancelling requests that haven't
+        started and waiting for those that have. A later request starts the
+        pool again."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._pending.clear()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _done(self, ticket):
+        with self._lock:
+            if self._pending.pop(ticket, None) is not None:
+                self.completed += 1
+
+    def submit(self, fn, *args):
+        """(ticket, future) for running fn(*args) in a worker"""
+        self.start()
+        with self._lock:
+            if len(self._pending) >= self.max_workers + self.max_queued:
+                self.rejected += 1
+                raise ExtractionQueueFull(
+                    f"{len(self._pending)} extraction requests are already queued"
+                )
+            ticket = next(self._tickets)
+            future = self._executor.submit(fn, *args)
+            self._pending[ticket] = future
+        future.add_done_callback(lambda _: self._done(ticket))
+        return ticket, future
+
+    def queue_position(self, ticket):
+        """Requests waiting ahead of ticket; 0 once it is running (or done)"""
+        with self._lock:
+            if ticket not in self._pending:
+                return 0
+            ahead = list(self._pending).index(ticket)
+        return max(0, ahead - self.max_workers + 1)
+
+    def result(self, ticket, future, timeout=EXTRACTION_TIMEOUT, on_wait=None):
+        """future's result, waiting at most timeout seconds (None: for as long
+        as it takes). on_wait(queue position, seconds waited) is called while
+        waiting."""
+        start_time = time.perf_counter()
+        while True:
+            try:
+                result = future.result(timeout=0.25)
+            except concurrent.futures.TimeoutError:
+                waited = time.perf_counter() - start_time
+                if timeout is not None and waited >= timeout:
+                    future.cancel()
+                    with self._lock:
+                        self.timeouts += 1
+                    raise ExtractionTimeout(
+                        f"Extraction did not finish within {timeout:.0f}s"
+                    )
+                if on_wait is not None:
+                    on_wait(self.queue_position(ticket), waited)
+            else:
+                # Freed here too: the done callback can run after the caller
+                # has the result and submits its next request
+                self._done(ticket)
+                return result
+
+    def extract(self, taxonomy, job_adverts, **kwargs):
+        """Extracted skills for job_adverts with taxonomy's model"""
+        ticket, future = self.submit(
+            _worker_extract_skills, self.taxonomy_configs[taxonomy], job_adverts
+        )
+        return self.result(ticket, future, **kwargs)
+
+    def map_to_taxonomies(self, taxonomies, job_adverts, **kwargs):
+        """map_to_taxonomies in one worker, with its own models for taxonomies"""
+        taxonomy_configs = {
+            taxonomy: self.taxonomy_configs[taxonomy] for taxonomy in taxonomies
+        }
+        ticket, future = self.submit(
+            _worker_map_to_taxonomies, taxonomy_configs, job_adverts
+        )
+        return self.result(ticket, future, **kwargs)
+
+    def extractor(self, taxonomy, on_wait=None):
+        return PooledExtractor(self, taxonomy, on_wait)
+
+    def stats(self):
+        with self._lock:
+            running = min(len(self._pending), self.max_workers)
+            return {
+                "workers": self.max_workers,
+                "running": running,
+                "queued": len(self._pending) - running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+
+
+class PooledExtractor:
+    """Stands in for an ExtractSkills instance; extract_skills runs in the pool"""
+
+    def __init__(self, pool, taxonomy, on_wait=None):
+        self.pool = pool
+        self.taxonomy = taxonomy
+        # Used for cache keys, so pooled and in-process results don't mix
+        self.taxonomy_name = pool.taxonomy_configs[taxonomy]
+        self.on_wait = on_wait
+
+    def extract_skills(self, job_adverts):
+        if isinstance(job_adverts, str):
+            job_adverts = [job_adverts]
+        return self.pool.extract(self.taxonomy, job_adverts, on_wait=self.on_wait)
+
+
+EXTRACTION_POOL = ExtractionPool() if EXTRACTION_WORKERS > 0 else None
+
+
+def normalise_advert_text(txt):
+    """Cleaned advert text with whitespace collapsed; what is hashed and extracted"""
+    if not isinstance(txt, str):
+        return ""
+    return " ".join(clean_advert_text(txt).split())
+
+
+def _restore_tuples(extracted_skills):
+    """Json turns the library's (skill, (taxonomy skill, id)) tuples into lists"""
+    if "SKILL" in extracted_skills:
+        extracted_skills = dict(extracted_skills)
+        extracted_skills["SKILL"] = [
+            (skill, tuple(match)) for skill, match in extracted_skills["SKILL"]
+        ]
+    return extracted_skills
+
+
+class ExtractionCache:
+    """Content-addressed cache of extract_skills results for single adverts.
+
+    Results are keyed on a hash of (normalised advert text, taxonomy, library
+    version), held in an in-memory LRU and in a size-bounded directory of
+    json files that survives restarts (least recently used files are removed
+    first once max_disk_bytes is exceeded).
+    """
+
+    def __init__(
+        self,
+        cache_dir=EXTRACTION_CACHE_DIR,
+        max_memory_items=EXTRACTION_CACHE_MEMORY_ITEMS,
+        max_disk_bytes=EXTRACTION_CACHE_DISK_BYTES,
+    ):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk_files = None  # {key: size}, oldest first; scanned lazily
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def key(normalised_text, taxonomy_name, library_version=LIBRARY_VERSION):
+        content = json.dumps([normalised_text, taxonomy_name, library_version])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _scan_disk(self):
+        self._disk_files = OrderedDict()
+        if os.path.isdir(self.cache_dir):
+            entries = []
+            for root, _, file_names in os.walk(self.cache_dir):
+                for file_name in file_names:
+                    if file_name.endswith(".json"):
+                        stat = os.stat(os.path.join(root, file_name))
+                        entries.append((stat.st_mtime, file_name[:-5], stat.st_size))
+            for _, key, size in sorted(entries):
+                self._disk_files[key] = size
+        self._disk_bytes = sum(self._disk_files.values())
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+            if self._disk_files is None:
+                self._scan_disk()
+            if key in self._disk_files:
+                try:
+                    with open(self._path(key), "r") as file:
+                        value = _restore_tuples(json.load(file))
+                    os.utime(self._path(key))
+                    self._disk_files.move_to_end(key)
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                    return value
+                except (OSError, ValueError):
+                    self._disk_bytes -= self._disk_files.pop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        data = json.dumps(value)
+        with self._lock:
+            self._remember(key, value)
+            if self._disk_files is None:
+                self._scan_disk()
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w") as file:
+                    file.write(data)
+                os.replace(tmp_path, path)
+            except OSError:
+                # The disk tier is best effort; the memory tier still holds the result
+                return
+            self._disk_bytes += len(data) - self._disk_files.pop(key, 0)
+            self._disk_files[key] = len(data)
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk_files) > 1:
+                old_key, size = self._disk_files.popitem(last=False)
+                self._disk_bytes -= size
+                self.disk_evictions += 1
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups
+                if lookups
+                else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": len(self._disk_files or {}),
+                "disk_bytes": self._disk_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
+
+
+EXTRACTION_CACHE = ExtractionCache()
+
+
+class PhraseMappingCache:
+    """Cache of raw skill phrase -> (clean skill, taxonomy skill, taxonomy id)
+    for each taxonomy, so only phrases that haven't been seen before are
+    embedded and matched against the taxonomy. Skill and multiskill phrases
+    are cached separately.
+
+    Mappings are held in an in-memory LRU in front of a sqlite table that
+    survives restarts and is shared by every process using the same path
+    (the app and the extraction pool workers). The table keeps at most
+    max_disk_items phrases, dropping the least recently used first. Hit
+    counts are kept in the table too, so stats() covers every process.
+    A phrase that didn't map to the taxonomy is cached as None.
+    """
+
+    def __init__(
+        self,
+        path=PHRASE_CACHE_PATH,
+        max_memory_items=PHRASE_CACHE_MEMORY_ITEMS,
+        max_disk_items=PHRASE_CACHE_DISK_ITEMS,
+    ):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        # map_skills keeps per call state on the model, so one call per taxonomy at a time
+        self._model_locks = {}
+        self._db_ready = False
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def taxonomy_key(taxonomy_name, library_version=LIBRARY_VERSION):
+        return f"{taxonomy_name}@{library_version}"
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """A connection to the table, committed (or rolled back) and closed on exit"""
+        if not self._db_ready:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with contextlib.closing(sqlite3.connect(self.path, timeout=30)) as connection:
+            with connection:
+                if not self._db_ready:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute(
+                        """CREATE TABLE IF NOT EXISTS phrases (
+                            taxonomy TEXT, phrase TEXT, mapping TEXT, last_used REAL,
+                            PRIMARY KEY (taxonomy, phrase))"""
+                    )
+                    connection.execute(
+                        "CREATE INDEX IF NOT EXISTS phrases_last_used ON phrases (last_used)"
+                    )
+                    connection.execute(
+                        "CREATE TABLE IF NOT EXISTS counts (name TEXT PRIMARY KEY, value INTEGER)"
+                    )
+                    self._db_ready = True
+                yield connection
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, taxonomy, phrases):
+        """{phrase: mapping} for the phrases found in the memory or disk tiers"""
+        found = {}
+        with self._lock:
+            for phrase in phrases:
+                if (taxonomy, phrase) in self._memory:
+                    self._memory.move_to_end((taxonomy, phrase))
+                    found[phrase] = self._memory[(taxonomy, phrase)]
+        memory_hits = len(found)
+        on_disk = [phrase for phrase in phrases if phrase not in found]
+        if on_disk:
+            try:
+                with self._transaction() as connection:
+                    for start in range(0, len(on_disk), 500):
+                        chunk = on_disk[start : start + 500]
+                        rows = connection.execute(
+                            "SELECT phrase, mapping FROM phrases WHERE taxonomy = ? "
+                            f"AND phrase IN ({','.join('?' * len(chunk))})",
+                            [taxonomy, *chunk],
+                        ).fetchall()
+                        for phrase, mapping in rows:
+                            mapping = json.loads(mapping)
+                            found[phrase] = tuple(mapping) if mapping else None
+                    connection.executemany(
+                        "UPDATE phrases SET last_used = ? WHERE taxonomy = ? AND phrase = ?",
+                        [
+                            (time.time(), taxonomy, phrase)
+                            for phrase in on_disk
+                            if phrase in found
+                        ],
+                    )
+            except (sqlite3.Error, OSError):
+                # The disk tier is best effort; misses are mapped again
+                pass
+        with self._lock:
+            for phrase in on_disk:
+                if phrase in found:
+                    self._remember((taxonomy, phrase), found[phrase])
+            self.memory_hits += memory_hits
+            self.disk_hits += len(found) - memory_hits
+            self.misses += len(phrases) - len(found)
+        return found
+
+    def _store(self, taxonomy, mappings, counts):
+        with self._lock:
+            for phrase, mapping in mappings.items():
+                self._remember((taxonomy, phrase), mapping)
+        try:
+            with self._transaction() as connection:
+                now = time.time()
+                connection.executemany(
+                    "INSERT OR REPLACE INTO phrases VALUES (?, ?, ?, ?)",
+                    [
+                        (taxonomy, phrase, json.dumps(mapping), now)
+                        for phrase, mapping in mappings.items()
+                    ],
+                )
+                for name, value in counts.items():
+                    connection.execute(
+                        "INSERT INTO counts VALUES (?, ?) "
+                        "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                        (name, value),
+                    )
+                (num_phrases,) = connection.execute(
+                    "SELECT COUNT(*) FROM phrases"
+                ).fetchone()
+                if num_phrases > self.max_disk_items:
+                    # Trim a further 10% so this doesn't happen on every store
+                    connection.execute(
+                        "DELETE FROM phrases WHERE rowid IN (SELECT rowid FROM phrases "
+                        "ORDER BY last_used LIMIT ?)",
+                        (num_phrases - int(self.max_disk_items * 0.9),),
+                    )
+        except (sqlite3.Error, OSError):
+            pass
+
+    def _map_phrases(self, es, phrases, kind):
+        """[(clean skill, taxonomy skill, taxonomy id) or None] for phrases of
+        kind ("SKILL" or "MULTISKILL"), mapped by es. Each phrase is passed as
+        its own advert so the results line up with the phrases."""
+        with self._lock:
+            model_lock = self._model_locks.setdefault(es.taxonomy_name, threading.Lock())
+        with model_lock:
+            mapped_skills = es.map_skills(
+                [
+                    {"SKILL": [], "MULTISKILL": [], "EXPERIENCE": [], kind: [phrase]}
+                    for phrase in phrases
+                ]
+            )
+        mappings = []
+        for advert_skills in mapped_skills:
+            if advert_skills.get("SKILL"):
+                clean_skill, (match_skill, match_id) = advert_skills["SKILL"][0]
+                mappings.append((clean_skill, match_skill, match_id))
+            else:
+                mappings.append(None)
+        return mappings
+
+    def map_phrases(self, es, phrases, kind="SKILL"):
+        """{phrase: (clean skill, taxonomy skill, taxonomy id) or None} for
+        every phrase of kind, running es's mapping on cache misses only"""
+        taxonomy = self.taxonomy_key(es.taxonomy_name)
+        if kind != "SKILL":
+            # The library may map a multiskill differently to the same skill phrase
+            taxonomy = f"{taxonomy}/{kind}"
+        phrases = list(dict.fromkeys(phrases))
+        if not phrases:
+            return {}
+        found = self._lookup(taxonomy, phrases)
+        misses = [phrase for phrase in phrases if phrase not in found]
+        new_mappings = {}
+        if misses:
+            new_mappings = dict(zip(misses, self._map_phrases(es, misses, kind)))
+            found.update(new_mappings)
+        self._store(
+            taxonomy,
+            new_mappings,
+            {"hits": len(phrases) - len(misses), "misses": len(misses)},
+        )
+        return found
+
+    def map_skills(self, es, predicted_skills):
+        """es.map_skills(predicted_skills) through the cache. Like the
+        library, each advert's skills and multiskills are mapped together,
+        with repeated clean skills kept once, and an advert with no mapped
+        skills gives {}."""
+        mappings = {
+            kind: self.map_phrases(
+                es,
+                [phrase for skills in predicted_skills for phrase in skills.get(kind, [])],
+                kind,
+            )
+            for kind in ("SKILL", "MULTISKILL")
+        }
+        mapped_skills = []
+        for skills in predicted_skills:
+            advert_skills, seen = [], set()
+            for kind in ("SKILL", "MULTISKILL"):
+                for phrase in skills.get(kind, []):
+                    mapping = mappings[kind][phrase]
+                    if mapping is None or mapping[0] in seen:
+                        continue
+                    seen.add(mapping[0])
+                    advert_skills.append((mapping[0], (mapping[1], mapping[2])))
+            if advert_skills:
+                mapped_skills.append(
+                    {
+                        k: v
+                        for k, v in [
+                            ("SKILL", advert_skills),
+                            ("EXPERIENCE", skills.get("EXPERIENCE", [])),
+                        ]
+                        if v
+                    }
+                )
+            else:
+                mapped_skills.append({})
+        return mapped_skills
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            stats = {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups
+                if lookups
+                else 0.0,
+                "memory_items": len(self._memory),
+            }
+        # Totals over every process sharing the table, since it was created
+        try:
+            with self._transaction() as connection:
+                counts = dict(connection.execute("SELECT name, value FROM counts"))
+                (stats["disk_items"],) = connection.execute(
+                    "SELECT COUNT(*) FROM phrases"
+                ).fetchone()
+        except (sqlite3.Error, OSError):
+            counts = {}
+        total_lookups = counts.get("hits", 0) + counts.get("misses", 0)
+        stats["total_hit_rate"] = (
+            counts.get("hits", 0) / total_lookups if total_lookups else 0.0
+        )
+        return stats
+
+
+PHRASE_CACHE = PhraseMappingCache()
+
+
+def extract_and_map_skills(es, job_adverts, phrase_cache=PHRASE_CACHE):
+    """es.extract_skills(job_adverts), with the skill spans found by
+    es.get_skills and mapped to the taxonomy through the phrase cache"""
+    if isinstance(es, PooledExtractor):
+        # The worker runs this with its own model
+        return es.extract_skills(job_adverts)
+    if not job_adverts:
+        return []
+    return phrase_cache.map_skills(es, es.get_skills(job_adverts))
+
+
+def cached_extract_skills(es, texts, cache=EXTRACTION_CACHE):
+    """es.extract_skills for a list of adverts, only extracting adverts whose
+    (normalised text, taxonomy) isn't already in the cache"""
+    normalised_texts = [normalise_advert_text(txt) for txt in texts]
+    keys = [cache.key(txt, es.taxonomy_name) for txt in normalised_texts]
+    results = [cache.get(key) for key in keys]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        extracted_skills = extract_and_map_skills(
+            es, [normalised_texts[i] for i in misses]
+        )
+        for i, advert_skills in zip(misses, extracted_skills):
+            cache.put(keys[i], advert_skills)
+            results[i] = advert_skills
+    return results
+
+
+def map_to_taxonomies(extractors, job_adverts, phrase_cache=PHRASE_CACHE):
+    """{taxonomy: extracted skills for each advert} for every
+    {taxonomy: ExtractSkills} in extractors.
+
+    The skill spans are found once, with the first extractor's NER model
+    (the ESCO and Lightcast configs share the same one), and then mapped to
+    each taxonomy through the phrase cache in its own thread; the mapping is
+    mostly numpy/torch work that releases the GIL. This is what
+    extract_skills does for one taxonomy, so the results are the same as
+    extracting with each model.
+    """
+    first_extractor = next(iter(extractors.values()))
+    if isinstance(first_extractor, PooledExtractor):
+        return first_extractor.pool.map_to_taxonomies(
+            list(extractors), job_adverts, on_wait=first_extractor.on_wait
+        )
+    if not job_adverts:
+        return {taxonomy: [] for taxonomy in extractors}
+
+    predicted_skills = first_extractor.get_skills(job_adverts)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(extractors)) as executor:
+        futures = {
+            taxonomy: executor.submit(phrase_cache.map_skills, es, predicted_skills)
+            for taxonomy, es in extractors.items()
+        }
+        return {taxonomy: future.result() for taxonomy, future in futures.items()}
+
+
+def cached_map_to_taxonomies(extractors, texts, cache=EXTRACTION_CACHE):
+    """[{taxonomy: extracted skills} for each advert] via map_to_taxonomies,
+    only extracting adverts missing from the cache for any taxonomy. Shares
+    the cache with cached_extract_skills."""
+    normalised_texts = [normalise_advert_text(txt) for txt in texts]
+    keys = {
+        taxonomy: [cache.key(txt, es.taxonomy_name) for txt in normalised_texts]
+        for taxonomy, es in extractors.items()
+    }
+    results = [
+        {taxonomy: cache.get(keys[taxonomy][i]) for taxonomy in extractors}
+        for i in range(len(texts))
+    ]
+    misses = [i for i, result in enumerate(results) if None in result.values()]
+    if misses:
+        mapped_skills = map_to_taxonomies(
+            extractors, [normalised_texts[i] for i in misses]
+        )
+        for taxonomy, extracted_skills in mapped_skills.items():
+            for i, advert_skills in zip(misses, extracted_skills):
+                if results[i][taxonomy] is None:
+                    cache.put(keys[taxonomy][i], advert_skills)
+                    results[i][taxonomy] = advert_skills
+    return results
+
+
+def split_sentences(txt):
+    """The sentences of an advert's normalised text. Each ends in exactly one
+    punctuation mark, so a sentence has the same cache key wherever it is."""
+    sentences = []
+    for sentence in SENTENCE_BOUNDARY.split(normalise_advert_text(txt)):
+        sentence = sentence.rstrip(" .")
+        if sentence:
+            sentences.append(sentence if sentence[-1] in "!?" else sentence + ".")
+    return sentences
+
+
+def merge_sentence_skills(sentence_skills):
+    """One advert's extracted skills from those of its sentences, in sentence
+    order. As when the whole advert is extracted (see map_skills), a clean
+    skill found in several sentences is kept once, with its first taxonomy
+    match, and so is any repeated experience entry."""
+    merged, seen = {}, {}
+    for skills in sentence_skills:
+        for key, values in skills.items():
+            merged_values = merged.setdefault(key, [])
+            seen_values = seen.setdefault(key, set())
+            for value in values:
+                value_key = value[0] if key == "SKILL" else value
+                if isinstance(value_key, list):
+                    value_key = tuple(value_key)
+                if value_key in seen_values:
+                    continue
+                seen_values.add(value_key)
+                merged_values.append(value)
+    return merged
+
+
+def extract_skills_by_sentence(
+    es, txt, extract=cached_extract_skills, cache=EXTRACTION_CACHE
+):
+    """Extracted skills for one advert, like extract(es, [txt]), found sentence
+    by sentence through the cache. When an advert is edited and resubmitted
+    only its new or changed sentences go through the model. The library gives
+    {} for text with no mapped skills, so experience mentioned in a sentence
+    without one is not kept.
+
+    extract is cached_extract_skills, or cached_map_to_taxonomies with a dict
+    of extractors.
+    """
+    sentences = split_sentences(txt)
+    unique_sentences = list(dict.fromkeys(sentences))
+    sentence_skills = dict(
+        zip(unique_sentences, extract(es, unique_sentences, cache=cache))
+    )
+    if extract is cached_map_to_taxonomies:
+        return [
+            {
+                taxonomy: merge_sentence_skills(
+                    sentence_skills[sentence][taxonomy] for sentence in sentences
+                )
+                for taxonomy in es
+            }
+        ]
+    return [merge_sentence_skills(sentence_skills[sentence] for sentence in sentences)]
+
+
+def extract_skills_in_batches(
+    es, texts, batch_size=DEFAULT_BATCH_SIZE, extract=cached_extract_skills
+):
+    """Run extract(es, batch) over texts in batches of batch_size adverts
+    (cached_extract_skills, or cached_map_to_taxonomies with a dict of
+    extractors). Yields (number of adverts done so far, extracted skills for
+    the batch)"""
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start : start + batch_size]
+        yield start + len(batch), extract(es, batch)
+
+
+def extracted_skills_to_json(advert_id, extracted_skills):
+    """One json line per advert; tuples in the library output become lists"""
+    return json.dumps({"id": advert_id, **extracted_skills}, default=str) + "\n"
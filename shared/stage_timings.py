@@ -0,0 +1,245 @@
+"""Per-rerun stage timings and cache hits of a streamlit script, kept in an in-process ring buffer.
+
+    DASHBOARD_TIMING=1 streamlit run streamlit_viz/streamlit_viz.py
+    SKILLS_EXTRACTOR_TIMING=1 streamlit run app/app.py
+
+Shared by the dashboard and the app, which each get their timings with
+timings_for(env prefix): timing is switched on by <prefix>_TIMING=1 and the
+last <prefix>_TIMING_BUFFER records are kept. The scripts wrap their slow
+steps (data loaders, chart builders and the occupation network rendering;
+model loading and skill extraction) with TIMINGS.timed or TIMINGS.stage.
+Each time one runs a record is kept of the rerun it belongs to, the stage,
+how long it took and how many cache hits it had. With timing off, timed()
+returns the function undecorated and stage() a shared no-op context
+manager, so the wrapping costs nothing.
+
+The records can be exported as JSON lines (one per stage run) and the
+cumulative counts as Prometheus text, alongside the caches' stats. Both can
+be downloaded from the admin panel, shown in the sidebar when the page is
+opened with ?timing in its url.
+"""
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+TIMING_BUFFER_SIZE = 5000
+PANEL_QUERY_PARAM = "timing"
+
+_NO_TIMING = contextlib.nullcontext()
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class StageTimings:
+    """Durations and cache hits of the stages of each rerun, the last
+    max_records of them. Counts per stage are also kept in full, for the
+    Prometheus export."""
+
+    def __init__(self, enabled, max_records=TIMING_BUFFER_SIZE, metric_prefix="streamlit"):
+        self.enabled = enabled
+        self.metric_prefix = metric_prefix
+        self._lock = threading.Lock()
+        self._records = collections.deque(maxlen=max_records)
+        # stage: [runs, seconds, cache hits]
+        self._totals = {}
+        self._caches = {}
+        self._reruns = 0
+        # Streamlit runs each session's script in its own thread
+        self._local = threading.local()
+
+    def add_cache(self, name, stats):
+        """Export stats(), a dict of numbers, as the stats of cache name"""
+        self._caches[name] = stats
+
+    def cache_stats(self):
+        return {name: stats() for name, stats in self._caches.items()}
+
+    def start_rerun(self):
+        """Mark the start of a rerun of the script in the calling thread"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._reruns += 1
+            self._local.rerun = self._reruns
+
+    def current_rerun(self):
+        return getattr(self._local, "rerun", 0)
+
+    def record(self, stage, seconds, cache_hits=0):
+        record = {
+            "time": time.time(),
+            "rerun": self.current_rerun(),
+            "stage": stage,
+            "seconds": seconds,
+            "cache_hits": cache_hits,
+        }
+        with self._lock:
+            self._records.append(record)
+            totals = self._totals.setdefault(stage, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += cache_hits
+
+    @contextlib.contextmanager
+    def _stage(self, name, cache):
+        hits_before = cache.hits if cache is not None else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            cache_hits = cache.hits - hits_before if cache is not None else 0
+            self.record(name, seconds, cache_hits)
+
+    def stage(self, name, cache=None):
+        """Context manager timing its block as stage name. The hits of cache
+        (anything with a hits count) during the block are recorded too; hits
+        from other sessions' overlapping reruns are counted with them."""
+        if not self.enabled:
+            return _NO_TIMING
+        return self._stage(name, cache)
+
+    def timed(self, stage=None, cache=None):
+        """Decorator timing each call of a function as stage (by default the
+        function's name), see stage()"""
+
+        def decorator(fn):
+            if not self.enabled:
+                return fn
+            name = stage or fn.__name__
+
+            @functools.wraps(fn)
+            def timed_fn(*args, **kwargs):
+                with self._stage(name, cache):
+                    return fn(*args, **kwargs)
+
+            return timed_fn
+
+        return decorator
+
+    def records(self, rerun=None):
+        """The buffered records, only those of rerun if given"""
+        with self._lock:
+            records = list(self._records)
+        if rerun is None:
+            return records
+        return [record for record in records if record["rerun"] == rerun]
+
+    def summary(self):
+        """[{stage, runs, p50/p95/max seconds, cache hits}] over the buffered records"""
+        stages = {}
+        for record in self.records():
+            stages.setdefault(record["stage"], []).append(record)
+        summary = []
+        for stage, records in sorted(stages.items()):
+            seconds = sorted(record["seconds"] for record in records)
+            summary.append(
+                {
+                    "stage": stage,
+                    "runs": len(records),
+                    "p50_seconds": _percentile(seconds, 0.5),
+                    "p95_seconds": _percentile(seconds, 0.95),
+                    "max_seconds": seconds[-1],
+                    "cache_hits": sum(record["cache_hits"] for record in records),
+                }
+            )
+        return summary
+
+    def to_json_lines(self):
+        return "".join(json.dumps(record) + "\n" for record in self.records())
+
+    def to_prometheus(self):
+        """Prometheus text exposition of the stage counts and the caches' stats"""
+        prefix = self.metric_prefix
+        with self._lock:
+            totals = sorted((stage, list(counts)) for stage, counts in self._totals.items())
+            reruns = self._reruns
+        lines = [
+            f"# HELP {prefix}_reruns_total Reruns of the script",
+            f"# TYPE {prefix}_reruns_total counter",
+            f"{prefix}_reruns_total {reruns}",
+            f"# HELP {prefix}_stage_seconds Time spent in each stage",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, (runs, seconds, _) in totals:
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {runs}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {seconds:.6f}')
+        lines += [
+            f"# HELP {prefix}_stage_cache_hits_total Cache hits during each stage",
+            f"# TYPE {prefix}_stage_cache_hits_total counter",
+        ]
+        for stage, (_, _, cache_hits) in totals:
+            lines.append(f'{prefix}_stage_cache_hits_total{{stage="{stage}"}} {cache_hits}')
+        lines += [
+            f"# HELP {prefix}_cache Stats of each cache",
+            f"# TYPE {prefix}_cache gauge",
+        ]
+        for name, stats in sorted(self.cache_stats().items()):
+            for stat, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'{prefix}_cache{{cache="{name}",stat="{stat}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+# env prefix: StageTimings, one per process however often the script reruns
+_timings = {}
+_timings_lock = threading.Lock()
+
+
+def timings_for(env_prefix):
+    """The StageTimings of a script, switched on by <env_prefix>_TIMING=1 and
+    keeping the last <env_prefix>_TIMING_BUFFER records. Its metrics are
+    named after the prefix in lower case."""
+    with _timings_lock:
+        if env_prefix not in _timings:
+            _timings[env_prefix] = StageTimings(
+                enabled=os.environ.get(f"{env_prefix}_TIMING", "0") == "1",
+                max_records=int(
+                    os.environ.get(f"{env_prefix}_TIMING_BUFFER", TIMING_BUFFER_SIZE)
+                ),
+                metric_prefix=env_prefix.lower(),
+            )
+        return _timings[env_prefix]
+
+
+def show_timing_panel(timings):
+    """Admin panel in the sidebar with this rerun's stages, a summary of the
+    buffered records, the caches' stats and the exports. Shown only when
+    timing is enabled and the page url has ?timing."""
+    if not timings.enabled:
+        return
+    import streamlit as st
+
+    if PANEL_QUERY_PARAM not in st.experimental_get_query_params():
+        return
+    with st.sidebar.expander("⏱️ Timings", expanded=True):
+        st.caption("This rerun")
+        st.table(
+            [
+                {"stage": r["stage"], "seconds": r["seconds"], "cache_hits": r["cache_hits"]}
+                for r in timings.records(timings.current_rerun())
+            ]
+        )
+        st.caption(f"Last {len(timings.records())} stage runs")
+        st.table(timings.summary())
+        for name, stats in timings.cache_stats().items():
+            st.caption(f"{name} cache")
+            st.json(stats)
+        st.download_button(
+            "⬇️ Records (jsonl)",
+            timings.to_json_lines(),
+            file_name=f"{timings.metric_prefix}_timings.jsonl",
+            mime="application/jsonl",
+        )
+        st.download_button(
+            "⬇️ Metrics (Prometheus)",
+            timings.to_prometheus(),
+            file_name=f"{timings.metric_prefix}_metrics.txt",
+            mime="text/plain",
+        )
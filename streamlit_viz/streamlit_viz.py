@@ -1,503 +1,43 @@
 import os
 from pathlib import Path
 
-import pandas as pd
-import numpy as np
 import streamlit as st
-import altair as alt
-from streamlit_agraph import agraph, Node, Edge, Config
-from colour import Color
 
-from streamlit_viz_utils import *
+# streamlit already imports pandas, numpy and altair; streamlit_agraph and
+# colour are only needed by the occupations section, so they are imported
+# where they're used rather than before the first paint
+from streamlit_viz_utils import CHART_CACHE, DATA_CACHE
+from streamlit_viz_charts import (
+    TIMINGS,
+    create_common_skills_chart,
+    create_common_skills_chart_by_skill_groups,
+    create_location_quotident_graph,
+    create_sector_skill_sim_network,
+    create_similar_sectors_text_chart,
+    load_regional_data,
+    load_sector_data,
+    load_summary_data,
+)
+from streamlit_viz_network import SPARSIFY_STRATEGIES
+from streamlit_viz_sections import Section
+
+# streamlit_viz_charts has put shared/ on the path
+from stage_timings import show_timing_panel
 
 PROJECT_DIR = Path(__file__).resolve().parents[1]
-data_folder = os.path.join(PROJECT_DIR, "streamlit_viz/data")
 images_folder = os.path.join(PROJECT_DIR, "streamlit_viz/images")
 
 
 st.set_page_config(page_title="Skills Demand Analysis", page_icon=os.path.join(images_folder, "nesta_logo.png"))
 
-chart_title_font_size = 14
-
-def load_summary_data():
-
-    file_name = os.path.join(
-        data_folder,
-        "per_skill_group_proportions_sample.json",
-    )
-    top_skills_by_skill_groups = load_data(file_name)
-
-    return top_skills_by_skill_groups
-
-
-def load_sector_data():
-
-    file_name = os.path.join(
-        data_folder, "per_sector_sample_updated.json"
-    )
-    all_sector_data = load_data(file_name)
-    all_sector_data = {k: v for k, v in all_sector_data.items() if k != "Other"}
-
-    file_name = os.path.join(
-        data_folder,
-        "lightweight_skill_similarity_between_sectors_sample.csv",
-    )
-    sector_similarity = load_data(file_name)
-
-    file_name = os.path.join(data_folder, "sector_2_kd_sample.json")
-    sector_2_kd = load_data(file_name)
-
-    number_job_adverts_per_sector = {
-        sector_name: v["num_ads"] for sector_name, v in all_sector_data.items()
-    }
-
-    total_num_job_adverts = sum(number_job_adverts_per_sector.values())
-    percentage_job_adverts_per_sector = {
-        sector_name: round(num_ads * 100 / total_num_job_adverts, 2)
-        for sector_name, num_ads in number_job_adverts_per_sector.items()
-    }
-
-    return (
-        all_sector_data,
-        percentage_job_adverts_per_sector,
-        sector_similarity,
-        sector_2_kd,
-    )
-
-
-def load_regional_data():
-
-    file_name = os.path.join(
-        data_folder, "top_skills_per_loc_sample.json"
-    )
-    all_region_data = load_data(file_name)
-
-    file_name = os.path.join(
-        data_folder,
-        "top_skills_per_loc_quotident_sample.csv",
-    )
-
-    loc_quotident_data = load_data(file_name)
-
-    return (
-        all_region_data,
-        loc_quotident_data,
-    )
-
-
-def create_sector_skill_sim_network(
-    high_sector_similarity, sector_2_kd, percentage_job_adverts_per_sector
-):
-    # Node size is scaled by the percentage of job ads with this skill
-    min_node_size = 5
-    max_node_size = 10
-
-    # Create colour mapper for sectors to be coloured by their parent knowledge domain (broad occupational group).
-    # If you run out of Nesta colours, then reloop through them
-    color_i = 0
-    knowledge_domain_colors = {}
-    for knowledge_domain in set(sector_2_kd.values()):
-        if color_i > len(NESTA_COLOURS):
-            color_i = 0
-        knowledge_domain_colors[knowledge_domain] = NESTA_COLOURS[color_i]
-        color_i += 1
-
-    nodes = []
-    edges = []
-    node_ids = set()
-    for _, connection in high_sector_similarity.iterrows():
-        target_skill = connection["target"]
-        source_skill = connection["source"]
-
-        if target_skill not in node_ids:
-            nodes.append(
-                Node(
-                    id=target_skill,
-                    label=target_skill,
-                    color=knowledge_domain_colors[sector_2_kd[target_skill]],
-                    size=percentage_job_adverts_per_sector[connection["target"]]
-                    * (max_node_size - min_node_size)
-                    + min_node_size,
-                )
-            )
-            node_ids.add(target_skill)
-        if source_skill not in node_ids:
-            nodes.append(
-                Node(
-                    id=source_skill,
-                    label=source_skill,
-                    color=knowledge_domain_colors[sector_2_kd[source_skill]],
-                    size=percentage_job_adverts_per_sector[connection["source"]]
-                    * (max_node_size - min_node_size)
-                    + min_node_size,
-                )
-            )
-            node_ids.add(source_skill)
-        edges.append(
-            Edge(
-                source=source_skill,
-                target=target_skill,
-                color="#0F294A",
-                weight=connection["weight"],
-                directed=False,
-                arrows={
-                    "to": {"scaleFactor": 0}
-                },  # Hack to make the graph undirected - make arrows invisible!
-            )
-        )
-
-    config = Config(
-        width=1000,
-        height=500,
-        directed=False,
-        nodeHighlightBehavior=True,
-        collapsible=True,
-    )
-
-    # Legend (is actually an altair plot)
-    legend_df = pd.DataFrame(
-        {
-            "x": [
-                i
-                for i, v in enumerate(
-                    np.array_split(list(knowledge_domain_colors.keys()), 3)
-                )
-                for ii, vv in enumerate(v)
-            ],
-            "y": [
-                ii
-                for i, v in enumerate(
-                    np.array_split(list(knowledge_domain_colors.keys()), 3)
-                )
-                for ii, vv in enumerate(v)
-            ],
-            "value": list(knowledge_domain_colors.keys()),
-            "color": list(knowledge_domain_colors.values()),
-        }
-    )
-
-    legend_chart = (
-        alt.Chart(legend_df, title="Broad occupational groups")
-        .mark_circle(size=150)
-        .encode(
-            x=alt.X("x", axis=alt.Axis(labels=False, grid=False), title=""),
-            y=alt.Y("y", axis=alt.Axis(labels=False, grid=False), title=""),
-            color=alt.Color(
-                "value",
-                scale=alt.Scale(
-                    domain=list(knowledge_domain_colors.keys()),
-                    range=list(knowledge_domain_colors.values()),
-                ),
-                legend=None,
-            ),
-            tooltip=alt.value(None)
-        )
-        .properties(height=200)
-    )
-
-    legend_text = (
-        alt.Chart(legend_df)
-        .mark_text(
-            align="left",
-            baseline="middle",
-            fontSize=12,
-            color="black",
-            dx=10,
-            font="Century Gothic",
-        )
-        .encode(x="x", y="y", text="value", tooltip=alt.value(None))
-    )
-
-    legend_chart = legend_chart + legend_text
-
-    configure_plots(legend_chart)
-
-    return nodes, edges, config, legend_chart.configure_title(fontSize=chart_title_font_size)
-
-
-def create_similar_sectors_text_chart(all_sector_data, sector):
-
-    similar_sectors = pd.DataFrame.from_dict(
-        all_sector_data[sector]["similar_sectors"],
-        orient="index",
-        columns=["euclid_dist"],
-    )
-    similar_sectors.drop(index="Other", inplace=True)
-    similar_sectors.sort_values(
-        by="euclid_dist", inplace=True, ascending=True
-    )  # Smaller Euclid dist is closer
-    similar_sectors = similar_sectors[0:10]
-    similar_sectors["sector"] = similar_sectors.index
-    similar_sectors["Similarity score"] = 1 / (
-        similar_sectors["euclid_dist"] + 0.0001
-    )  # Just so a value of 1 means most similar, and 0 is least
-
-    most_similar_color = Color("green")
-    least_similar_color = Color("red")
-    similarity_colors = {
-        sim_value / 10: str(c.hex)
-        for sim_value, c in enumerate(
-            list(most_similar_color.range_to(least_similar_color, 10))
-        )
-    }
-
-    similar_sectors_text = pd.DataFrame(
-        {
-            "x": [0] * 5 + [1] * 5,
-            "y": list(range(5, 0, -1)) + list(range(5, 0, -1)),
-            "value": [f"{num+1}. {similar_sectors.index[num]}" for num in range(10)],
-            "color": [
-                np.floor(euclid_dist * 10) / 10
-                for euclid_dist in similar_sectors[0:10]["euclid_dist"].tolist()
-            ],
-            "sim_score": similar_sectors[0:10]["euclid_dist"].tolist(),
-        }
-    )
-
-    circle_chart = (
-        alt.Chart(similar_sectors_text, title="Most similar occupations")
-        .mark_circle(size=100)
-        .encode(
-            x=alt.X("x", axis=alt.Axis(labels=False, grid=False), title=""),
-            y=alt.Y("y", axis=alt.Axis(labels=False, grid=False), title=""),
-            text="value",
-            tooltip=[alt.Tooltip("sim_score", title="Similarity score", format=".2")],
-            color=alt.Color(
-                "color",
-                scale=alt.Scale(
-                    domain=list(similarity_colors.keys()),
-                    range=list(similarity_colors.values()),
-                ),
-                legend=None,
-            ),
-        )
-        .properties(height=200)
-    )
-
-    text_chart = (
-        alt.Chart(similar_sectors_text, title="Most similar occupations")
-        .mark_text(align="left", baseline="middle", fontSize=16, dx=10, color="black")
-        .encode(
-            x=alt.X("x", axis=alt.Axis(labels=False, grid=False), title=""),
-            y=alt.Y("y", axis=alt.Axis(labels=False, grid=False), title=""),
-            text="value",
-            tooltip=[alt.Tooltip("sim_score", title="Similarity score", format=".2")],
-        )
-        .properties(height=200)
-    )
-
-    similar_sectors_colors = pd.DataFrame(
-        {
-            "x": [0, 0, 0, 0],
-            "y": [0, 0, 0, 0],
-            "color": ["#008000", "#72aa00", "#d58e00", "#f00"],
-            "sim_type": [
-                "Very similar",
-                "Quite similar",
-                "Somewhat similar",
-                "Not similar",
-            ],
-        }
-    )
-
-    legend_chart = (
-        alt.Chart(similar_sectors_colors)
-        .mark_circle(size=0)
-        .encode(
-            x=alt.X("x", axis=alt.Axis(labels=False, grid=False), title=""),
-            y=alt.Y("y", axis=alt.Axis(labels=False, grid=False), title=""),
-            color=alt.Color(
-                "sim_type",
-                scale=alt.Scale(
-                    domain=list(
-                        dict(
-                            zip(
-                                similar_sectors_colors["sim_type"],
-                                similar_sectors_colors["color"],
-                            )
-                        ).keys()
-                    ),
-                    range=list(
-                        dict(
-                            zip(
-                                similar_sectors_colors["sim_type"],
-                                similar_sectors_colors["color"],
-                            )
-                        ).values()
-                    ),
-                ),
-                legend=alt.Legend(title=""),
-            ),
-        )
-        .properties(height=200)
-    )
-
-    base = circle_chart+text_chart
-
-    configure_plots(base)
-
-    return base.configure_title(fontSize=chart_title_font_size), legend_chart
-
-
-def create_common_skills_chart_by_skill_groups(top_skills_by_skill_groups, skill_group):
-    plot_title = f"Most common skills in {skill_group} skill group"
-    if skill_group == "all":
-        plot_title += "s"
-
-    top_skills = pd.DataFrame.from_dict(
-        top_skills_by_skill_groups[skill_group],
-        orient="index",
-        columns=["percent"],
-    )
-    top_skills.sort_values(by="percent", inplace=True, ascending=False)
-    top_skills = top_skills[0:10]
-    top_skills["skill"] = top_skills.index
-
-    common_skills_chart = (
-        alt.Chart(top_skills)
-        .mark_bar(size=10, opacity=0.8, color="#0000FF")
-        .encode(
-            y=alt.Y("skill", sort=None, axis=alt.Axis(title=None, labelLimit=5000)),
-            x=alt.X(
-                "percent:Q",
-                axis=alt.Axis(
-                    title="Percentage of job adverts that mention this skill at least once",
-                    format="%",
-                ),
-            ),
-            tooltip=[alt.Tooltip("percent", title="Percentage", format=".1%")],
-        )
-        .properties(
-            title=plot_title,
-            # height=100,
-            width=75,
-        )
-    )
-
-    configure_plots(common_skills_chart)
-
-    return common_skills_chart.configure_title(fontSize=chart_title_font_size)
-
-
-def create_common_skills_chart(
-    all_sector_data, skill_group_level, sector, trans_option
-):
-
-    skill_group_select_text = {
-        "all": "skills or skill groups",
-        "0": "skill groups",
-        "1": "skill groups",
-        "2": "skill groups",
-        "3": "skill groups",
-        "4": "skill",
-    }
-
-    if trans_option == 'no transversal skills':
-        key_name = "top_skills_no_transversal"
-
-    if trans_option == 'only transversal skills':
-        key_name = "top_transversal_skills"
-    else:
-        key_name = "top_skills"
-
-    top_skills = pd.DataFrame.from_dict(
-        all_sector_data[sector][key_name][skill_group_level],
-        orient="index",
-        columns=["percent"],
-    )
-    top_skills.sort_values(by="percent", inplace=True, ascending=False)
-    top_skills = top_skills[0:10]
-    top_skills["sector"] = top_skills.index
-
-    common_skills_chart = (
-        alt.Chart(top_skills)
-        .mark_bar(size=10, opacity=0.8, color="#0000FF")
-        .encode(
-            y=alt.Y("sector", sort=None, axis=alt.Axis(title=None, labelLimit=5000)),
-            x=alt.X(
-                "percent:Q",
-                axis=alt.Axis(
-                    title="Percentage of job adverts with this skill", format="%"
-                ),
-            ),
-            tooltip=[alt.Tooltip("percent", title="Percentage", format=".1%")],
-        )
-        .properties(
-            title={
-                "text": [
-                    f"Most common {skill_group_select_text[skill_group_level]}",
-                    f' for "{sector}"',
-                ],
-                "color": "Black",
-            },
-            # height=100,
-            width=75,
-        )
-    )
-
-    configure_plots(common_skills_chart)
-
-    return common_skills_chart.configure_title(fontSize=chart_title_font_size)
-
-
-def create_location_quotident_graph(all_location_data, location):
-
-    geo_df = all_location_data[
-        (all_location_data["region"] == location)
-        & (all_location_data["skill_percent"] >= 0.05)
-    ].sort_values("absolute_location_change", ascending=False)[:15]
-    geo_df["skill_percent"] = round(geo_df["skill_percent"] * 100, 2)
-
-    base = (
-        alt.Chart(geo_df)
-        .mark_point(size=10, opacity=0.8, color="#0000FF", filled=True)
-        .encode(
-            y=alt.Y("skill", sort="-x", axis=alt.Axis(title=None, labelLimit=1000)),
-            x=alt.X(
-                "location_quotident",
-                axis=alt.Axis(title="Location Quotient"),
-            ),
-            size=alt.Size(
-                "skill_percent:Q",
-                title=["Percentage of job adverts", " that mention at least", " 1 skill from this group (%)"],
-            ),
-            color=alt.Color(
-                "location_change",
-                scale=alt.Scale(domainMid=0, scheme="redblue"),
-                legend=None,
-            ),
-            tooltip=[
-                alt.Tooltip(
-                    "skill_percent:Q",
-                    title="% of job adverts with this skill group",
-                    format=",.2f",
-                ),
-                alt.Tooltip(
-                    "location_change",
-                    title="Location Quotient Change",
-                    format=",.2f",
-                ),
-            ],
-        )
-        .properties(
-            title=f'Skill Intensity in "{location}"',
-        )
-    )
-
-    vline = (
-        alt.Chart(pd.DataFrame({"location_quotident": [1], "color": ["red"]}))
-        .mark_rule(opacity=0.8)
-        .encode(x="location_quotident", color=alt.Color("color:N", scale=None))
-    )
-
-    base_line = base + vline
-    configure_plots(base_line)
-
-    return base_line.configure_title(fontSize=chart_title_font_size)
-
+TIMINGS.start_rerun()
+TIMINGS.add_cache("data", DATA_CACHE.stats)
+TIMINGS.add_cache("chart", CHART_CACHE.stats)
 
 # ========================================
 # ---------- Streamlit configs ------------
+# Chart builders are memoized (memoize_chart) and return Vega-Lite specs,
+# so they are drawn with st.vega_lite_chart rather than st.altair_chart
 
 with open(os.path.join(PROJECT_DIR, "streamlit_viz/style.css")) as css:
     st.markdown(f"<style>{css.read()}</style>", unsafe_allow_html=True)
@@ -579,31 +119,41 @@ st.markdown("<p class='medium-font'>Most common skills</p>", unsafe_allow_html=T
 
 st.markdown(sum_text)
 
-top_skills_by_skill_groups = load_summary_data()
+top_skills_by_skill_groups, skill_group_index = load_summary_data()
 
 skill_group = st.selectbox(
     "Select skill group", sorted(list(top_skills_by_skill_groups.keys())), index=1
 )
 
 common_skills_chart_by_skill_groups = create_common_skills_chart_by_skill_groups(
-    top_skills_by_skill_groups, skill_group
-)
-st.altair_chart(
-    common_skills_chart_by_skill_groups.configure_axis(labelLimit=500),
-    use_container_width=True,
+    skill_group_index, skill_group
 )
+st.vega_lite_chart(common_skills_chart_by_skill_groups, use_container_width=True)
 
 # ----- National Government Use Case -----
 
-(
-    all_sector_data,
-    percentage_job_adverts_per_sector,
-    sector_similarity,
-    sector_2_kd,
-) = load_sector_data()
+# Skill group levels for the most common skills charts of both use cases below
+selection_mapper = {
+    "Any (closest skill or skill group)": "all",
+    'Most broad (e.g. "S")': "0",
+    'Broad/mid (e.g. "S1")': "1",
+    'Mid/granular (e.g. "S1.2")': "2",
+    'Most granular (e.g. "S1.2.3")': "3",
+    "Skill": "4",
+}
+
+only_trans_mapper = {
+    "Any (closest skill or skill group)": "all",
+    'Mid/granular (e.g. "S1.2")': "2",
+    "Skill": "4",
+}
+
+occupations_section = Section(
+    "occupations", "A use case for career advisers: _enriching career advice_"
+)
 
 st.header("", anchor="occupations")
-with st.expander("A use case for career advisers: _enriching career advice_"):
+if occupations_section.opened():
 
     st.markdown(
         "<p class='medium-font'>Providing new insights on a single occupation</p>",
@@ -620,6 +170,14 @@ with st.expander("A use case for career advisers: _enriching career advice_"):
 
     st.markdown(occ_text)
 
+    (
+        all_sector_data,
+        sector_top_skills_index,
+        sector_distance_index,
+        percentage_job_adverts_per_sector,
+        similarity_network,
+    ) = occupations_section.cached(load_sector_data)
+
     top_sectors = [k for k, v in all_sector_data.items() if v["num_ads"] > 200]
 
     sector = st.selectbox("Select an occupation", top_sectors)
@@ -636,36 +194,21 @@ with st.expander("A use case for career advisers: _enriching career advice_"):
 
     ## ----- Similar sectors [selections: sector] -----
 
-    similar_sectors_text_chart, legend_chart = create_similar_sectors_text_chart(
-        all_sector_data, sector
+    similar_sectors_text_chart, legend_chart = occupations_section.cached(
+        create_similar_sectors_text_chart, sector_distance_index, sector
     )
 
     col1, col2 = st.columns([70, 30])
     with col1:
-        st.altair_chart(similar_sectors_text_chart, use_container_width=True)
+        st.vega_lite_chart(similar_sectors_text_chart, use_container_width=True)
     with col2:
         st.text("")
         st.text("")
-        st.altair_chart(legend_chart, use_container_width=True)
+        st.vega_lite_chart(legend_chart, use_container_width=True)
 
 
     ## ----- The most common skills [selections: sector] -----
 
-    selection_mapper = {
-        "Any (closest skill or skill group)": "all",
-        'Most broad (e.g. "S")': "0",
-        'Broad/mid (e.g. "S1")': "1",
-        'Mid/granular (e.g. "S1.2")': "2",
-        'Most granular (e.g. "S1.2.3")': "3",
-        "Skill": "4",
-    }
-
-    only_trans_mapper = {
-        "Any (closest skill or skill group)": "all",
-        'Mid/granular (e.g. "S1.2")': "2",
-        "Skill": "4",
-    }
-
     trans_option = st.radio("Transversal skills options :point_down:", ['all skills', 'only transversal skills', 'no transversal skills'], horizontal=True, key="1")
     
     if trans_option == 'only transversal skills':
@@ -679,14 +222,15 @@ with st.expander("A use case for career advisers: _enriching career advice_"):
 
     skill_group_level = selection_mapper[skill_group_level]
 
-    common_skills_chart = create_common_skills_chart(
-        all_sector_data, skill_group_level, sector, trans_option=trans_option
+    common_skills_chart = occupations_section.cached(
+        create_common_skills_chart,
+        sector_top_skills_index,
+        skill_group_level,
+        sector,
+        trans_option=trans_option,
     )
 
-    st.altair_chart(
-        common_skills_chart.configure_axis(labelLimit=500),
-        use_container_width=True,
-    )
+    st.vega_lite_chart(common_skills_chart, use_container_width=True)
 
     ## ----- Skill similarities network [selections: none] -----
 
@@ -704,39 +248,44 @@ with st.expander("A use case for career advisers: _enriching career advice_"):
     """
 
     st.markdown(occ_map_text)
-    # sim_thresh = st.slider('Similarity threshold', 0.4, 1.0, value=0.5, step=0.1)
-    sim_thresh = 0.4  # lower than this is either a big clump (0.3-0.4) and/or crashes things (<0.3)
-    high_sector_similarity = sector_similarity[
-        (
-            (sector_similarity["weight"] > sim_thresh)
-            & (sector_similarity["target"] != "Other")
-            & (sector_similarity["source"] != "Other")
+    # The slider used to stop at 0.4: below it every edge is drawn as one
+    # big clump (0.3-0.4) and the front end crashes (<0.3). Every strategy
+    # now caps the edges drawn at MAX_GRAPH_EDGES, strongest first, and
+    # the sparsified ones keep the map readable, so weaker links can be
+    # explored down to 0.1
+    map_col1, map_col2 = st.columns([50, 50])
+    with map_col1:
+        sim_thresh = st.slider('Similarity threshold', 0.1, 1.0, value=0.4, step=0.05)
+    with map_col2:
+        strategy = st.selectbox(
+            "Map detail",
+            list(SPARSIFY_STRATEGIES.keys()),
+            format_func=SPARSIFY_STRATEGIES.get,
         )
-    ]
 
-    nodes, edges, config, legend_chart = create_sector_skill_sim_network(
-        high_sector_similarity, sector_2_kd, percentage_job_adverts_per_sector
+    nodes, edges, config, legend_chart = occupations_section.cached(
+        create_sector_skill_sim_network, similarity_network, sim_thresh, strategy=strategy
     )
 
-    agraph(nodes, edges, config)
+    from streamlit_agraph import agraph
+
+    with TIMINGS.stage("agraph"):
+        agraph(nodes, edges, config)
 
-    st.altair_chart(legend_chart, use_container_width=True)
+    st.vega_lite_chart(legend_chart, use_container_width=True)
 
 # ========================================
 # ----- Local Government Use Case -----
-(
-    all_region_data,
-    loc_quotident_data,
-) = load_regional_data()
-
-regions_list = list(loc_quotident_data.region.unique())
+regions_section = Section(
+    "regions", "A use case for local authorities: _understanding regional skill demand_"
+)
 
 # st.markdown(
 #     "<p class='big-font'>A use case for local authorities: <i>regional skill demand</i></p>",
 #     unsafe_allow_html=True,
 # )
 st.header("", anchor="regions")
-with st.expander("A use case for local authorities: _understanding regional skill demand_"):
+if regions_section.opened():
 
     local_gov_text = """
     In addition to providing insights at a national level, job adverts can also give a sense of the skills landscape at a regional level. Regions with fewer than 500 job adverts were removed.
@@ -746,7 +295,13 @@ with st.expander("A use case for local authorities: _understanding regional skil
 
     st.markdown(local_gov_text)
 
-    geo = st.selectbox("Select Region", regions_list)
+    (
+        all_region_data,
+        region_top_skills_index,
+        loc_quotident_index,
+    ) = regions_section.cached(load_regional_data)
+
+    geo = st.selectbox("Select Region", loc_quotident_index.regions)
 
     # st.markdown(
     #     "<p class='medium-font'>Vacancies per Region</p>", unsafe_allow_html=True
@@ -784,14 +339,16 @@ with st.expander("A use case for local authorities: _understanding regional skil
 
     skill_group_level = selection_mapper[skill_group_level]
 
-    common_skills_chart = create_common_skills_chart(
-        all_region_data, skill_group_level, geo, trans_option=trans_option
+    common_skills_chart = regions_section.cached(
+        create_common_skills_chart,
+        region_top_skills_index,
+        skill_group_level,
+        geo,
+        trans_option=trans_option,
+        label_limit=300,
     )
 
-    st.altair_chart(
-        common_skills_chart.configure_axis(labelLimit=300),
-        use_container_width=True,
-    )
+    st.vega_lite_chart(common_skills_chart, use_container_width=True)
 
     ## ----- Skill specialisms [selections: location] -----
 
@@ -809,17 +366,20 @@ with st.expander("A use case for local authorities: _understanding regional skil
 
     st.markdown(loc_text_intensity)
 
-    location_quotident_chart = create_location_quotident_graph(loc_quotident_data, geo)
-    st.altair_chart(
-        location_quotident_chart.configure_axis(labelLimit=300),
-        use_container_width=True,
+    location_quotident_chart = regions_section.cached(
+        create_location_quotident_graph, loc_quotident_index, geo
     )
+    st.vega_lite_chart(location_quotident_chart, use_container_width=True)
 
 # ========================================
 # ----- Career Advice Personnel Use Case -----
 
+hr_section = Section(
+    "hr", "A use case for HR: _understanding the skills within a job advert_"
+)
+
 st.header("", anchor="hr")
-with st.expander("A use case for HR: _understanding the skills within a job advert_"):
+if hr_section.opened():
 
     hr_text = """
         We have also developed a beta app that [uses our algorithm to extract skills from a single job advert](https://www.nesta.org.uk/data-visualisation-and-interactive/skills-extractor-tool/) supplied by a user. This could be useful for HR professionals to quickly identify the skills that they are requesting within an otherwise densely worded job advert. 
@@ -906,3 +466,5 @@ st.markdown(
     "<p class='tiny-font'>Image credit: Annie Spratt. Deans Court beekeeper.</p>",
     unsafe_allow_html=True,
 )
+
+show_timing_panel(TIMINGS)
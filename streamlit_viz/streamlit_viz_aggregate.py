@@ -0,0 +1,633 @@
+"""Build the streamlit_viz datasets from the skills extracted from job adverts.
+
+    python streamlit_viz/streamlit_viz_aggregate.py skills.jsonl adverts.csv output_folder \\
+        --taxonomy_file esco_data_formatted.csv --hier_mapper_file esco_hier_mapper.json
+
+skills.jsonl is the output of app/app_batch_extract.py (one line per advert
+with its id and mapped "SKILL"s). adverts.csv (or .jsonl) holds each advert's
+id, occupation (sector), region and, optionally, knowledge domain. The
+taxonomy files are the skills extractor library's formatted ESCO data and
+hierarchy name mapper, which place each matched skill in its skill groups.
+
+Every mapped skill is expanded into the concepts it counts towards: the
+closest match itself ("all"), its skill groups at each hierarchy level
+("0" to "3") and the skill itself ("4"). The extracted skills are read in
+chunks, and each chunk becomes a sparse advert x concept matrix. Sparse
+products with advert x sector and advert x region indicator matrices then
+accumulate the number of adverts mentioning each concept in each sector
+and region. Every dataset is derived from those counts and written with
+the file names and schemas streamlit_viz.py loads.
+"""
+import argparse
+import ast
+import itertools
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from streamlit_viz_index import TOP_SKILLS_KEYS
+from streamlit_viz_location_quotient import MIN_ADVERTS_PER_SKILL, LocationQuotientCounts
+from streamlit_viz_similarity import SIMILARITY_FILE_NAME, TOP_K, sector_similarities
+
+SKILL_LEVELS = ["all", "0", "1", "2", "3", "4"]
+
+# Skills kept per sector/region, skill group level and transversal option
+TOP_SKILLS_N = 30
+# Skills kept per skill group in the summary data
+SKILL_GROUP_TOP_N = 20
+# Skill level the location quotients are computed for
+LOCATION_QUOTIENT_LEVEL = "3"
+# Skill level of the sector skill profiles compared for similarity
+SIMILARITY_LEVEL = "all"
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# Output file names, as loaded by streamlit_viz.py
+SKILL_GROUP_FILE_NAME = "per_skill_group_proportions_sample.json"
+SECTOR_FILE_NAME = "per_sector_sample_updated.json"
+REGION_FILE_NAME = "top_skills_per_loc_sample.json"
+LOCATION_QUOTIENT_FILE_NAME = "top_skills_per_loc_quotident_sample.csv"
+SECTOR_KD_FILE_NAME = "sector_2_kd_sample.json"
+
+
+def is_group_code(match_id):
+    """Whether a taxonomy id is a skill group code (e.g. "S1.2") rather than a
+    skill id; the library's own test is that group codes are short"""
+    return isinstance(match_id, str) and len(match_id) < 10
+
+
+def split_code(code):
+    """[level 0, level 1, level 2, level 3] codes of an ESCO skill group code,
+    None below the code's own level: "S4.8" -> ["S", "S4", "S4.8", None].
+    Knowledge codes are "K" + isced digits: "K081" -> ["K", "K08", "K081", None]"""
+    if code[:1] == "K" and code[1:].isdigit():
+        return [code[:n] if len(code) >= n else None for n in (1, 3, 4, 5)]
+    if len(code) == 1:
+        return [code, None, None, None]
+    parts = code.split(".")
+    level_0 = "".join(re.findall("[a-zA-Z]+", parts[0]))
+    return [level_0] + [
+        ".".join(parts[:n]) if len(parts) >= n else None for n in (1, 2, 3)
+    ]
+
+
+class SkillHierarchy:
+    """Skill group codes of each taxonomy skill, and the names of the groups
+
+    skill_codes: {skill id: [[level 0, level 1, level 2, level 3 code], ...]}
+    (a skill can sit in several branches), as in the library's formatted
+    taxonomy "hierarchy_levels" column
+    code_names: {skill group code: name}, the library's hierarchy name mapper
+    """
+
+    def __init__(self, skill_codes=None, code_names=None):
+        self.skill_codes = skill_codes or {}
+        self.code_names = code_names or {}
+
+    @classmethod
+    def from_files(cls, taxonomy_file=None, hier_mapper_file=None):
+        skill_codes = {}
+        if taxonomy_file:
+            taxonomy = pd.read_csv(
+                taxonomy_file, usecols=["id", "hierarchy_levels"]
+            ).dropna()
+            for skill_id, levels in zip(taxonomy["id"], taxonomy["hierarchy_levels"]):
+                if skill_id not in skill_codes:
+                    skill_codes[skill_id] = (
+                        ast.literal_eval(levels) if isinstance(levels, str) else levels
+                    )
+        code_names = {}
+        if hier_mapper_file:
+            with open(hier_mapper_file, "r") as file:
+                code_names = json.load(file)
+        return cls(skill_codes, code_names)
+
+    def paths(self, match_id):
+        if is_group_code(match_id):
+            return [split_code(match_id)]
+        return self.skill_codes.get(match_id, [])
+
+    def name(self, code):
+        return self.code_names.get(code, code)
+
+
+class SkillConcepts:
+    """Column numbers of the advert x concept matrices
+
+    A concept is a (skill level, taxonomy id) pair; for each column the
+    level, label (skill or skill group name), whether it is transversal
+    and, for skills (level "4"), the summary skill groups it belongs to.
+    """
+
+    def __init__(self, hierarchy=None):
+        self.hierarchy = hierarchy or SkillHierarchy()
+        self.levels = []
+        self.labels = []
+        self.transversal = []
+        self.skill_groups = []
+        self.keys = []
+        self._columns = {}
+        self._match_columns = {}
+
+    def __len__(self):
+        return len(self.levels)
+
+    def _column(self, level, concept_id, label, transversal, skill_groups=()):
+        key = (level, concept_id)
+        if key not in self._columns:
+            self._columns[key] = len(self.levels)
+            self.keys.append(key)
+            self.levels.append(level)
+            self.labels.append(label)
+            self.transversal.append(transversal)
+            self.skill_groups.append(tuple(skill_groups))
+        return self._columns[key]
+
+    def columns(self, match_skill, match_id):
+        """Columns of every concept a mapped skill counts towards"""
+        key = (match_skill, match_id)
+        if key not in self._match_columns:
+            paths = self.hierarchy.paths(match_id)
+            transversal = any(path[0] == "T" for path in paths)
+            columns = [self._column("all", match_id, match_skill, transversal)]
+            for path in paths:
+                for level, code in enumerate(path):
+                    if code:
+                        columns.append(
+                            self._column(
+                                str(level), code, self.hierarchy.name(code), path[0] == "T"
+                            )
+                        )
+            if not is_group_code(match_id):
+                # Skills are summarised by their level 1 group for "S"kills,
+                # and by their top level group otherwise (e.g. "T"ransversal)
+                skill_groups = sorted(
+                    {
+                        path[1] if path[0] == "S" and path[1] else path[0]
+                        for path in paths
+                        if path[0]
+                    }
+                )
+                columns.append(
+                    self._column("4", match_id, match_skill, transversal, skill_groups)
+                )
+            self._match_columns[key] = np.unique(columns)
+        return self._match_columns[key]
+
+    def merge(self, other):
+        """Add other's concepts, returning the column in self of each of
+        other's columns"""
+        return np.array(
+            [
+                self._column(*key, label, transversal, skill_groups)
+                for key, label, transversal, skill_groups in zip(
+                    other.keys, other.labels, other.transversal, other.skill_groups
+                )
+            ],
+            dtype=np.int64,
+        )
+
+    def to_state(self):
+        """json serialisable columns, see from_state"""
+        return {
+            "keys": [list(key) for key in self.keys],
+            "labels": self.labels,
+            "transversal": self.transversal,
+            "skill_groups": [list(groups) for groups in self.skill_groups],
+        }
+
+    @classmethod
+    def from_state(cls, state, hierarchy=None):
+        concepts = cls(hierarchy)
+        for key, label, transversal, skill_groups in zip(
+            state["keys"], state["labels"], state["transversal"], state["skill_groups"]
+        ):
+            concepts._column(*key, label, transversal, skill_groups)
+        return concepts
+
+    def mask(self, level, transversal=None):
+        """Boolean mask of the columns at level, optionally only (not) transversal"""
+        mask = np.asarray(self.levels, dtype=object) == level
+        if transversal is not None:
+            mask &= np.asarray(self.transversal, dtype=bool) == transversal
+        return mask
+
+
+class SkillCounts:
+    """Number of adverts mentioning each concept in each group (sector or
+    region), and the number of adverts in each group"""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.num_ads = np.zeros(len(self.names), dtype=np.int64)
+        self.counts = sparse.csr_matrix((len(self.names), 0), dtype=np.int64)
+        self._parts = []
+
+    def add(self, group_codes, advert_concepts):
+        """Add a chunk: each advert's group (-1 if unknown) and the binary
+        advert x concept matrix"""
+        known = np.flatnonzero(group_codes >= 0)
+        indicator = sparse.csr_matrix(
+            (np.ones(len(known), dtype=np.int64), (group_codes[known], known)),
+            shape=(len(self.names), len(group_codes)),
+        )
+        self._parts.append(indicator @ advert_concepts)
+        self.num_ads += np.bincount(group_codes[known], minlength=len(self.names))
+        if len(self._parts) >= 16:
+            self.finish(advert_concepts.shape[1])
+
+    def finish(self, num_concepts):
+        """Sum the chunks added so far into counts (num_concepts columns)"""
+        total = _resize(self.counts, num_concepts)
+        for part in self._parts:
+            total = total + _resize(part, num_concepts)
+        self.counts = total.tocsr()
+        self._parts = []
+        return self
+
+    def merge(self, other, columns):
+        """Add other's counts (columns: the column in self of each of other's
+        concept columns), returning the names of the groups that changed.
+        Groups without adverts in other are not added."""
+        rows = {str(name): i for i, name in enumerate(self.names)}
+        for name, num_ads in zip(other.names, other.num_ads):
+            if num_ads > 0:
+                rows.setdefault(str(name), len(rows))
+        self.names = list(rows)
+        # Groups without adverts have no counts to add, so any row will do
+        other_rows = np.array(
+            [rows.get(str(name), 0) for name in other.names], dtype=np.int64
+        )
+        num_concepts = max(self.counts.shape[1], int(columns.max(initial=-1)) + 1)
+
+        other_counts = other.counts.tocoo()
+        counts = _resize(self.counts, num_concepts)
+        counts.resize((len(self.names), num_concepts))
+        self.counts = (
+            counts
+            + sparse.csr_matrix(
+                (
+                    other_counts.data,
+                    (other_rows[other_counts.row], columns[other_counts.col]),
+                ),
+                shape=counts.shape,
+            )
+        ).tocsr()
+        self.num_ads = np.pad(self.num_ads, (0, len(self.names) - len(self.num_ads)))
+        np.add.at(self.num_ads, other_rows, other.num_ads)
+        return [
+            str(name) for name, num_ads in zip(other.names, other.num_ads) if num_ads > 0
+        ]
+
+    def to_arrays(self, prefix):
+        """{prefix_name: array} to save in a .npz, see from_arrays"""
+        counts = self.counts.tocsr()
+        return {
+            f"{prefix}_names": np.asarray(self.names, dtype=str),
+            f"{prefix}_num_ads": self.num_ads,
+            f"{prefix}_data": counts.data,
+            f"{prefix}_indices": counts.indices,
+            f"{prefix}_indptr": counts.indptr,
+            f"{prefix}_shape": np.asarray(counts.shape),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        skill_counts = cls(arrays[f"{prefix}_names"].tolist())
+        skill_counts.num_ads = arrays[f"{prefix}_num_ads"].astype(np.int64)
+        skill_counts.counts = sparse.csr_matrix(
+            (
+                arrays[f"{prefix}_data"],
+                arrays[f"{prefix}_indices"],
+                arrays[f"{prefix}_indptr"],
+            ),
+            shape=tuple(arrays[f"{prefix}_shape"]),
+        )
+        return skill_counts
+
+    def proportions(self):
+        """Share of each group's adverts mentioning each concept (csr)"""
+        with np.errstate(divide="ignore"):
+            inverse_num_ads = np.where(self.num_ads > 0, 1 / self.num_ads, 0)
+        return sparse.diags(inverse_num_ads) @ self.counts.astype(np.float64)
+
+
+def _resize(matrix, num_columns):
+    matrix = matrix.tocsr(copy=True)
+    matrix.resize((matrix.shape[0], num_columns))
+    return matrix
+
+
+def read_extracted_skills(path, chunk_size=DEFAULT_CHUNK_SIZE, taxonomy=None):
+    """Chunks of (advert ids, [[(taxonomy skill, taxonomy id), ...] per advert])
+    from an extracted skills jsonl. taxonomy picks one taxonomy's skills from
+    a file extracted with several."""
+    with open(path, "r") as file:
+        lines = (line for line in file if line.strip())
+        while True:
+            chunk = [json.loads(line) for line in itertools.islice(lines, chunk_size)]
+            if not chunk:
+                return
+            advert_ids = [str(advert["id"]) for advert in chunk]
+            if taxonomy is not None:
+                chunk = [advert.get(taxonomy, {}) for advert in chunk]
+            yield advert_ids, [
+                [tuple(match) for _, match in advert.get("SKILL", [])] for advert in chunk
+            ]
+
+
+def read_advert_metadata(
+    path,
+    id_column="id",
+    sector_column="sector",
+    region_column="region",
+    knowledge_domain_column=None,
+):
+    """DataFrame of each advert's sector, region (and knowledge domain), indexed
+    on the advert id as a string"""
+    columns = [id_column, sector_column, region_column]
+    if knowledge_domain_column:
+        columns.append(knowledge_domain_column)
+    if path.endswith(".csv"):
+        metadata = pd.read_csv(path, usecols=columns)
+    else:
+        metadata = pd.read_json(path, lines=True)[columns]
+    metadata = metadata.rename(
+        columns={
+            sector_column: "sector",
+            region_column: "region",
+            knowledge_domain_column: "knowledge_domain",
+        }
+    )
+    metadata.index = metadata.pop(id_column).astype(str)
+    for column in ("sector", "region"):
+        metadata[column] = metadata[column].astype("category")
+    return metadata
+
+
+def advert_concept_matrix(advert_matches, concepts):
+    """Binary advert x concept csr matrix for a chunk of adverts' mapped skills"""
+    columns = [
+        [concepts.columns(*match) for match in matches] for matches in advert_matches
+    ]
+    lengths = [sum(len(c) for c in advert_columns) for advert_columns in columns]
+    flat_columns = [c for advert_columns in columns for c in advert_columns]
+    cols = np.concatenate(flat_columns) if flat_columns else np.zeros(0, dtype=np.int64)
+    rows = np.repeat(np.arange(len(advert_matches)), lengths)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(cols), dtype=np.int64), (rows, cols)),
+        shape=(len(advert_matches), len(concepts)),
+    )
+    # Duplicates were summed; an advert either mentions a concept or doesn't
+    matrix.data[:] = 1
+    return matrix
+
+
+def aggregate(
+    extracted_skills_path,
+    metadata,
+    hierarchy=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    taxonomy=None,
+):
+    """(concepts, sector counts, region counts, counts over all adverts) from
+    an extracted skills jsonl and the adverts' metadata"""
+    concepts = SkillConcepts(hierarchy)
+    sector_codes = metadata["sector"].cat.codes.to_numpy()
+    region_codes = metadata["region"].cat.codes.to_numpy()
+    sectors = SkillCounts(metadata["sector"].cat.categories)
+    regions = SkillCounts(metadata["region"].cat.categories)
+    total = SkillCounts(["all"])
+
+    for advert_ids, advert_matches in read_extracted_skills(
+        extracted_skills_path, chunk_size, taxonomy
+    ):
+        advert_concepts = advert_concept_matrix(advert_matches, concepts)
+        positions = metadata.index.get_indexer(advert_ids)
+        found = positions >= 0
+        sectors.add(np.where(found, sector_codes[positions], -1), advert_concepts)
+        regions.add(np.where(found, region_codes[positions], -1), advert_concepts)
+        total.add(np.zeros(len(advert_ids), dtype=np.int64), advert_concepts)
+
+    for counts in (sectors, regions, total):
+        counts.finish(len(concepts))
+    return concepts, sectors, regions, total
+
+
+def _top_labels(columns, values, labels, top_n):
+    """{label: value} of the top_n largest values, largest first"""
+    if len(values) > top_n:
+        top = np.argpartition(-values, top_n - 1)[:top_n]
+    else:
+        top = np.arange(len(values))
+    top = top[np.argsort(-values[top], kind="stable")]
+    top_labels = {}
+    for i in top:
+        # Keep the larger value if two concepts share a label
+        top_labels.setdefault(labels[columns[i]], float(values[i]))
+    return top_labels
+
+
+def top_skills_per_group(skill_counts, concepts, top_n=TOP_SKILLS_N, names=None):
+    """{group: {"num_ads", "top_skills", "top_skills_no_transversal",
+    "top_transversal_skills"}} as in the per sector and per region json; each
+    top skills dict is {skill group level: {skill or skill group: share of
+    the group's adverts}}. names limits this to those groups."""
+    options = dict(zip(TOP_SKILLS_KEYS, [None, False, True]))
+    masks = {
+        (key_name, level): concepts.mask(level, transversal)
+        for key_name, transversal in options.items()
+        for level in SKILL_LEVELS
+    }
+    proportions = skill_counts.proportions().tocsr()
+    labels = concepts.labels
+    groups = {}
+    for row, name in enumerate(skill_counts.names):
+        if skill_counts.num_ads[row] == 0 or (
+            names is not None and str(name) not in names
+        ):
+            continue
+        start, end = proportions.indptr[row], proportions.indptr[row + 1]
+        columns = proportions.indices[start:end]
+        values = proportions.data[start:end]
+        group = {"num_ads": int(skill_counts.num_ads[row])}
+        for key_name in TOP_SKILLS_KEYS:
+            group[key_name] = {}
+            for level in SKILL_LEVELS:
+                keep = masks[(key_name, level)][columns]
+                group[key_name][level] = _top_labels(
+                    columns[keep], values[keep], labels, top_n
+                )
+        groups[str(name)] = group
+    return groups
+
+
+def skill_group_proportions(total, concepts, top_n=SKILL_GROUP_TOP_N):
+    """{"skill group name (code)": {skill: share of all adverts}} with the most
+    common skills in each summary skill group, plus "all" skills"""
+    proportions = total.proportions().tocsr()
+    columns = proportions.indices
+    values = proportions.data
+    is_skill = concepts.mask("4")[columns]
+    columns, values = columns[is_skill], values[is_skill]
+
+    group_columns = {"all": np.arange(len(columns))}
+    positions = {}
+    for position, column in enumerate(columns):
+        for code in concepts.skill_groups[column]:
+            positions.setdefault(code, []).append(position)
+    for code in sorted(positions):
+        name = f"{concepts.hierarchy.name(code)} ({code})"
+        group_columns[name] = np.array(positions[code])
+
+    return {
+        name: {
+            label: round(value, 5)
+            for label, value in _top_labels(
+                columns[group], values[group], concepts.labels, top_n
+            ).items()
+        }
+        for name, group in group_columns.items()
+    }
+
+
+def sector_profiles(sectors, concepts, level=SIMILARITY_LEVEL):
+    """(names, sector x concept share matrix) of the sectors with adverts"""
+    has_adverts = np.flatnonzero(sectors.num_ads > 0)
+    profiles = sectors.proportions().tocsc()[:, concepts.mask(level)].tocsr()
+    return [str(sectors.names[i]) for i in has_adverts], profiles[has_adverts]
+
+
+def location_quotients(
+    regions,
+    concepts,
+    level=LOCATION_QUOTIENT_LEVEL,
+    min_adverts_per_skill=MIN_ADVERTS_PER_SKILL,
+):
+    """The location quotient table of the skill groups at level"""
+    columns = np.flatnonzero(concepts.mask(level))
+    region_counts = regions.counts.tocsc()[:, columns].tocoo()
+    names = np.asarray([str(name) for name in regions.names], dtype=object)
+    labels = np.asarray(concepts.labels, dtype=object)
+    counts = LocationQuotientCounts()
+    counts.add_adverts(names, regions.num_ads)
+    counts.add_counts(
+        names[region_counts.row], labels[columns[region_counts.col]], region_counts.data
+    )
+    return counts.location_quotients(min_adverts_per_skill)
+
+
+def sector_knowledge_domains(metadata):
+    """{sector: its adverts' most common knowledge domain}"""
+    return (
+        metadata.dropna(subset=["knowledge_domain"])
+        .groupby("sector", observed=True)["knowledge_domain"]
+        .agg(lambda domains: domains.value_counts().index[0])
+        .to_dict()
+    )
+
+
+def _write_json(data, output_folder, file_name):
+    with open(os.path.join(output_folder, file_name), "w") as file:
+        json.dump(data, file)
+
+
+def write_datasets(
+    concepts,
+    sectors,
+    regions,
+    total,
+    output_folder,
+    metadata=None,
+    top_k=TOP_K,
+    workers=0,
+):
+    """Write every streamlit_viz dataset to output_folder, with each sector's
+    top_k most similar sectors (computed in workers processes)"""
+    os.makedirs(output_folder, exist_ok=True)
+    _write_json(
+        skill_group_proportions(total, concepts), output_folder, SKILL_GROUP_FILE_NAME
+    )
+
+    sector_data = top_skills_per_group(sectors, concepts)
+    names, profiles = sector_profiles(sectors, concepts)
+    neighbours, edges = sector_similarities(names, profiles, top_k, workers=workers)
+    for name, similar in neighbours.items():
+        sector_data[name]["similar_sectors"] = similar
+    _write_json(sector_data, output_folder, SECTOR_FILE_NAME)
+    edges.to_csv(
+        os.path.join(output_folder, SIMILARITY_FILE_NAME), index=False
+    )
+
+    _write_json(top_skills_per_group(regions, concepts), output_folder, REGION_FILE_NAME)
+    location_quotients(regions, concepts).to_csv(
+        os.path.join(output_folder, LOCATION_QUOTIENT_FILE_NAME), index=False
+    )
+
+    if metadata is not None and "knowledge_domain" in metadata:
+        _write_json(
+            sector_knowledge_domains(metadata), output_folder, SECTOR_KD_FILE_NAME
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("extracted_skills_path", help="jsonl of extracted skills")
+    parser.add_argument("metadata_path", help="csv or jsonl of advert metadata")
+    parser.add_argument("output_folder")
+    parser.add_argument("--taxonomy_file", default=None)
+    parser.add_argument("--hier_mapper_file", default=None)
+    parser.add_argument(
+        "--taxonomy",
+        default=None,
+        help="Taxonomy to use from a file extracted with several (e.g. ESCO)",
+    )
+    parser.add_argument("--id_column", default="id")
+    parser.add_argument("--sector_column", default="sector")
+    parser.add_argument("--region_column", default="region")
+    parser.add_argument("--knowledge_domain_column", default=None)
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--top_k", type=int, default=TOP_K, help="Similar sectors kept per sector"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Processes comparing sector profiles (0 for this process)",
+    )
+    args = parser.parse_args()
+
+    metadata = read_advert_metadata(
+        args.metadata_path,
+        id_column=args.id_column,
+        sector_column=args.sector_column,
+        region_column=args.region_column,
+        knowledge_domain_column=args.knowledge_domain_column,
+    )
+    hierarchy = SkillHierarchy.from_files(args.taxonomy_file, args.hier_mapper_file)
+    concepts, sectors, regions, total = aggregate(
+        args.extracted_skills_path,
+        metadata,
+        hierarchy,
+        chunk_size=args.chunk_size,
+        taxonomy=args.taxonomy,
+    )
+    write_datasets(
+        concepts,
+        sectors,
+        regions,
+        total,
+        args.output_folder,
+        metadata,
+        top_k=args.top_k,
+        workers=args.workers,
+    )
+    print(
+        f"{int(total.num_ads[0])} adverts, {len(concepts)} skill concepts, "
+        f"datasets written to {args.output_folder}"
+    )
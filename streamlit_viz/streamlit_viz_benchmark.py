@@ -0,0 +1,419 @@
+"""Benchmark the dashboard's data loaders and chart builders on synthetic data at 1x to 1000x the sample size.
+
+    python streamlit_viz/streamlit_viz_benchmark.py --scales 1 10 100 --output results.json
+
+Synthetic datasets with the same file names and schemas as streamlit_viz/data
+are generated (once per scale, in --data_folder) with SCALE times the
+sample's sectors, regions and skills. Each benchmark runs in its own process
+under a memory limit, so a benchmark that runs out of memory at a large scale
+is recorded as failed instead of taking the machine down. For each one the
+wall time (median of --repeats runs, with the data and chart caches cleared
+before each), the peak traced memory and the bytes and number of memory
+blocks the call allocated that are still held after it (tracemalloc), and the
+process' peak RSS are recorded.
+
+Results are compared with a stored baseline (--baseline, written with
+--save_baseline on the same machine), and the run exits with an error if there
+is no baseline, or if a benchmark got slower, used more memory or made more
+allocations than the tolerances allow, or failed where the baseline didn't.
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import streamlit_viz_charts as charts
+from streamlit_viz_utils import CHART_CACHE, DATA_CACHE
+
+SCALES = [1, 10, 100, 1000]
+
+# Sizes of the sample datasets (scaled by SCALE)
+SAMPLE_SECTORS = 201
+SAMPLE_REGIONS = 29
+SAMPLE_SKILLS = 3000
+SAMPLE_SKILL_GROUPS = 10
+SAMPLE_LOCATION_QUOTIENT_SKILLS = 257
+SAMPLE_KNOWLEDGE_DOMAINS = 13
+# Entries per sector/region/skill group (not scaled)
+TOP_SKILLS_PER_LEVEL = 30
+SKILLS_PER_SKILL_GROUP = 20
+SIMILAR_SECTORS_PER_SECTOR = 201
+SIMILARITY_EDGES_PER_SECTOR = 101
+LOCATION_QUOTIENT_SKILLS_PER_REGION = 71
+
+SKILL_LEVELS = ["all", "0", "1", "2", "3", "4"]
+TOP_SKILLS_KEYS = ["top_skills", "top_skills_no_transversal", "top_transversal_skills"]
+
+DEFAULT_REPEATS = 5
+DEFAULT_MEMORY_LIMIT_MB = 8192
+# Allowed increase over the baseline before a benchmark counts as a regression
+DEFAULT_TIME_TOLERANCE = 0.25
+DEFAULT_MEMORY_TOLERANCE = 0.10
+
+DEFAULT_BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json"
+)
+
+
+def _write_json_items(file_name, items):
+    """Write a json object from (key, value) pairs one at a time, so large
+    datasets never have to be held in memory whole"""
+    with open(file_name, "w") as file:
+        file.write("{")
+        for i, (key, value) in enumerate(items):
+            file.write(("," if i else "") + json.dumps(key) + ":" + json.dumps(value))
+        file.write("}")
+
+
+def generate_data(data_folder, scale=1, seed=0):
+    """Write synthetic versions of every streamlit_viz/data dataset at scale
+    times the sample's size to data_folder"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_folder, exist_ok=True)
+    sectors = [f"Occupation {i}" for i in range(SAMPLE_SECTORS * scale)] + ["Other"]
+    regions = [f"Region {i}" for i in range(SAMPLE_REGIONS * scale)]
+    skills = np.array([f"skill {i}" for i in range(SAMPLE_SKILLS * scale)], dtype=object)
+
+    def top_skills():
+        return {
+            key_name: {
+                level: dict(
+                    zip(
+                        rng.choice(skills, TOP_SKILLS_PER_LEVEL, replace=False).tolist(),
+                        np.sort(rng.random(TOP_SKILLS_PER_LEVEL) / 3)[::-1].tolist(),
+                    )
+                )
+                for level in SKILL_LEVELS
+            }
+            for key_name in TOP_SKILLS_KEYS
+        }
+
+    num_similar = min(SIMILAR_SECTORS_PER_SECTOR, len(sectors) - 1)
+    offsets = rng.choice(np.arange(1, len(sectors)), num_similar, replace=False)
+
+    def sector_items():
+        for i, sector in enumerate(sectors):
+            similar = (i + offsets) % len(sectors)
+            yield sector, {
+                "num_ads": int(rng.integers(100, 3000)),
+                **top_skills(),
+                "similar_sectors": dict(
+                    zip(
+                        [sectors[j] for j in similar],
+                        (rng.random(num_similar) * 3).tolist(),
+                    )
+                ),
+            }
+
+    _write_json_items(os.path.join(data_folder, "per_sector_sample_updated.json"), sector_items())
+    _write_json_items(
+        os.path.join(data_folder, "top_skills_per_loc_sample.json"),
+        (
+            (region, {"num_ads": int(rng.integers(500, 9000)), **top_skills()})
+            for region in regions
+        ),
+    )
+
+    skill_groups = [f"Skill group {i} (S{i})" for i in range(SAMPLE_SKILL_GROUPS * scale)]
+    _write_json_items(
+        os.path.join(data_folder, "per_skill_group_proportions_sample.json"),
+        (
+            (
+                skill_group,
+                dict(
+                    zip(
+                        rng.choice(skills, SKILLS_PER_SKILL_GROUP, replace=False).tolist(),
+                        np.round(rng.random(SKILLS_PER_SKILL_GROUP) / 5, 5).tolist(),
+                    )
+                ),
+            )
+            for skill_group in ["all"] + skill_groups
+        ),
+    )
+
+    domains = [f"Knowledge domain {i}" for i in range(SAMPLE_KNOWLEDGE_DOMAINS)]
+    _write_json_items(
+        os.path.join(data_folder, "sector_2_kd_sample.json"),
+        ((sector, domains[i % len(domains)]) for i, sector in enumerate(sectors)),
+    )
+
+    # Each sector linked to the next SIMILARITY_EDGES_PER_SECTOR sectors (with
+    # itself), as many rows as the sample's all pairs at 1x
+    num_sectors = len(sectors) - 1
+    sources = np.repeat(np.arange(num_sectors), SIMILARITY_EDGES_PER_SECTOR)
+    targets = (sources + np.tile(np.arange(SIMILARITY_EDGES_PER_SECTOR), num_sectors)) % num_sectors
+    sector_names = np.array(sectors[:-1], dtype=object)
+    _write_csv(
+        os.path.join(data_folder, "lightweight_skill_similarity_between_sectors_sample.csv"),
+        {
+            "source": sector_names[sources],
+            "target": sector_names[targets],
+            "weight": np.where(sources == targets, 1.0, rng.beta(8, 38, len(sources))),
+        },
+    )
+
+    location_quotient_skills = np.array(
+        [f"skill group {i}" for i in range(SAMPLE_LOCATION_QUOTIENT_SKILLS * scale)],
+        dtype=object,
+    )
+    num_rows = len(regions) * LOCATION_QUOTIENT_SKILLS_PER_REGION
+    num_ads = rng.integers(650, 25000, len(regions))
+    row_regions = np.repeat(np.arange(len(regions)), LOCATION_QUOTIENT_SKILLS_PER_REGION)
+    skill_percent = rng.uniform(0.004, 0.36, num_rows)
+    location_quotident = rng.lognormal(0, 0.25, num_rows)
+    _write_csv(
+        os.path.join(data_folder, "top_skills_per_loc_quotident_sample.csv"),
+        {
+            "skill": rng.choice(location_quotient_skills, num_rows),
+            "skill_percent": skill_percent,
+            "region": np.array(regions, dtype=object)[row_regions],
+            "location_quotident": location_quotident,
+            "location_difference": skill_percent * (1 - 1 / location_quotident),
+            "location_change": location_quotident - 1,
+            "absolute_location_change": np.abs(location_quotident - 1),
+            "num_ads": num_ads[row_regions],
+            "num_ads_per_skill": np.maximum(
+                np.round(skill_percent * num_ads[row_regions]), 100.0
+            ),
+        },
+    )
+
+
+def _write_csv(file_name, columns):
+    pd.DataFrame(columns).to_csv(file_name, index=False)
+
+
+def _first_key(data):
+    return next(iter(data))
+
+
+# Each benchmark's setup loads its inputs (untimed) and returns the call to time
+
+
+def _common_skills_chart():
+    all_sector_data, sector_top_skills_index, *_ = charts.load_sector_data()
+    sector = _first_key(all_sector_data)
+    return lambda: charts.create_common_skills_chart(
+        sector_top_skills_index, "all", sector, trans_option="all skills"
+    )
+
+
+def _similar_sectors_text_chart():
+    all_sector_data, _, sector_distance_index, *_ = charts.load_sector_data()
+    sector = _first_key(all_sector_data)
+    return lambda: charts.create_similar_sectors_text_chart(sector_distance_index, sector)
+
+
+def _sector_skill_sim_network():
+    *_, similarity_network = charts.load_sector_data()
+    return lambda: charts.create_sector_skill_sim_network(similarity_network, 0.4)
+
+
+def _location_quotident_graph():
+    *_, loc_quotident_index = charts.load_regional_data()
+    region = loc_quotident_index.regions[0]
+    return lambda: charts.create_location_quotident_graph(loc_quotident_index, region)
+
+
+BENCHMARKS = {
+    "load_summary_data": lambda: charts.load_summary_data,
+    "load_sector_data": lambda: charts.load_sector_data,
+    "load_regional_data": lambda: charts.load_regional_data,
+    "create_common_skills_chart": _common_skills_chart,
+    "create_similar_sectors_text_chart": _similar_sectors_text_chart,
+    "create_sector_skill_sim_network": _sector_skill_sim_network,
+    "create_location_quotident_graph": _location_quotident_graph,
+}
+
+
+def _limit_memory(memory_limit_mb):
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def run_benchmark(name, data_folder, repeats=DEFAULT_REPEATS):
+    """{"wall_time", "peak_bytes", "retained_bytes", "allocated_blocks",
+    "max_rss_bytes"} of one benchmark (run in a fresh process, see run)"""
+    charts.data_folder = data_folder
+    call = BENCHMARKS[name]()
+
+    times = []
+    for _ in range(repeats):
+        DATA_CACHE.clear()
+        CHART_CACHE.clear()
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+
+    DATA_CACHE.clear()
+    CHART_CACHE.clear()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = call()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    retained = tracemalloc.take_snapshot().compare_to(before, "filename")
+    tracemalloc.stop()
+    del result
+    return {
+        "wall_time": statistics.median(times),
+        "peak_bytes": peak_bytes,
+        "retained_bytes": sum(stat.size_diff for stat in retained),
+        # The caches are empty when the call starts, so this is every block it
+        # allocated except those it freed again (which tracemalloc can't count)
+        "allocated_blocks": sum(stat.count_diff for stat in retained),
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def run(
+    scales=SCALES[:3],
+    benchmarks=None,
+    data_folder=None,
+    repeats=DEFAULT_REPEATS,
+    memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB,
+):
+    """{"<benchmark>@<scale>x": measurements, or {"error": ...} if it failed}"""
+    data_folder = data_folder or os.path.join(
+        tempfile.gettempdir(), "streamlit_viz_benchmark"
+    )
+    results = {}
+    for scale in scales:
+        scale_folder = os.path.join(data_folder, f"scale_{scale}")
+        if not os.path.exists(os.path.join(scale_folder, "per_sector_sample_updated.json")):
+            print(f"Generating {scale}x data in {scale_folder}")
+            generate_data(scale_folder, scale)
+        for name in benchmarks or BENCHMARKS:
+            key = f"{name}@{scale}x"
+            # A fresh process per benchmark, so peak memory and failures are its own
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_limit_memory,
+                initargs=(memory_limit_mb,),
+            ) as executor:
+                try:
+                    results[key] = executor.submit(
+                        run_benchmark, name, scale_folder, repeats
+                    ).result()
+                except (MemoryError, concurrent.futures.process.BrokenProcessPool) as e:
+                    results[key] = {"error": f"{type(e).__name__}: out of memory"}
+                except Exception as e:
+                    results[key] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"{key}: {format_result(results[key])}")
+    return results
+
+
+def format_result(result):
+    if "error" in result:
+        return f"FAILED ({result['error']})"
+    return (
+        f"{result['wall_time'] * 1000:.1f} ms, "
+        f"peak {result['peak_bytes'] / 2**20:.1f} MiB, "
+        f"{result['allocated_blocks']} blocks allocated"
+    )
+
+
+def compare(
+    results,
+    baseline,
+    time_tolerance=DEFAULT_TIME_TOLERANCE,
+    memory_tolerance=DEFAULT_MEMORY_TOLERANCE,
+):
+    """Descriptions of the regressions in results against baseline"""
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None or "error" in expected:
+            continue
+        if "error" in result:
+            regressions.append(f"{key} failed ({result['error']}), it passed in the baseline")
+            continue
+        for metric, tolerance in [
+            ("wall_time", time_tolerance),
+            ("peak_bytes", memory_tolerance),
+            ("allocated_blocks", memory_tolerance),
+        ]:
+            if metric in expected and result[metric] > expected[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{key} {metric} {result[metric]:.4g} is more than "
+                    f"{tolerance:.0%} over the baseline's {expected[metric]:.4g}"
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scales", type=int, nargs="+", default=SCALES[:3], choices=SCALES
+    )
+    parser.add_argument(
+        "--benchmarks", nargs="+", default=None, choices=list(BENCHMARKS)
+    )
+    parser.add_argument(
+        "--data_folder", default=None, help="Where to generate the synthetic data"
+    )
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument(
+        "--memory_limit_mb",
+        type=int,
+        default=DEFAULT_MEMORY_LIMIT_MB,
+        help="Address space limit for each benchmark (0 for none)",
+    )
+    parser.add_argument("--output", default=None, help="json file to write the results to")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument(
+        "--save_baseline", action="store_true", help="Save the results as the baseline"
+    )
+    parser.add_argument("--time_tolerance", type=float, default=DEFAULT_TIME_TOLERANCE)
+    parser.add_argument(
+        "--memory_tolerance", type=float, default=DEFAULT_MEMORY_TOLERANCE
+    )
+    args = parser.parse_args()
+
+    results = run(
+        args.scales,
+        args.benchmarks,
+        data_folder=args.data_folder,
+        repeats=args.repeats,
+        memory_limit_mb=args.memory_limit_mb,
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as file:
+                baseline = json.load(file)
+        baseline.update(results)
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            regressions = compare(
+                results,
+                json.load(file),
+                time_tolerance=args.time_tolerance,
+                memory_tolerance=args.memory_tolerance,
+            )
+        if regressions:
+            print("REGRESSIONS against " + args.baseline)
+            print("\n".join(regressions))
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+    else:
+        print(f"No baseline at {args.baseline}, run with --save_baseline to create one")
+        sys.exit(1)
@@ -0,0 +1,155 @@
+"""Columnar, memory-mappable bundle of the streamlit_viz csv datasets.
+
+Build the bundle from the csv files in streamlit_viz/data with:
+
+    python streamlit_viz/streamlit_viz_bundle.py
+
+Every csv table is stored column-wise as .npy arrays inside data/bundle:
+numeric columns are written with their own dtype and string columns as
+integer codes into that column's own set of categories. Tables are loaded
+as DataFrames backed by read-only memory maps, so no copy of the data is
+made in the process.
+
+Json files are left out: rebuilding nested dicts from flat arrays is slower
+than json.load and holds more memory, and the lookup indexes built from
+them are cached process-wide anyway (see load_derived).
+"""
+import argparse
+import json
+import os
+import shutil
+from fnmatch import fnmatch
+
+import numpy as np
+import pandas as pd
+
+BUNDLE_VERSION = 2
+BUNDLE_DIR_NAME = "bundle"
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+def _code_dtype(num_categories):
+    """Smallest integer type for category codes; matches pandas' Categorical
+    codes dtype so Categorical.from_codes does not copy the memory map"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if num_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _table_columns(df):
+    """{column name: (dtype, values, categories)}; string columns become
+    codes into their own categories (None for other columns)"""
+    columns = {}
+    for column_name, column in df.items():
+        if column.dtype == object:
+            codes, categories = pd.factorize(column.map(str, na_action="ignore"))
+            codes = codes.astype(_code_dtype(len(categories)))
+            columns[column_name] = ("str", codes, categories.tolist())
+        else:
+            columns[column_name] = (str(column.dtype), column.to_numpy(), None)
+    return columns
+
+
+def build_bundle(data_folder, bundle_folder=None):
+    """Convert every csv file in data_folder into a versioned bundle"""
+    bundle_folder = bundle_folder or os.path.join(data_folder, BUNDLE_DIR_NAME)
+    tmp_folder = bundle_folder + ".tmp"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+
+    datasets = {}
+    csv_names = [name for name in sorted(os.listdir(data_folder)) if fnmatch(name, "*.csv")]
+    for dataset_num, file_name in enumerate(csv_names):
+        file_path = os.path.join(data_folder, file_name)
+        column_meta = {}
+        for column_num, (column_name, (dtype, values, categories)) in enumerate(
+            _table_columns(pd.read_csv(file_path)).items()
+        ):
+            array_file = f"{dataset_num}_{column_num}.npy"
+            np.save(os.path.join(tmp_folder, array_file), values)
+            column_meta[column_name] = {"dtype": dtype, "file": array_file}
+            if categories is not None:
+                categories_file = f"{dataset_num}_{column_num}.json"
+                with open(os.path.join(tmp_folder, categories_file), "w") as file:
+                    json.dump(categories, file)
+                column_meta[column_name]["categories"] = categories_file
+        stat = os.stat(file_path)
+        datasets[file_name] = {
+            "kind": "table",
+            "source": {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size},
+            "columns": column_meta,
+        }
+
+    with open(os.path.join(tmp_folder, MANIFEST_FILE_NAME), "w") as file:
+        json.dump({"version": BUNDLE_VERSION, "datasets": datasets}, file, indent=1)
+
+    # Swap the finished bundle in so readers never see a half-written one
+    shutil.rmtree(bundle_folder, ignore_errors=True)
+    os.rename(tmp_folder, bundle_folder)
+    return bundle_folder
+
+
+class Bundle:
+    """Read-only view of a built bundle; arrays are opened as memory maps"""
+
+    def __init__(self, bundle_folder):
+        self.folder = bundle_folder
+        with open(os.path.join(bundle_folder, MANIFEST_FILE_NAME), "r") as file:
+            manifest = json.load(file)
+        if manifest["version"] != BUNDLE_VERSION:
+            raise ValueError(
+                f"{bundle_folder} is bundle version {manifest['version']}, expected {BUNDLE_VERSION}"
+            )
+        self.datasets = manifest["datasets"]
+
+    def is_current(self, file_name, data_folder):
+        """Whether the bundled copy of file_name matches the source file (if any)"""
+        entry = self.datasets.get(file_name)
+        if entry is None:
+            return False
+        source_path = os.path.join(data_folder, file_name)
+        if not os.path.exists(source_path):
+            return True
+        stat = os.stat(source_path)
+        return (stat.st_mtime_ns, stat.st_size) == (
+            entry["source"]["mtime_ns"],
+            entry["source"]["size"],
+        )
+
+    def column(self, file_name, column_name):
+        meta = self.datasets[file_name]["columns"][column_name]
+        return np.load(os.path.join(self.folder, meta["file"]), mmap_mode="r")
+
+    def categories(self, file_name, column_name):
+        meta = self.datasets[file_name]["columns"][column_name]
+        with open(os.path.join(self.folder, meta["categories"]), "r") as file:
+            return pd.Index(json.load(file), dtype=object)
+
+    def load(self, file_name):
+        """The table as a DataFrame of memory-mapped (read-only) columns"""
+        columns = {}
+        for column_name, meta in self.datasets[file_name]["columns"].items():
+            values = self.column(file_name, column_name)
+            if meta["dtype"] == "str":
+                values = pd.Categorical.from_codes(
+                    values, categories=self.categories(file_name, column_name)
+                )
+            columns[column_name] = values
+        # With copy=False pandas (1.3, as pinned, and 2.x) keeps each array as
+        # its own block instead of consolidating same-dtype columns into a
+        # copy; tests/test_streamlit_viz_utils.py checks the memory is shared
+        return pd.DataFrame(columns, copy=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--data_folder",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"),
+    )
+    parser.add_argument("--bundle_folder", default=None)
+    args = parser.parse_args()
+
+    bundle_folder = build_bundle(args.data_folder, args.bundle_folder)
+    print(f"Bundle version {BUNDLE_VERSION} written to {bundle_folder}")
@@ -0,0 +1,466 @@
+"""Data loaders and chart builders of the blog, importable without drawing the
+page: streamlit_viz.py draws them and streamlit_viz_benchmark.py times them.
+The loaders read from data_folder."""
+import os
+import sys
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+import altair as alt
+
+from streamlit_viz_utils import (
+    CHART_CACHE,
+    DATA_CACHE,
+    configure_plots,
+    load_data,
+    load_derived,
+    memoize_chart,
+)
+from streamlit_viz_index import (
+    RegionPartitionIndex,
+    SectorDistanceIndex,
+    build_skill_group_index,
+    build_top_skills_index,
+)
+from streamlit_viz_network import build_similarity_network, percentage_job_adverts
+
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+# The stage timings are shared with the app, in shared/stage_timings.py
+SHARED_DIR = os.path.join(PROJECT_DIR, "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.append(SHARED_DIR)
+from stage_timings import timings_for
+
+TIMINGS = timings_for("DASHBOARD")
+data_folder = os.path.join(PROJECT_DIR, "streamlit_viz/data")
+
+chart_title_font_size = 14
+
+@TIMINGS.timed(cache=DATA_CACHE)
+def load_summary_data():
+
+    file_name = os.path.join(
+        data_folder,
+        "per_skill_group_proportions_sample.json",
+    )
+    top_skills_by_skill_groups = load_data(file_name)
+    skill_group_index = load_derived(file_name, build_skill_group_index)
+
+    return top_skills_by_skill_groups, skill_group_index
+
+
+@TIMINGS.timed(cache=DATA_CACHE)
+def load_sector_data():
+
+    sector_file_name = os.path.join(
+        data_folder, "per_sector_sample_updated.json"
+    )
+    all_sector_data = load_data(sector_file_name)
+    all_sector_data = {k: v for k, v in all_sector_data.items() if k != "Other"}
+    sector_top_skills_index = load_derived(sector_file_name, build_top_skills_index)
+
+    percentage_job_adverts_per_sector = percentage_job_adverts(all_sector_data)
+
+    # Sector to sector distances: prefer the standalone matrix, which lets the
+    # per sector json drop its similar_sectors dicts
+    distances_file_name = os.path.join(data_folder, "sector_distances_sample.npz")
+    if os.path.exists(distances_file_name):
+        sector_distance_index = load_derived(
+            distances_file_name, SectorDistanceIndex.from_arrays
+        )
+    else:
+        sector_distance_index = load_derived(
+            sector_file_name, SectorDistanceIndex.from_sector_data
+        )
+
+    similarity_file_name = os.path.join(
+        data_folder,
+        "lightweight_skill_similarity_between_sectors_sample.csv",
+    )
+    kd_file_name = os.path.join(data_folder, "sector_2_kd_sample.json")
+
+    # Built once per process; the threshold slider only slices it
+    similarity_network = load_derived(
+        (similarity_file_name, kd_file_name, sector_file_name),
+        build_similarity_network,
+    )
+
+    return (
+        all_sector_data,
+        sector_top_skills_index,
+        sector_distance_index,
+        percentage_job_adverts_per_sector,
+        similarity_network,
+    )
+
+
+@TIMINGS.timed(cache=DATA_CACHE)
+def load_regional_data():
+
+    file_name = os.path.join(
+        data_folder, "top_skills_per_loc_sample.json"
+    )
+    all_region_data = load_data(file_name)
+    region_top_skills_index = load_derived(file_name, build_top_skills_index)
+
+    file_name = os.path.join(
+        data_folder,
+        "top_skills_per_loc_quotident_sample.csv",
+    )
+
+    loc_quotident_index = load_derived(file_name, RegionPartitionIndex)
+
+    return (
+        all_region_data,
+        region_top_skills_index,
+        loc_quotident_index,
+    )
+
+
+@TIMINGS.timed(cache=CHART_CACHE)
+@memoize_chart
+def create_sector_skill_sim_network(similarity_network, sim_thresh, strategy="threshold"):
+    from streamlit_agraph import Config
+
+    nodes, edges = similarity_network.graph(sim_thresh, strategy=strategy)
+    knowledge_domain_colors = similarity_network.knowledge_domain_colours
+
+    config = Config(
+        width=1000,
+        height=500,
+        directed=False,
+        nodeHighlightBehavior=True,
+        collapsible=True,
+    )
+
+    # Legend (is actually an altair plot)
+    legend_df = pd.DataFrame(
+        {
+            "x": [
+                i
+                for i, v in enumerate(
+                    np.array_split(list(knowledge_domain_colors.keys()), 3)
+                )
+                for ii, vv in enumerate(v)
+            ],
+            "y": [
+                ii
+                for i, v in enumerate(
+                    np.array_split(list(knowledge_domain_colors.keys()), 3)
+                )
+                for ii, vv in enumerate(v)
+            ],
+            "value": list(knowledge_domain_colors.keys()),
+            "color": list(knowledge_domain_colors.values()),
+        }
+    )
+
+    legend_chart = (
+        alt.Chart(legend_df, title="Broad occupational groups")
+        .mark_circle(size=150)
+        .encode(
+            x=alt.X("x", axis=alt.Axis(labels=False, grid=False), title=""),
+            y=alt.Y("y", axis=alt.Axis(labels=False, grid=False), title=""),
+            color=alt.Color(
+                "value",
+                scale=alt.Scale(
+                    domain=list(knowledge_domain_colors.keys()),
+                    range=list(knowledge_domain_colors.values()),
+                ),
+                legend=None,
+            ),
+            tooltip=alt.value(None)
+        )
+        .properties(height=200)
+    )
+
+    legend_text = (
+        alt.Chart(legend_df)
+        .mark_text(
+            align="left",
+            baseline="middle",
+            fontSize=12,
+            color="black",
+            dx=10,
+            font="Century Gothic",
+        )
+        .encode(x="x", y="y", text="value", tooltip=alt.value(None))
+    )
+
+    legend_chart = legend_chart + legend_text
+
+    configure_plots(legend_chart)
+
+    return nodes, edges, config, legend_chart.configure_title(fontSize=chart_title_font_size)
+
+
+@TIMINGS.timed(cache=CHART_CACHE)
+@memoize_chart
+def create_similar_sectors_text_chart(sector_distance_index, sector):
+    from colour import Color
+
+    # Up to ten closest sectors (smaller Euclid dist is closer), ranked when the
+    # index was built; fewer when fewer neighbours were kept or "Other" was among them
+    similar_sectors, euclid_dists, similarity_buckets = sector_distance_index.most_similar(
+        sector
+    )
+    # Two columns of five, filled top to bottom
+    rows = range(len(similar_sectors))
+
+    most_similar_color = Color("green")
+    least_similar_color = Color("red")
+    similarity_colors = {
+        sim_value / 10: str(c.hex)
+        for sim_value, c in enumerate(
+            list(most_similar_color.range_to(least_similar_color, 10))
+        )
+    }
+
+    similar_sectors_text = pd.DataFrame(
+        {
+            "x": [num // 5 for num in rows],
+            "y": [5 - num % 5 for num in rows],
+            "value": [f"{num+1}. {similar_sectors[num]}" for num in rows],
+            "color": similarity_buckets,
+            "sim_score": euclid_dists,
+        }
+    )
+
+    circle_chart = (
+        alt.Chart(similar_sectors_text, title="Most similar occupations")
+        .mark_circle(size=100)
+        .encode(
+            x=alt.X("x", axis=alt.Axis(labels=False, grid=False), title=""),
+            y=alt.Y("y", axis=alt.Axis(labels=False, grid=False), title=""),
+            text="value",
+            tooltip=[alt.Tooltip("sim_score", title="Similarity score", format=".2")],
+            color=alt.Color(
+                "color",
+                scale=alt.Scale(
+                    domain=list(similarity_colors.keys()),
+                    range=list(similarity_colors.values()),
+                ),
+                legend=None,
+            ),
+        )
+        .properties(height=200)
+    )
+
+    text_chart = (
+        alt.Chart(similar_sectors_text, title="Most similar occupations")
+        .mark_text(align="left", baseline="middle", fontSize=16, dx=10, color="black")
+        .encode(
+            x=alt.X("x", axis=alt.Axis(labels=False, grid=False), title=""),
+            y=alt.Y("y", axis=alt.Axis(labels=False, grid=False), title=""),
+            text="value",
+            tooltip=[alt.Tooltip("sim_score", title="Similarity score", format=".2")],
+        )
+        .properties(height=200)
+    )
+
+    similar_sectors_colors = pd.DataFrame(
+        {
+            "x": [0, 0, 0, 0],
+            "y": [0, 0, 0, 0],
+            "color": ["#008000", "#72aa00", "#d58e00", "#f00"],
+            "sim_type": [
+                "Very similar",
+                "Quite similar",
+                "Somewhat similar",
+                "Not similar",
+            ],
+        }
+    )
+
+    legend_chart = (
+        alt.Chart(similar_sectors_colors)
+        .mark_circle(size=0)
+        .encode(
+            x=alt.X("x", axis=alt.Axis(labels=False, grid=False), title=""),
+            y=alt.Y("y", axis=alt.Axis(labels=False, grid=False), title=""),
+            color=alt.Color(
+                "sim_type",
+                scale=alt.Scale(
+                    domain=list(
+                        dict(
+                            zip(
+                                similar_sectors_colors["sim_type"],
+                                similar_sectors_colors["color"],
+                            )
+                        ).keys()
+                    ),
+                    range=list(
+                        dict(
+                            zip(
+                                similar_sectors_colors["sim_type"],
+                                similar_sectors_colors["color"],
+                            )
+                        ).values()
+                    ),
+                ),
+                legend=alt.Legend(title=""),
+            ),
+        )
+        .properties(height=200)
+    )
+
+    base = circle_chart+text_chart
+
+    configure_plots(base)
+
+    return base.configure_title(fontSize=chart_title_font_size), legend_chart
+
+
+@TIMINGS.timed(cache=CHART_CACHE)
+@memoize_chart
+def create_common_skills_chart_by_skill_groups(skill_group_index, skill_group, label_limit=500):
+    plot_title = f"Most common skills in {skill_group} skill group"
+    if skill_group == "all":
+        plot_title += "s"
+
+    # Already ranked and cut to the top 10 when the index was built
+    top_skills = skill_group_index.frame(skill_group, "skill")
+
+    common_skills_chart = (
+        alt.Chart(top_skills)
+        .mark_bar(size=10, opacity=0.8, color="#0000FF")
+        .encode(
+            y=alt.Y("skill", sort=None, axis=alt.Axis(title=None, labelLimit=5000)),
+            x=alt.X(
+                "percent:Q",
+                axis=alt.Axis(
+                    title="Percentage of job adverts that mention this skill at least once",
+                    format="%",
+                ),
+            ),
+            tooltip=[alt.Tooltip("percent", title="Percentage", format=".1%")],
+        )
+        .properties(
+            title=plot_title,
+            # height=100,
+            width=75,
+        )
+    )
+
+    configure_plots(common_skills_chart)
+
+    return common_skills_chart.configure_title(
+        fontSize=chart_title_font_size
+    ).configure_axis(labelLimit=label_limit)
+
+
+@TIMINGS.timed(cache=CHART_CACHE)
+@memoize_chart
+def create_common_skills_chart(
+    top_skills_index, skill_group_level, sector, trans_option, label_limit=500
+):
+
+    skill_group_select_text = {
+        "all": "skills or skill groups",
+        "0": "skill groups",
+        "1": "skill groups",
+        "2": "skill groups",
+        "3": "skill groups",
+        "4": "skill",
+    }
+
+    if trans_option == 'no transversal skills':
+        key_name = "top_skills_no_transversal"
+    elif trans_option == 'only transversal skills':
+        key_name = "top_transversal_skills"
+    else:
+        key_name = "top_skills"
+
+    # Already ranked and cut to the top 10 when the index was built
+    top_skills = top_skills_index.frame((sector, key_name, skill_group_level), "sector")
+
+    common_skills_chart = (
+        alt.Chart(top_skills)
+        .mark_bar(size=10, opacity=0.8, color="#0000FF")
+        .encode(
+            y=alt.Y("sector", sort=None, axis=alt.Axis(title=None, labelLimit=5000)),
+            x=alt.X(
+                "percent:Q",
+                axis=alt.Axis(
+                    title="Percentage of job adverts with this skill", format="%"
+                ),
+            ),
+            tooltip=[alt.Tooltip("percent", title="Percentage", format=".1%")],
+        )
+        .properties(
+            title={
+                "text": [
+                    f"Most common {skill_group_select_text[skill_group_level]}",
+                    f' for "{sector}"',
+                ],
+                "color": "Black",
+            },
+            # height=100,
+            width=75,
+        )
+    )
+
+    configure_plots(common_skills_chart)
+
+    return common_skills_chart.configure_title(
+        fontSize=chart_title_font_size
+    ).configure_axis(labelLimit=label_limit)
+
+
+@TIMINGS.timed(cache=CHART_CACHE)
+@memoize_chart
+def create_location_quotident_graph(loc_quotident_index, location, label_limit=300):
+
+    # Rows with skill_percent >= 0.05, presorted by absolute_location_change
+    geo_df = loc_quotident_index.top(location, 15).copy()
+    geo_df["skill_percent"] = round(geo_df["skill_percent"] * 100, 2)
+
+    base = (
+        alt.Chart(geo_df)
+        .mark_point(size=10, opacity=0.8, color="#0000FF", filled=True)
+        .encode(
+            y=alt.Y("skill", sort="-x", axis=alt.Axis(title=None, labelLimit=1000)),
+            x=alt.X(
+                "location_quotident",
+                axis=alt.Axis(title="Location Quotient"),
+            ),
+            size=alt.Size(
+                "skill_percent:Q",
+                title=["Percentage of job adverts", " that mention at least", " 1 skill from this group (%)"],
+            ),
+            color=alt.Color(
+                "location_change",
+                scale=alt.Scale(domainMid=0, scheme="redblue"),
+                legend=None,
+            ),
+            tooltip=[
+                alt.Tooltip(
+                    "skill_percent:Q",
+                    title="% of job adverts with this skill group",
+                    format=",.2f",
+                ),
+                alt.Tooltip(
+                    "location_change",
+                    title="Location Quotient Change",
+                    format=",.2f",
+                ),
+            ],
+        )
+        .properties(
+            title=f'Skill Intensity in "{location}"',
+        )
+    )
+
+    vline = (
+        alt.Chart(pd.DataFrame({"location_quotident": [1], "color": ["red"]}))
+        .mark_rule(opacity=0.8)
+        .encode(x="location_quotident", color=alt.Color("color:N", scale=None))
+    )
+
+    base_line = base + vline
+    configure_plots(base_line)
+
+    return base_line.configure_title(fontSize=chart_title_font_size).configure_axis(
+        labelLimit=label_limit
+    )
@@ -0,0 +1,298 @@
+"""Fold a new batch of extracted skills into stored counts and refresh the streamlit_viz datasets.
+
+    python streamlit_viz/streamlit_viz_incremental.py skills_2023_06.jsonl adverts_2023_06.csv streamlit_viz/data \\
+        --taxonomy_file esco_data_formatted.csv --hier_mapper_file esco_hier_mapper.json
+
+The datasets streamlit_viz_aggregate.py writes are percentages, which can't
+be added up. This keeps the counts behind them in <output_folder>/aggregates
+instead: adverts per sector and region, adverts per sector/region and skill
+concept, adverts per sector and knowledge domain, and each sector's nearest
+sectors. A new batch (e.g. a month of adverts, with its own metadata file)
+is aggregated on its own and merged into the counts, so a refresh costs the
+size of the batch rather than of the whole history:
+
+- only sectors and regions with adverts in the batch have their top skills
+  recomputed, the rest are kept from the existing json files
+- sector similarities are updated with update_top_k_neighbours, comparing
+  the changed sectors with every sector but the others only with them
+- location quotients and skill group proportions are derived again from
+  the stored counts, whose size depends on the number of regions, sectors
+  and skills, not on the number of adverts
+
+Batches are recorded by name (the skills file name by default), and adding
+the same batch twice is refused.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from streamlit_viz_aggregate import (
+    DEFAULT_CHUNK_SIZE,
+    LOCATION_QUOTIENT_FILE_NAME,
+    REGION_FILE_NAME,
+    SECTOR_FILE_NAME,
+    SECTOR_KD_FILE_NAME,
+    SKILL_GROUP_FILE_NAME,
+    SkillConcepts,
+    SkillCounts,
+    SkillHierarchy,
+    _write_json,
+    aggregate,
+    location_quotients,
+    read_advert_metadata,
+    sector_profiles,
+    skill_group_proportions,
+    top_skills_per_group,
+)
+from streamlit_viz_similarity import (
+    SIMILARITY_FILE_NAME,
+    TOP_K,
+    similar_sectors,
+    similarity_edges,
+    update_top_k_neighbours,
+)
+
+STATE_FOLDER_NAME = "aggregates"
+COUNTS_FILE_NAME = "counts.npz"
+STATE_FILE_NAME = "state.json"
+
+NEIGHBOUR_METRICS = ["euclidean", "cosine"]
+
+
+class AggregateStore:
+    """Mergeable counts behind the streamlit_viz datasets, saved in state_folder"""
+
+    def __init__(self, state_folder, hierarchy=None):
+        self.state_folder = state_folder
+        self.hierarchy = hierarchy or SkillHierarchy()
+        self.concepts = SkillConcepts(self.hierarchy)
+        self.sectors = SkillCounts([])
+        self.regions = SkillCounts([])
+        self.total = SkillCounts([])
+        self.knowledge_domains = {}
+        self.batches = []
+        self.neighbours = {
+            metric: (np.zeros((0, 0), dtype=np.int32), np.zeros((0, 0)))
+            for metric in NEIGHBOUR_METRICS
+        }
+
+    @classmethod
+    def load(cls, state_folder, hierarchy=None):
+        """The store saved in state_folder, or an empty one"""
+        store = cls(state_folder, hierarchy)
+        state_path = os.path.join(state_folder, STATE_FILE_NAME)
+        if not os.path.exists(state_path):
+            return store
+        with open(state_path, "r") as file:
+            state = json.load(file)
+        store.concepts = SkillConcepts.from_state(state["concepts"], store.hierarchy)
+        store.knowledge_domains = state["knowledge_domains"]
+        store.batches = state["batches"]
+        with np.load(os.path.join(state_folder, COUNTS_FILE_NAME)) as arrays:
+            store.sectors = SkillCounts.from_arrays(arrays, "sectors")
+            store.regions = SkillCounts.from_arrays(arrays, "regions")
+            store.total = SkillCounts.from_arrays(arrays, "total")
+            store.neighbours = {
+                metric: (arrays[f"{metric}_indices"], arrays[f"{metric}_values"])
+                for metric in NEIGHBOUR_METRICS
+            }
+        return store
+
+    def save(self):
+        os.makedirs(self.state_folder, exist_ok=True)
+        arrays = {
+            **self.sectors.to_arrays("sectors"),
+            **self.regions.to_arrays("regions"),
+            **self.total.to_arrays("total"),
+        }
+        for metric, (indices, values) in self.neighbours.items():
+            arrays[f"{metric}_indices"] = indices
+            arrays[f"{metric}_values"] = values
+        # Write both files before replacing either, so a failed save leaves
+        # the previous state as it was
+        counts_path = os.path.join(self.state_folder, COUNTS_FILE_NAME)
+        state_path = os.path.join(self.state_folder, STATE_FILE_NAME)
+        with open(counts_path + ".tmp", "wb") as file:
+            np.savez(file, **arrays)
+        with open(state_path + ".tmp", "w") as file:
+            json.dump(
+                {
+                    "concepts": self.concepts.to_state(),
+                    "knowledge_domains": self.knowledge_domains,
+                    "batches": self.batches,
+                },
+                file,
+            )
+        os.replace(counts_path + ".tmp", counts_path)
+        os.replace(state_path + ".tmp", state_path)
+
+    def add_batch(
+        self,
+        extracted_skills_path,
+        metadata,
+        batch_name=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        taxonomy=None,
+    ):
+        """Merge a batch of extracted skills (with the metadata of its adverts)
+        into the counts, returning {"sectors": [...], "regions": [...]} with
+        the names of the sectors and regions that changed"""
+        batch_name = batch_name or os.path.basename(extracted_skills_path)
+        if batch_name in self.batches:
+            raise ValueError(f"Batch {batch_name} has already been added")
+        concepts, sectors, regions, total = aggregate(
+            extracted_skills_path,
+            metadata,
+            self.hierarchy,
+            chunk_size=chunk_size,
+            taxonomy=taxonomy,
+        )
+        columns = self.concepts.merge(concepts)
+        changed = {
+            "sectors": self.sectors.merge(sectors, columns),
+            "regions": self.regions.merge(regions, columns),
+        }
+        self.total.merge(total, columns)
+        for counts in (self.sectors, self.regions, self.total):
+            counts.finish(len(self.concepts))
+
+        if "knowledge_domain" in metadata:
+            domain_counts = (
+                metadata.dropna(subset=["knowledge_domain"])
+                .groupby(["sector", "knowledge_domain"], observed=True)
+                .size()
+            )
+            for (sector, domain), num_ads in domain_counts.items():
+                sector_domains = self.knowledge_domains.setdefault(str(sector), {})
+                sector_domains[str(domain)] = sector_domains.get(str(domain), 0) + int(
+                    num_ads
+                )
+        self.batches.append(batch_name)
+        return changed
+
+    def update_neighbours(self, changed_sectors, top_k=TOP_K, workers=0):
+        """Update each sector's top_k nearest sectors after changed_sectors'
+        skill profiles have changed, returning the sector names"""
+        names, profiles = sector_profiles(self.sectors, self.concepts)
+        changed_sectors = set(changed_sectors)
+        changed = [i for i, name in enumerate(names) if name in changed_sectors]
+        k = min(top_k, max(len(names) - 1, 0))
+        for metric, (indices, values) in self.neighbours.items():
+            if indices.shape[1] != k:
+                # Fewer neighbours were kept than are wanted now, so start again
+                indices, values = indices[:0], values[:0]
+            self.neighbours[metric] = update_top_k_neighbours(
+                profiles, changed, indices, values, metric, top_k, workers=workers
+            )
+        return names
+
+    def write_datasets(self, output_folder, changed, top_k=TOP_K, workers=0):
+        """Write every streamlit_viz dataset to output_folder, recomputing the
+        top skills only of the changed sectors and regions"""
+        os.makedirs(output_folder, exist_ok=True)
+        _write_json(
+            skill_group_proportions(self.total, self.concepts),
+            output_folder,
+            SKILL_GROUP_FILE_NAME,
+        )
+
+        names = self.update_neighbours(changed["sectors"], top_k, workers)
+        sector_data = _read_json(output_folder, SECTOR_FILE_NAME)
+        sector_data.update(
+            top_skills_per_group(
+                self.sectors,
+                self.concepts,
+                names=_stale(sector_data, changed["sectors"], names),
+            )
+        )
+        indices, distances = self.neighbours["euclidean"]
+        for name, similar in similar_sectors(names, indices, distances).items():
+            sector_data[name]["similar_sectors"] = similar
+        _write_json(sector_data, output_folder, SECTOR_FILE_NAME)
+        similarity_edges(names, *self.neighbours["cosine"]).to_csv(
+            os.path.join(output_folder, SIMILARITY_FILE_NAME), index=False
+        )
+
+        region_data = _read_json(output_folder, REGION_FILE_NAME)
+        region_data.update(
+            top_skills_per_group(
+                self.regions,
+                self.concepts,
+                names=_stale(region_data, changed["regions"], self.regions.names),
+            )
+        )
+        _write_json(region_data, output_folder, REGION_FILE_NAME)
+        location_quotients(self.regions, self.concepts).to_csv(
+            os.path.join(output_folder, LOCATION_QUOTIENT_FILE_NAME), index=False
+        )
+
+        if self.knowledge_domains:
+            _write_json(
+                {
+                    sector: max(domains, key=domains.get)
+                    for sector, domains in self.knowledge_domains.items()
+                },
+                output_folder,
+                SECTOR_KD_FILE_NAME,
+            )
+
+
+def _read_json(output_folder, file_name):
+    try:
+        with open(os.path.join(output_folder, file_name), "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def _stale(existing_data, changed_names, all_names):
+    """Names to recompute: the changed ones and any missing from existing_data"""
+    return set(changed_names) | {
+        str(name) for name in all_names if str(name) not in existing_data
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("extracted_skills_path", help="jsonl of extracted skills")
+    parser.add_argument("metadata_path", help="csv or jsonl of the batch's advert metadata")
+    parser.add_argument("output_folder")
+    parser.add_argument("--batch_name", default=None)
+    parser.add_argument("--taxonomy_file", default=None)
+    parser.add_argument("--hier_mapper_file", default=None)
+    parser.add_argument("--taxonomy", default=None)
+    parser.add_argument("--id_column", default="id")
+    parser.add_argument("--sector_column", default="sector")
+    parser.add_argument("--region_column", default="region")
+    parser.add_argument("--knowledge_domain_column", default=None)
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--top_k", type=int, default=TOP_K)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    metadata = read_advert_metadata(
+        args.metadata_path,
+        id_column=args.id_column,
+        sector_column=args.sector_column,
+        region_column=args.region_column,
+        knowledge_domain_column=args.knowledge_domain_column,
+    )
+    store = AggregateStore.load(
+        os.path.join(args.output_folder, STATE_FOLDER_NAME),
+        SkillHierarchy.from_files(args.taxonomy_file, args.hier_mapper_file),
+    )
+    changed = store.add_batch(
+        args.extracted_skills_path,
+        metadata,
+        batch_name=args.batch_name,
+        chunk_size=args.chunk_size,
+        taxonomy=args.taxonomy,
+    )
+    store.write_datasets(args.output_folder, changed, args.top_k, args.workers)
+    store.save()
+    print(
+        f"Added {store.batches[-1]}: {len(changed['sectors'])} sectors and "
+        f"{len(changed['regions'])} regions changed, {len(store.batches)} batches in total"
+    )
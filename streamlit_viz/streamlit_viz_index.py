@@ -0,0 +1,188 @@
+"""Lookup structures built once per dataset so chart builders don't re-sort on every rerun.
+
+Build them through load_derived (streamlit_viz_utils) so they are shared by
+all sessions and rebuilt only when the underlying data file changes.
+"""
+import numpy as np
+import pandas as pd
+
+TOP_N = 10
+
+TOP_SKILLS_KEYS = ["top_skills", "top_skills_no_transversal", "top_transversal_skills"]
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+class TopSkillsIndex:
+    """Ranked top-N (skill, percent) arrays for every key, most common first"""
+
+    def __init__(self, top_n=TOP_N):
+        self.top_n = top_n
+        self._ranked = {}
+
+    def add(self, key, skill_percents):
+        skills = np.array(list(skill_percents.keys()), dtype=object)
+        percents = np.fromiter(
+            skill_percents.values(), dtype=np.float64, count=len(skill_percents)
+        )
+        if len(percents) > self.top_n:
+            top = np.argpartition(-percents, self.top_n - 1)[: self.top_n]
+        else:
+            top = np.arange(len(percents))
+        top = top[np.argsort(-percents[top], kind="stable")]
+        self._ranked[key] = (_readonly(skills[top]), _readonly(percents[top]))
+
+    def top(self, key):
+        """(skills, percents) arrays for key, sorted by descending percent"""
+        return self._ranked[key]
+
+    def frame(self, key, label_column):
+        skills, percents = self._ranked[key]
+        return pd.DataFrame({"percent": percents, label_column: skills})
+
+    def __contains__(self, key):
+        return key in self._ranked
+
+    def __len__(self):
+        return len(self._ranked)
+
+
+def build_skill_group_index(top_skills_by_skill_groups, top_n=TOP_N):
+    """Index keyed on skill group, from {skill_group: {skill: percent}}"""
+    index = TopSkillsIndex(top_n)
+    for skill_group, skill_percents in top_skills_by_skill_groups.items():
+        index.add(skill_group, skill_percents)
+    return index
+
+
+def build_top_skills_index(all_data, top_n=TOP_N):
+    """Index keyed on (sector or region, top skills key, skill group level),
+    from the per sector / per region data"""
+    index = TopSkillsIndex(top_n)
+    for name, data in all_data.items():
+        for key_name in TOP_SKILLS_KEYS:
+            for skill_group_level, skill_percents in data.get(key_name, {}).items():
+                index.add((name, key_name, skill_group_level), skill_percents)
+    return index
+
+
+class SectorDistanceIndex:
+    """All sector to sector Euclidean distances in one dense float32 matrix
+
+    Each row's top-N nearest sectors (and their colour buckets) are ranked
+    once when the index is built, so a lookup is a row read. Missing pairs
+    are held as inf.
+    """
+
+    def __init__(self, names, distances, exclude=("Other",), top_n=TOP_N):
+        self.names = np.asarray(names, dtype=object)
+        self.name_to_index = {name: i for i, name in enumerate(self.names)}
+        self.distances = _readonly(np.asarray(distances, dtype=np.float32))
+
+        candidates = self.distances.copy()
+        for name in exclude:
+            if name in self.name_to_index:
+                candidates[:, self.name_to_index[name]] = np.inf
+        top_n = min(top_n, len(self.names))
+        if top_n < len(self.names):
+            top = np.argpartition(candidates, top_n - 1, axis=1)[:, :top_n]
+        else:
+            top = np.tile(np.arange(len(self.names)), (len(self.names), 1))
+        top_distances = np.take_along_axis(candidates, top, axis=1)
+        order = np.argsort(top_distances, axis=1, kind="stable")
+        self.ranked = _readonly(np.take_along_axis(top, order, axis=1).astype(np.int32))
+        self.ranked_distances = _readonly(
+            np.take_along_axis(top_distances, order, axis=1).astype(np.float64)
+        )
+        # Similarity colour bucket of each ranked distance, to 1 d.p. (rounded down)
+        self.ranked_buckets = _readonly(np.floor(self.ranked_distances * 10) / 10)
+
+    @classmethod
+    def from_sector_data(cls, all_sector_data, **kwargs):
+        """From the per sector data's {sector: {"similar_sectors": {sector: distance}}}"""
+        names = list(all_sector_data.keys())
+        name_to_index = {name: i for i, name in enumerate(names)}
+        for data in all_sector_data.values():
+            for name in data.get("similar_sectors", {}):
+                if name not in name_to_index:
+                    name_to_index[name] = len(names)
+                    names.append(name)
+        distances = np.full((len(names), len(names)), np.inf, dtype=np.float32)
+        for name, data in all_sector_data.items():
+            similar_sectors = data.get("similar_sectors", {})
+            columns = [name_to_index[other] for other in similar_sectors]
+            distances[name_to_index[name], columns] = np.fromiter(
+                similar_sectors.values(), dtype=np.float32, count=len(columns)
+            )
+        return cls(names, distances, **kwargs)
+
+    @classmethod
+    def from_arrays(cls, arrays, **kwargs):
+        """From a loaded .npz with "names" and "distances" (see save)"""
+        return cls(arrays["names"], arrays["distances"], **kwargs)
+
+    def save(self, file_name):
+        """Write the names and matrix to a .npz, so the per sector json no
+        longer needs to carry the similar_sectors dicts"""
+        np.savez(file_name, names=self.names.astype(str), distances=self.distances)
+
+    def most_similar(self, sector):
+        """(names, distances, colour buckets) of the closest sectors, closest first"""
+        i = self.name_to_index[sector]
+        finite = np.isfinite(self.ranked_distances[i])
+        return (
+            self.names[self.ranked[i][finite]],
+            self.ranked_distances[i][finite],
+            self.ranked_buckets[i][finite],
+        )
+
+
+class RegionPartitionIndex:
+    """Location quotient rows partitioned into one contiguous slice per region
+
+    Rows below min_skill_percent are dropped and each region's slice is
+    sorted by descending absolute_location_change when the index is built,
+    so selecting a region is a slice rather than a scan of the whole frame.
+    region and skill are stored as categoricals.
+    """
+
+    def __init__(self, loc_quotident_data, min_skill_percent=0.05):
+        regions = pd.Categorical(
+            np.asarray(loc_quotident_data["region"], dtype=object)
+        )
+        # Keep the regions in the order they first appear, as the region selectbox does
+        _, first_rows = np.unique(regions.codes, return_index=True)
+        self.regions = [
+            str(region)
+            for region in regions.categories[regions.codes[np.sort(first_rows)]]
+        ]
+        regions = regions.reorder_categories(self.regions)
+
+        keep = (loc_quotident_data["skill_percent"] >= min_skill_percent).to_numpy()
+        region_codes = regions.codes[keep]
+        absolute_location_change = loc_quotident_data[
+            "absolute_location_change"
+        ].to_numpy(dtype=np.float64)[keep]
+        order = np.lexsort((-absolute_location_change, region_codes))
+
+        frame = loc_quotident_data[keep].iloc[order].reset_index(drop=True)
+        frame["region"] = pd.Categorical.from_codes(
+            region_codes[order], categories=regions.categories
+        )
+        frame["skill"] = pd.Categorical(np.asarray(frame["skill"], dtype=object))
+        self.frame = frame
+
+        bounds = np.searchsorted(
+            region_codes[order], np.arange(len(self.regions) + 1), side="left"
+        )
+        self._slices = {
+            region: (bounds[i], bounds[i + 1]) for i, region in enumerate(self.regions)
+        }
+
+    def top(self, region, n=15):
+        """The n rows of region with the largest absolute_location_change"""
+        start, end = self._slices[region]
+        return self.frame.iloc[start : min(end, start + n)]
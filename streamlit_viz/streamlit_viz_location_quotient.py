@@ -0,0 +1,198 @@
+"""Location quotients of skill groups in each region, from region x skill group advert counts.
+
+    python streamlit_viz/streamlit_viz_location_quotient.py skill_mentions.csv top_skills_per_loc_quotident_sample.csv
+
+skill_mentions.csv has one row per advert and skill group it mentions (id,
+region, skill), with each advert's rows next to each other, as is the case
+when they are written out advert by advert. It is read in chunks, so the
+memory used depends on the number of regions and skill groups, not on the
+number of rows. streamlit_viz_aggregate.py feeds its region counts in
+directly.
+
+A region's location quotient for a skill group is the share of the region's
+adverts that mention it divided by the share of all adverts that do. Only
+skill groups mentioned in at least MIN_ADVERTS_PER_SKILL of a region's
+adverts are kept.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+MIN_ADVERTS_PER_SKILL = 100
+
+DEFAULT_CHUNK_SIZE = 1000000
+
+LOCATION_QUOTIENT_COLUMNS = [
+    "skill",
+    "skill_percent",
+    "region",
+    "location_quotident",
+    "location_difference",
+    "location_change",
+    "absolute_location_change",
+    "num_ads",
+    "num_ads_per_skill",
+]
+
+
+class _Vocabulary:
+    """Integer codes for names, assigned in the order they are first seen"""
+
+    def __init__(self):
+        self.names = []
+        self._index = pd.Index([], dtype=object)
+
+    def __len__(self):
+        return len(self.names)
+
+    def codes(self, names):
+        codes, uniques = pd.factorize(np.asarray(names, dtype=object))
+        positions = self._index.get_indexer(uniques)
+        new = np.flatnonzero(positions < 0)
+        if len(new):
+            positions[new] = np.arange(len(self.names), len(self.names) + len(new))
+            self.names.extend(uniques[new].tolist())
+            self._index = pd.Index(self.names, dtype=object)
+        return positions[codes]
+
+
+class LocationQuotientCounts:
+    """Adverts per region (num_ads) and adverts per region and skill group
+    (num_ads_per_skill), built up from any number of chunks"""
+
+    def __init__(self):
+        self.regions = _Vocabulary()
+        self.skills = _Vocabulary()
+        self.num_ads = np.zeros(0, dtype=np.int64)
+        self.num_ads_per_skill = np.zeros((0, 0), dtype=np.int64)
+        self._last_advert_id = None
+
+    def _grow(self):
+        num_regions, num_skills = len(self.regions), len(self.skills)
+        self.num_ads = np.pad(self.num_ads, (0, num_regions - len(self.num_ads)))
+        self.num_ads_per_skill = np.pad(
+            self.num_ads_per_skill,
+            (
+                (0, num_regions - self.num_ads_per_skill.shape[0]),
+                (0, num_skills - self.num_ads_per_skill.shape[1]),
+            ),
+        )
+
+    def add_adverts(self, regions, num_ads=1):
+        """Add num_ads adverts (a number or an array) in each of regions"""
+        region_codes = self.regions.codes(regions)
+        self._grow()
+        np.add.at(
+            self.num_ads, region_codes, np.broadcast_to(num_ads, region_codes.shape)
+        )
+
+    def add_counts(self, regions, skills, num_ads_per_skill):
+        """Add num_ads_per_skill adverts mentioning skills[i] in regions[i]"""
+        region_codes = self.regions.codes(regions)
+        skill_codes = self.skills.codes(skills)
+        self._grow()
+        self.num_ads_per_skill += np.bincount(
+            region_codes * len(self.skills) + skill_codes,
+            weights=np.broadcast_to(num_ads_per_skill, region_codes.shape),
+            minlength=self.num_ads_per_skill.size,
+        ).astype(np.int64).reshape(self.num_ads_per_skill.shape)
+
+    def add_mentions(self, advert_ids, regions, skills):
+        """Add a chunk of (advert id, region, skill group) rows, one row per
+        advert and skill group it mentions (skill group missing for adverts
+        with none). An advert's rows must be next to each other (they may run
+        over into the next chunk)."""
+        advert_ids = np.asarray(advert_ids, dtype=object)
+        regions = np.asarray(regions, dtype=object)
+        skills = np.asarray(skills, dtype=object)
+        if len(advert_ids) == 0:
+            return
+        new_advert = np.empty(len(advert_ids), dtype=bool)
+        new_advert[0] = advert_ids[0] != self._last_advert_id
+        new_advert[1:] = advert_ids[1:] != advert_ids[:-1]
+        self._last_advert_id = advert_ids[-1]
+        self.add_adverts(regions[new_advert])
+        has_skill = pd.notna(skills)
+        self.add_counts(regions[has_skill], skills[has_skill], 1)
+
+    def location_quotients(self, min_adverts_per_skill=MIN_ADVERTS_PER_SKILL):
+        """DataFrame with LOCATION_QUOTIENT_COLUMNS for each region and skill
+        group with at least min_adverts_per_skill adverts, sorted by region
+        and skill"""
+        num_ads = self.num_ads
+        national_share = self.num_ads_per_skill.sum(axis=0) / max(num_ads.sum(), 1)
+        rows, cols = np.nonzero(
+            (self.num_ads_per_skill >= min_adverts_per_skill) & (num_ads[:, None] > 0)
+        )
+        num_ads_per_skill = self.num_ads_per_skill[rows, cols].astype(np.float64)
+        skill_percent = num_ads_per_skill / num_ads[rows]
+        location_quotident = skill_percent / national_share[cols]
+        location_change = location_quotident - 1
+        location_quotients = pd.DataFrame(
+            {
+                "skill": np.asarray(self.skills.names, dtype=object)[cols],
+                "skill_percent": skill_percent,
+                "region": np.asarray(self.regions.names, dtype=object)[rows],
+                "location_quotident": location_quotident,
+                "location_difference": skill_percent - national_share[cols],
+                "location_change": location_change,
+                "absolute_location_change": np.abs(location_change),
+                "num_ads": num_ads[rows],
+                "num_ads_per_skill": num_ads_per_skill,
+            },
+            columns=LOCATION_QUOTIENT_COLUMNS,
+        )
+        return location_quotients.sort_values(
+            ["region", "skill"], kind="stable"
+        ).reset_index(drop=True)
+
+
+def read_skill_mentions(
+    path,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    id_column="id",
+    region_column="region",
+    skill_column="skill",
+):
+    """LocationQuotientCounts from a csv of (advert id, region, skill group) rows"""
+    counts = LocationQuotientCounts()
+    for chunk in pd.read_csv(
+        path, usecols=[id_column, region_column, skill_column], chunksize=chunk_size
+    ):
+        chunk = chunk.dropna(subset=[region_column])
+        counts.add_mentions(
+            chunk[id_column].to_numpy(),
+            chunk[region_column].to_numpy(),
+            chunk[skill_column].to_numpy(),
+        )
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("skill_mentions_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--min_adverts_per_skill", type=int, default=MIN_ADVERTS_PER_SKILL
+    )
+    parser.add_argument("--id_column", default="id")
+    parser.add_argument("--region_column", default="region")
+    parser.add_argument("--skill_column", default="skill")
+    args = parser.parse_args()
+
+    counts = read_skill_mentions(
+        args.skill_mentions_path,
+        chunk_size=args.chunk_size,
+        id_column=args.id_column,
+        region_column=args.region_column,
+        skill_column=args.skill_column,
+    )
+    counts.location_quotients(args.min_adverts_per_skill).to_csv(
+        args.output_path, index=False
+    )
+    print(
+        f"Location quotients of {len(counts.skills)} skill groups in "
+        f"{len(counts.regions)} regions written to {args.output_path}"
+    )
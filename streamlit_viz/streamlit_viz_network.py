@@ -0,0 +1,304 @@
+"""Occupation similarity network, precomputed once so the threshold slider is cheap.
+
+Edges are held sorted by descending weight, so the edges above any threshold
+are a prefix of the edge arrays found by binary search. A compressed
+(CSR) adjacency of the same edges gives each node's neighbours in weight
+order. Node colours and sizes are computed as arrays when the network is
+built, and agraph Node/Edge objects are created at most once per node/edge.
+
+Before drawing, the edges can be sparsified (see SPARSIFY_STRATEGIES) and are
+always capped at max_edges, keeping the map readable and the agraph front end
+responsive at low thresholds or with many occupations.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from streamlit_viz_utils import NESTA_COLOURS
+
+# Node size is scaled by the percentage of job ads in the sector
+MIN_NODE_SIZE = 5
+MAX_NODE_SIZE = 10
+
+EDGE_COLOUR = "#0F294A"
+
+# Hard cap on the edges sent to the browser; the agraph front end turns
+# into one big clump at a few hundred edges and crashes at a few thousand
+MAX_GRAPH_EDGES = 750
+
+SPARSIFY_STRATEGIES = {
+    # Every edge above the threshold
+    "threshold": "Similarity threshold only",
+    # Each occupation's k most similar occupations above the threshold
+    "top_k": "Most similar occupations per occupation",
+    # Maximum spanning forest of the edges above the threshold, plus the
+    # strongest other edges above it
+    "spanning_tree": "Spanning forest plus strongest links",
+    # Edges above the threshold that are significant for either occupation
+    # among its edges above the threshold (Serrano et al., 2009)
+    "disparity": "Disparity filter",
+}
+
+
+def percentage_job_adverts(all_data, exclude=("Other",)):
+    """{name: percentage of all job adverts} from per sector/region data with num_ads"""
+    number_job_adverts = {
+        name: v["num_ads"] for name, v in all_data.items() if name not in exclude
+    }
+    total_num_job_adverts = sum(number_job_adverts.values())
+    return {
+        name: round(num_ads * 100 / total_num_job_adverts, 2)
+        for name, num_ads in number_job_adverts.items()
+    }
+
+
+class SimilarityNetwork:
+    """Weighted, undirected sector similarity graph
+
+    nodes: sector names, indexed by node id
+    edge_source, edge_target, edge_weight: edge arrays sorted by descending weight
+    indptr, indices, weights: CSR adjacency, each row sorted by descending weight
+    node_colours, node_sizes: per node attributes
+    knowledge_domain_colours: {knowledge domain: colour} used for node_colours
+    """
+
+    def __init__(
+        self,
+        sector_similarity,
+        sector_2_kd,
+        percentage_job_adverts_per_sector,
+        exclude=("Other",),
+    ):
+        keep = ~(
+            sector_similarity["source"].isin(exclude)
+            | sector_similarity["target"].isin(exclude)
+        ).to_numpy()
+        sources = np.asarray(sector_similarity["source"], dtype=object)[keep]
+        targets = np.asarray(sector_similarity["target"], dtype=object)[keep]
+        weights = sector_similarity["weight"].to_numpy(dtype=np.float64)[keep]
+
+        self.nodes, node_ids = np.unique(
+            np.concatenate([sources, targets]).astype(str), return_inverse=True
+        )
+        num_edges = len(weights)
+        order = np.argsort(-weights, kind="stable")
+        self.edge_source = node_ids[:num_edges][order].astype(np.int32)
+        self.edge_target = node_ids[num_edges:][order].astype(np.int32)
+        self.edge_weight = weights[order]
+        self._neg_edge_weight = -self.edge_weight
+
+        self._build_adjacency()
+        self._build_node_attributes(sector_2_kd, percentage_job_adverts_per_sector)
+
+        # Position of the first (strongest) edge touching each node, so the
+        # nodes of any edge prefix are a prefix of nodes sorted by it
+        first_edge = np.full(len(self.nodes), num_edges, dtype=np.int64)
+        positions = np.arange(num_edges)
+        np.minimum.at(first_edge, self.edge_source, positions)
+        np.minimum.at(first_edge, self.edge_target, positions)
+        self._node_order = np.argsort(first_edge, kind="stable")
+        self._node_first_edge = first_edge[self._node_order]
+
+        # Number of edges above a threshold: disparity significance of each
+        # of them (one entry per slider position)
+        self._edge_alpha = {}
+        self._spanning_tree = None
+
+        self._lock = threading.Lock()
+        self._node_objects = {}
+        self._edge_objects = [None] * num_edges
+
+    def _build_adjacency(self):
+        rows = np.concatenate([self.edge_source, self.edge_target])
+        cols = np.concatenate([self.edge_target, self.edge_source])
+        weights = np.concatenate([self.edge_weight, self.edge_weight])
+        edge_positions = np.tile(np.arange(len(self.edge_weight)), 2)
+        order = np.lexsort((-weights, rows))
+        self.indices = cols[order]
+        self.weights = weights[order]
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self.nodes)), out=self.indptr[1:])
+        # Edge position of each adjacency entry and its rank within its row
+        self._adjacency_edge = edge_positions[order]
+        self._adjacency_row = rows[order]
+        self._adjacency_rank = np.arange(len(order)) - self.indptr[self._adjacency_row]
+
+    def _disparity_alpha(self, num_edges):
+        """Disparity filter significance of each of the num_edges strongest
+        edges (those above a threshold) in the graph of only those edges:
+        the smaller of (1 - w / strength) ** (degree - 1) over its two end
+        nodes"""
+        keep = self._adjacency_edge < num_edges
+        rows = self._adjacency_row[keep]
+        weights = self.weights[keep]
+        degree = np.bincount(rows, minlength=len(self.nodes))
+        strength = np.bincount(rows, weights=weights, minlength=len(self.nodes))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            alpha = (1 - weights / strength[rows]) ** (degree[rows] - 1)
+        edge_alpha = np.ones(num_edges)
+        np.minimum.at(
+            edge_alpha, self._adjacency_edge[keep], np.nan_to_num(alpha, nan=1.0)
+        )
+        return edge_alpha
+
+    def disparity_alpha(self, threshold):
+        """Disparity significance of each edge above threshold, strongest
+        first, computed on the edges above threshold only"""
+        num_above = self.num_edges_above(threshold)
+        with self._lock:
+            edge_alpha = self._edge_alpha.get(num_above)
+        if edge_alpha is None:
+            edge_alpha = self._disparity_alpha(num_above)
+            with self._lock:
+                self._edge_alpha[num_above] = edge_alpha
+        return edge_alpha
+
+    def spanning_tree_edges(self):
+        """Positions of the maximum spanning forest edges (Kruskal; the edges
+        are already sorted by descending weight)"""
+        if self._spanning_tree is None:
+            parent = list(range(len(self.nodes)))
+
+            def find(node):
+                while parent[node] != node:
+                    parent[node] = parent[parent[node]]
+                    node = parent[node]
+                return node
+
+            tree = []
+            for position, (source, target) in enumerate(
+                zip(self.edge_source.tolist(), self.edge_target.tolist())
+            ):
+                source_root, target_root = find(source), find(target)
+                if source_root != target_root:
+                    parent[source_root] = target_root
+                    tree.append(position)
+                    if len(tree) == len(self.nodes) - 1:
+                        break
+            self._spanning_tree = np.array(tree, dtype=np.int64)
+        return self._spanning_tree
+
+    def _build_node_attributes(self, sector_2_kd, percentage_job_adverts_per_sector):
+        # Colour sectors by their parent knowledge domain (broad occupational group).
+        # If you run out of Nesta colours, then reloop through them
+        knowledge_domains = pd.Series(sector_2_kd).reindex(self.nodes)
+        domain_names = sorted(set(knowledge_domains.dropna()))
+        self.knowledge_domain_colours = {
+            domain: NESTA_COLOURS[i % len(NESTA_COLOURS)]
+            for i, domain in enumerate(domain_names)
+        }
+        self.node_colours = (
+            knowledge_domains.map(self.knowledge_domain_colours)
+            .fillna(NESTA_COLOURS[-1])
+            .to_numpy(dtype=object)
+        )
+        percentages = (
+            pd.Series(percentage_job_adverts_per_sector, dtype=np.float64)
+            .reindex(self.nodes)
+            .fillna(0)
+            .to_numpy()
+        )
+        self.node_sizes = percentages * (MAX_NODE_SIZE - MIN_NODE_SIZE) + MIN_NODE_SIZE
+
+    @property
+    def num_edges(self):
+        return len(self.edge_weight)
+
+    def num_edges_above(self, threshold):
+        """Number of edges with weight > threshold (a binary search)"""
+        return int(np.searchsorted(self._neg_edge_weight, -threshold, side="left"))
+
+    def neighbours(self, node_id):
+        """(neighbour ids, weights) of a node, strongest first"""
+        start, end = self.indptr[node_id], self.indptr[node_id + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+    def _node_object(self, node_id):
+        node = self._node_objects.get(node_id)
+        if node is None:
+            # Imported on first use, so the dashboard starts without it
+            from streamlit_agraph import Node
+
+            name = str(self.nodes[node_id])
+            node = Node(
+                id=name,
+                label=name,
+                color=self.node_colours[node_id],
+                size=float(self.node_sizes[node_id]),
+            )
+            self._node_objects[node_id] = node
+        return node
+
+    def _edge_object(self, edge_position):
+        edge = self._edge_objects[edge_position]
+        if edge is None:
+            from streamlit_agraph import Edge
+
+            edge = Edge(
+                source=str(self.nodes[self.edge_source[edge_position]]),
+                target=str(self.nodes[self.edge_target[edge_position]]),
+                color=EDGE_COLOUR,
+                weight=float(self.edge_weight[edge_position]),
+                directed=False,
+                arrows={
+                    "to": {"scaleFactor": 0}
+                },  # Hack to make the graph undirected - make arrows invisible!
+            )
+            self._edge_objects[edge_position] = edge
+        return edge
+
+    def select_edges(
+        self, threshold, strategy="threshold", k=5, alpha=0.05, max_edges=MAX_GRAPH_EDGES
+    ):
+        """Positions of the edges to draw, strongest first, at most max_edges.
+        Edge positions are in descending weight order, so position < number of
+        edges above the threshold is the same as weight > threshold."""
+        num_above = self.num_edges_above(threshold)
+        if strategy == "threshold":
+            positions = np.arange(num_above)
+        elif strategy == "top_k":
+            keep = (self._adjacency_rank < k) & (self._adjacency_edge < num_above)
+            positions = np.unique(self._adjacency_edge[keep])
+        elif strategy == "spanning_tree":
+            # Kruskal takes the edges strongest first, so the spanning forest
+            # of the edges above the threshold is the part of the full tree
+            # above it
+            tree = self.spanning_tree_edges()
+            tree = tree[tree < num_above]
+            extra = np.setdiff1d(np.arange(num_above), tree, assume_unique=True)
+            # Keep the tree ahead of the extra edges when applying the cap
+            positions = np.sort(np.concatenate([tree, extra])[:max_edges])
+        elif strategy == "disparity":
+            positions = np.flatnonzero(self.disparity_alpha(threshold) < alpha)
+        else:
+            raise ValueError(
+                f"Unknown strategy {strategy}, expected one of {list(SPARSIFY_STRATEGIES)}"
+            )
+        return positions[:max_edges]
+
+    def graph(self, threshold, strategy="threshold", max_edges=MAX_GRAPH_EDGES, **kwargs):
+        """agraph nodes and edges for the sparsified edges above threshold"""
+        if strategy == "threshold":
+            # The edges are a prefix, so their nodes are a prefix of _node_order
+            num_edges = min(self.num_edges_above(threshold), max_edges)
+            positions = range(num_edges)
+            num_nodes = int(
+                np.searchsorted(self._node_first_edge, num_edges, side="left")
+            )
+            node_ids = self._node_order[:num_nodes]
+        else:
+            positions = self.select_edges(threshold, strategy, max_edges=max_edges, **kwargs)
+            node_ids = np.unique(
+                np.concatenate([self.edge_source[positions], self.edge_target[positions]])
+            )
+        with self._lock:
+            nodes = [self._node_object(node_id) for node_id in node_ids]
+            edges = [self._edge_object(position) for position in positions]
+        return nodes, edges
+
+
+def build_similarity_network(sector_similarity, sector_2_kd, all_sector_data):
+    return SimilarityNetwork(
+        sector_similarity, sector_2_kd, percentage_job_adverts(all_sector_data)
+    )
@@ -0,0 +1,79 @@
+"""Use case sections of the dashboard, computed only while open and only when their own inputs change.
+
+Each use case used to sit in an st.expander, whose body runs on every rerun
+collapsed or not, so every section loaded its data and built its charts
+(and the occupation network) whichever widget on the page had changed.
+Streamlit 1.16's expander keeps whether it is expanded in the browser: the
+script can set how it starts but is never told when it is opened or
+collapsed, and has no callback for it. So a section's header is a checkbox
+instead, which the script does see: its introduction and body are drawn,
+and computed, only while it is ticked, and unticking it stops the work.
+
+While open, a section's loaders and chart builders are called through
+Section.cached: results are kept in the session's state with the arguments
+(the section's own widget values and the loaded data) they were built from,
+and reused for as long as those are the same. A rerun triggered by another
+section then only draws the stored results again. The data files a result
+was loaded from are recorded through DATA_CACHE, and it is rebuilt once any
+of them change, so refreshed data reaches sessions that are already open.
+"""
+import streamlit as st
+
+from streamlit_viz_utils import DATA_CACHE
+
+# Arguments compared by value; anything else (the loaded data, the lookup
+# indexes) by identity, as a reloaded dataset is a new object
+_VALUE_TYPES = (str, int, float, bool, type(None))
+
+
+def _same_inputs(inputs, stored_inputs):
+    (args, kwargs), (stored_args, stored_kwargs) = inputs, stored_inputs
+    if len(args) != len(stored_args) or kwargs.keys() != stored_kwargs.keys():
+        return False
+    pairs = list(zip(args, stored_args)) + [
+        (kwargs[name], stored_kwargs[name]) for name in kwargs
+    ]
+    return all(
+        value == stored if isinstance(value, _VALUE_TYPES) else value is stored
+        for value, stored in pairs
+    )
+
+
+class Section:
+    """One use case section of the page, opened and closed by a checkbox"""
+
+    def __init__(self, key, title, data_cache=DATA_CACHE):
+        self.key = key
+        self.title = title
+        self.data_cache = data_cache
+        self._open_key = f"section_{key}_open"
+        self._results_key = f"section_{key}_results"
+
+    def opened(self):
+        """Draws the section's header, a checkbox opening and closing it, and
+        returns whether it is open"""
+        return st.checkbox(self.title, key=self._open_key)
+
+    def cached(self, build, *args, **kwargs):
+        """build(*args, **kwargs), kept in session state and returned again
+        for as long as it is called with the same arguments (the section's
+        widget values and data) and the data files it read are unchanged.
+        Only the latest result of each build function is kept."""
+        results = st.session_state.setdefault(self._results_key, {})
+        inputs = (args, kwargs)
+        stored = results.get(build.__name__)
+        if (
+            stored is not None
+            and _same_inputs(inputs, stored[0])
+            and self.data_cache.signatures(stored[1]) == stored[2]
+        ):
+            return stored[3]
+        with self.data_cache.track_files() as file_names:
+            result = build(*args, **kwargs)
+        results[build.__name__] = (
+            inputs,
+            file_names,
+            self.data_cache.signatures(file_names),
+            result,
+        )
+        return result
@@ -0,0 +1,303 @@
+"""Each sector's most similar sectors, from sector skill profiles, in bounded memory.
+
+    python streamlit_viz/streamlit_viz_similarity.py streamlit_viz/data/per_sector_sample_updated.json streamlit_viz/data --workers 4
+
+A sector's skill profile is the share of its adverts mentioning each skill.
+Profiles are compared a block of sectors at a time: one sparse matrix
+product gives a block x all sectors slice of the Gram matrix, from which the
+Euclidean distances (for "similar_sectors" in the per sector json) or
+cosine similarities (for the weights of the sector similarity network csv)
+are derived and only each sector's top_k are kept. Memory is block_size x
+number of sectors rather than all sectors squared, and the blocks are
+shared out over worker processes.
+
+streamlit_viz_aggregate.py calls this with the full profiles. Run on its
+own, it rebuilds both outputs from the per sector json's top skills (only
+the most common skills of each sector, so an approximation).
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from streamlit_viz_index import SectorDistanceIndex
+
+# Neighbours kept per sector (the dashboard shows the 10 closest)
+TOP_K = 20
+DEFAULT_BLOCK_SIZE = 256
+
+SIMILARITY_FILE_NAME = "lightweight_skill_similarity_between_sectors_sample.csv"
+DISTANCES_FILE_NAME = "sector_distances_sample.npz"
+
+# Profiles for the worker processes, set by _init_worker
+_worker_profiles = None
+
+
+def prepare_profiles(profiles, metric):
+    """(profiles, squared row norms) ready for block_top_k; for cosine the rows
+    are scaled to unit length so the Gram matrix is the cosine similarity"""
+    profiles = sparse.csr_matrix(profiles, dtype=np.float64)
+    squared_norms = np.asarray(profiles.multiply(profiles).sum(axis=1)).ravel()
+    if metric == "cosine":
+        with np.errstate(divide="ignore"):
+            inverse_norms = np.where(squared_norms > 0, 1 / np.sqrt(squared_norms), 0)
+        profiles = sparse.diags(inverse_norms) @ profiles
+        squared_norms = (squared_norms > 0).astype(np.float64)
+    elif metric != "euclidean":
+        raise ValueError(f'Unknown metric {metric}, expected "euclidean" or "cosine"')
+    return profiles.tocsr(), squared_norms
+
+
+def _scores(profiles, squared_norms, rows, columns, metric):
+    """rows x columns scores, smallest nearest: Euclidean distances, or
+    negated cosine similarities"""
+    gram = (profiles[rows] @ profiles[columns].T).toarray()
+    if metric == "euclidean":
+        squared = squared_norms[rows, None] + squared_norms[None, columns] - 2 * gram
+        return np.sqrt(np.maximum(squared, 0))
+    return -gram
+
+
+def _nearest(candidates, scores, k, metric):
+    """(indices, values) of the k candidates with the smallest scores in each
+    row, nearest first"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.zeros((len(scores), 0), dtype=np.int32), np.zeros((len(scores), 0))
+    top = np.argpartition(scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return (
+        np.take_along_axis(candidates, top, axis=1).astype(np.int32),
+        top_scores if metric == "euclidean" else -top_scores,
+    )
+
+
+def block_top_k(profiles, squared_norms, rows, metric, k):
+    """(indices, values) of the k nearest sectors to each sector in rows,
+    nearest first: the smallest Euclidean distances or the largest cosine
+    similarities, not counting the sector itself"""
+    num_sectors = profiles.shape[0]
+    scores = _scores(profiles, squared_norms, rows, slice(None), metric)
+    scores[np.arange(len(rows)), rows] = np.inf
+    candidates = np.broadcast_to(np.arange(num_sectors), scores.shape)
+    return _nearest(candidates, scores, min(k, num_sectors - 1), metric)
+
+
+def block_patch_top_k(profiles, squared_norms, rows, changed, indices, values, metric, k):
+    """(indices, values) of the k nearest sectors to each sector in rows, from
+    their previous nearest (indices, values), of which only those with
+    changed profiles are compared again (against every changed sector). Each
+    row must have at least k unchanged previous neighbours."""
+    previous_scores = values if metric == "euclidean" else -values
+    previous_scores = np.where(np.isin(indices, changed), np.inf, previous_scores)
+    changed_scores = _scores(profiles, squared_norms, rows, changed, metric)
+    candidates = np.hstack(
+        [indices, np.broadcast_to(changed, (len(rows), len(changed)))]
+    )
+    return _nearest(candidates, np.hstack([previous_scores, changed_scores]), k, metric)
+
+
+def _init_worker(profiles, squared_norms):
+    global _worker_profiles
+    _worker_profiles = (profiles, squared_norms)
+
+
+def _worker_run(block_fn, args):
+    return block_fn(*_worker_profiles, *args)
+
+
+def _run_blocks(profiles, squared_norms, tasks, workers):
+    """[block_fn(profiles, squared_norms, *args) for each (block_fn, args) in
+    tasks], in workers processes if workers > 0"""
+    if workers > 0 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)),
+            initializer=_init_worker,
+            initargs=(profiles, squared_norms),
+        ) as executor:
+            return list(executor.map(_worker_run, *zip(*tasks)))
+    return [block_fn(profiles, squared_norms, *args) for block_fn, args in tasks]
+
+
+def _blocks(rows, block_size):
+    return [rows[start : start + block_size] for start in range(0, len(rows), block_size)]
+
+
+def top_k_neighbours(
+    profiles, metric="euclidean", k=TOP_K, block_size=DEFAULT_BLOCK_SIZE, workers=0
+):
+    """(indices, values) arrays of shape (sectors, k) of each sector's k
+    nearest sectors by metric ("euclidean" distance or "cosine" similarity),
+    nearest first. With workers > 0 the blocks are computed in that many
+    processes."""
+    return update_top_k_neighbours(
+        profiles,
+        np.arange(profiles.shape[0]),
+        np.zeros((0, 0), dtype=np.int32),
+        np.zeros((0, 0)),
+        metric,
+        k,
+        block_size=block_size,
+        workers=workers,
+    )
+
+
+def update_top_k_neighbours(
+    profiles,
+    changed,
+    indices,
+    values,
+    metric="euclidean",
+    k=TOP_K,
+    block_size=DEFAULT_BLOCK_SIZE,
+    workers=0,
+):
+    """top_k_neighbours after the profiles of the changed sectors have
+    changed, from the previous (indices, values). Sectors after the previous
+    ones are new, and so changed too.
+
+    Changed sectors are compared with every sector. Every other sector is
+    compared only with the changed sectors, and its unchanged previous
+    neighbours are kept, unless fewer than k of them are left, in which case
+    it is compared with every sector again.
+    """
+    profiles, squared_norms = prepare_profiles(profiles, metric)
+    num_sectors = profiles.shape[0]
+    k = min(k, max(num_sectors - 1, 0))
+    is_changed = np.zeros(num_sectors, dtype=bool)
+    is_changed[changed] = True
+    is_changed[len(indices) :] = True
+    changed = np.flatnonzero(is_changed)
+
+    unchanged = np.flatnonzero(~is_changed)
+    num_still_valid = (~is_changed[indices[unchanged]]).sum(axis=1)
+    recompute = np.concatenate([changed, unchanged[num_still_valid < k]])
+    patch = unchanged[num_still_valid >= k]
+
+    recompute_blocks = _blocks(recompute, block_size)
+    patch_blocks = _blocks(patch, block_size)
+    blocks = recompute_blocks + patch_blocks
+    tasks = [(block_top_k, (rows, metric, k)) for rows in recompute_blocks] + [
+        (block_patch_top_k, (rows, changed, indices[rows], values[rows], metric, k))
+        for rows in patch_blocks
+    ]
+    new_indices = np.zeros((num_sectors, k), dtype=np.int32)
+    new_values = np.zeros((num_sectors, k))
+    for rows, (block_indices, block_values) in zip(
+        blocks, _run_blocks(profiles, squared_norms, tasks, workers)
+    ):
+        new_indices[rows] = block_indices
+        new_values[rows] = block_values
+    return new_indices, new_values
+
+
+def similar_sectors(names, indices, distances):
+    """{sector: {similar sector: Euclidean distance}} as in the per sector json"""
+    return {
+        name: {
+            names[j]: float(distance)
+            for j, distance in zip(indices[i].tolist(), distances[i].tolist())
+        }
+        for i, name in enumerate(names)
+    }
+
+
+def similarity_edges(names, indices, weights):
+    """DataFrame of source, target, weight: each sector's top_k most similar
+    sectors as undirected edges (each pair once), strongest first. Pairs with
+    no skills in common are dropped."""
+    sources = np.repeat(np.arange(len(names)), indices.shape[1])
+    targets = indices.ravel().astype(np.int64)
+    weights = weights.ravel()
+    keep = weights > 0
+    sources, targets, weights = sources[keep], targets[keep], weights[keep]
+    pair_sources = np.minimum(sources, targets)
+    pair_targets = np.maximum(sources, targets)
+    _, first = np.unique(
+        pair_sources * len(names) + pair_targets, return_index=True
+    )
+    first = first[np.argsort(-weights[first], kind="stable")]
+    names = np.asarray(names, dtype=object)
+    return pd.DataFrame(
+        {
+            "source": names[pair_sources[first]],
+            "target": names[pair_targets[first]],
+            "weight": weights[first],
+        }
+    )
+
+
+def sector_similarities(
+    names, profiles, k=TOP_K, block_size=DEFAULT_BLOCK_SIZE, workers=0
+):
+    """({sector: {similar sector: distance}}, similarity edges DataFrame)"""
+    indices, distances = top_k_neighbours(
+        profiles, "euclidean", k, block_size=block_size, workers=workers
+    )
+    neighbours = similar_sectors(names, indices, distances)
+    indices, weights = top_k_neighbours(
+        profiles, "cosine", k, block_size=block_size, workers=workers
+    )
+    return neighbours, similarity_edges(names, indices, weights)
+
+
+def profiles_from_sector_data(all_sector_data, level="all"):
+    """(names, sector x skill csr matrix) from the per sector json's
+    top_skills at level"""
+    names = list(all_sector_data)
+    skills = {}
+    rows, cols, values = [], [], []
+    for row, name in enumerate(names):
+        for skill, percent in (
+            all_sector_data[name].get("top_skills", {}).get(level, {}).items()
+        ):
+            rows.append(row)
+            cols.append(skills.setdefault(skill, len(skills)))
+            values.append(percent)
+    profiles = sparse.csr_matrix(
+        (values, (rows, cols)), shape=(len(names), len(skills)), dtype=np.float64
+    )
+    return names, profiles
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sector_file", help="per sector json")
+    parser.add_argument("output_folder")
+    parser.add_argument("--top_k", type=int, default=TOP_K)
+    parser.add_argument("--block_size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--npz",
+        action="store_true",
+        help=f"Also write {DISTANCES_FILE_NAME} (a dense sectors x sectors matrix)",
+    )
+    args = parser.parse_args()
+
+    with open(args.sector_file, "r") as file:
+        all_sector_data = json.load(file)
+    names, profiles = profiles_from_sector_data(all_sector_data)
+    neighbours, edges = sector_similarities(
+        names, profiles, args.top_k, block_size=args.block_size, workers=args.workers
+    )
+    for name, similar in neighbours.items():
+        all_sector_data[name]["similar_sectors"] = similar
+
+    os.makedirs(args.output_folder, exist_ok=True)
+    with open(
+        os.path.join(args.output_folder, os.path.basename(args.sector_file)), "w"
+    ) as file:
+        json.dump(all_sector_data, file)
+    edges.to_csv(os.path.join(args.output_folder, SIMILARITY_FILE_NAME), index=False)
+    if args.npz:
+        SectorDistanceIndex.from_sector_data(all_sector_data).save(
+            os.path.join(args.output_folder, DISTANCES_FILE_NAME)
+        )
+    print(f"{len(edges)} similarity edges between {len(names)} sectors")
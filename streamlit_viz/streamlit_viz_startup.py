@@ -0,0 +1,148 @@
+"""Startup report: the import time a streamlit script adds on top of streamlit's own.
+
+    python streamlit_viz/streamlit_viz_startup.py streamlit_viz/streamlit_viz.py app/app.py --budget 0.1
+
+A new pod's first session runs the script from the top, and nothing is
+painted until its imports are done. The server has already imported
+streamlit (and with it pandas, numpy, altair and pyarrow), so what delays
+the first paint is what the script's imports add. For each script this
+starts a fresh `python -X importtime`, imports streamlit, then runs only the
+script's top-level import statements, and reports the median time they
+took over --repeat runs and the slowest modules they brought in.
+
+Heavy modules only some sections need (streamlit_agraph and colour in the
+dashboard, ojd_daps_skills in the app) are imported where they are used,
+so they don't count here. With --budget the run fails if a script's imports
+take longer than that many seconds.
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_BUDGET_SECONDS = 0.1
+# The scripts add shared/ (the stage timings) to the path before importing from it
+SHARED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared")
+TOP_MODULES = 10
+
+# Written to stderr between importing streamlit and the script's imports
+_MARKER = "-- script imports --"
+
+_CHILD_CODE = """
+import json, sys, time
+sys.path.insert(0, {script_dir!r})
+sys.path.append({shared_dir!r})
+import streamlit
+sys.stderr.write({marker!r} + "\\n")
+sys.stderr.flush()
+start = time.perf_counter()
+exec(compile({source!r}, {script_path!r}, "exec"), {{"__file__": {script_path!r}}})
+print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+
+def script_imports(script_path):
+    """Source of the top-level import statements of a script"""
+    with open(script_path, "r") as file:
+        source = file.read()
+    return "\n".join(
+        ast.get_source_segment(source, node)
+        for node in ast.parse(source).body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def parse_importtime(stderr):
+    """[(module, cumulative seconds)] of the modules imported directly by the
+    script's imports, from -X importtime output after the marker"""
+    lines = stderr.split(_MARKER + "\n", 1)[-1].splitlines()
+    modules = []
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        # Each level of nesting indents the name by two more spaces
+        depth = len(name) - len(name.lstrip(" "))
+        modules.append((depth, name.strip(), int(cumulative) / 1e6))
+    if not modules:
+        return []
+    top_depth = min(depth for depth, _, _ in modules)
+    return [(name, seconds) for depth, name, seconds in modules if depth == top_depth]
+
+
+def measure(script_path, repeat=3):
+    """{"script", "seconds" (median), "modules": [[module, seconds]], "error"}"""
+    script_path = os.path.abspath(script_path)
+    code = _CHILD_CODE.format(
+        script_dir=os.path.dirname(script_path),
+        shared_dir=SHARED_DIR,
+        script_path=script_path,
+        source=script_imports(script_path),
+        marker=_MARKER,
+    )
+    times = []
+    modules = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=os.path.dirname(script_path),
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            error = process.stderr.strip().splitlines()[-1]
+            return {"script": script_path, "seconds": None, "modules": [], "error": error}
+        times.append(json.loads(process.stdout.strip().splitlines()[-1])["seconds"])
+        modules = parse_importtime(process.stderr)
+    modules.sort(key=lambda module: -module[1])
+    return {
+        "script": script_path,
+        "seconds": statistics.median(times),
+        "modules": [list(module) for module in modules],
+        "error": None,
+    }
+
+
+def format_report(result, budget=None, top_n=TOP_MODULES):
+    name = os.path.relpath(result["script"])
+    if result["error"]:
+        return f"{name}: imports failed ({result['error']})"
+    lines = [f"{name}: {result['seconds'] * 1000:.0f}ms of imports on top of streamlit"]
+    if budget is not None:
+        status = "over" if result["seconds"] > budget else "within"
+        lines[0] += f" ({status} the {budget * 1000:.0f}ms budget)"
+    for module, seconds in result["modules"][:top_n]:
+        lines.append(f"    {seconds * 1000:8.1f}ms  {module}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "scripts", nargs="*", default=[os.path.join(os.path.dirname(__file__), "streamlit_viz.py")]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help=f"Fail if a script's imports take longer (seconds, e.g. {IMPORT_BUDGET_SECONDS})",
+    )
+    parser.add_argument("--output", default=None, help="Also write the results as json")
+    args = parser.parse_args()
+
+    results = [measure(script, args.repeat) for script in args.scripts]
+    for result in results:
+        print(format_report(result, args.budget))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.budget is not None and any(
+        result["error"] or result["seconds"] > args.budget for result in results
+    ):
+        sys.exit(1)
@@ -1,12 +1,27 @@
-import altair as alt
+import numpy as np
 import pandas as pd
 
+from collections import OrderedDict
 from fnmatch import fnmatch
+from types import MappingProxyType
+import contextlib
+import functools
 import json
-import pickle
-import gzip
+import os
+import sys
+import threading
 
-ChartType = alt.vegalite.v4.api.Chart
+from streamlit_viz_bundle import BUNDLE_DIR_NAME, MANIFEST_FILE_NAME, Bundle
+
+
+def __getattr__(name):
+    # ChartType without importing altair, which only the chart code needs,
+    # with this module (the data scripts and the tests don't)
+    if name == "ChartType":
+        import altair as alt
+
+        return alt.vegalite.v4.api.Chart
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 NESTA_COLOURS = [
@@ -27,15 +42,326 @@ NESTA_COLOURS = [
 ]
 
 
+def _read_file(file_name):
+    if fnmatch(file_name, "*.csv"):
+        return pd.read_csv(file_name)
+    elif fnmatch(file_name, "*.json"):
+        with open(file_name, "r") as file:
+            return json.load(file)
+    elif fnmatch(file_name, "*.npz"):
+        with np.load(file_name) as arrays:
+            return dict(arrays)
+    else:
+        print(f'{file_name} has wrong file extension! Only supports "*.csv", "*.json" or "*.npz"')
+
+
+def _freeze(data):
+    """Make a loaded dataset read-only so one copy can be shared by all sessions"""
+    if isinstance(data, np.ndarray):
+        data.flags.writeable = False
+        return data
+    if isinstance(data, pd.DataFrame):
+        columns = {}
+        for column_name, column in data.items():
+            values = column.to_numpy()
+            # pandas' cython comparisons reject read-only object buffers,
+            # so only the numeric columns are locked
+            if values.dtype != object:
+                values.flags.writeable = False
+            columns[column_name] = values
+        # copy=False keeps the locked arrays themselves (see Bundle.load)
+        return pd.DataFrame(columns, index=data.index, copy=False)
+    if isinstance(data, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return tuple(_freeze(v) for v in data)
+    return data
+
+
+def _data_size(data):
+    """Approximate number of bytes held by a loaded dataset"""
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(deep=True).sum())
+    if isinstance(data, MappingProxyType):
+        return sys.getsizeof(data) + sum(
+            sys.getsizeof(k) + _data_size(v) for k, v in data.items()
+        )
+    if isinstance(data, tuple):
+        return sys.getsizeof(data) + sum(_data_size(v) for v in data)
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    return sys.getsizeof(data)
+
+
+class DataCache:
+    """Process-wide cache of loaded datasets, shared by every streamlit session.
+
+    Entries are keyed on the file path and validated against the file's
+    mtime and size, so a changed file is re-read on the next request.
+    If a current data/bundle (see streamlit_viz_bundle.py) holds the dataset
+    (csv tables only) it is memory-mapped from there instead of parsing the
+    csv file.
+    Cached datasets are read-only: numeric DataFrame columns are non-writeable
+    arrays and JSON objects are returned as (nested) MappingProxyType/tuples.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._bundles = {}
+        self._derived = {}
+        # Paths read by this thread inside track_files()
+        self._tracked = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _bundle(self, data_folder):
+        bundle_folder = os.path.join(data_folder, BUNDLE_DIR_NAME)
+        manifest_path = os.path.join(bundle_folder, MANIFEST_FILE_NAME)
+        if not os.path.exists(manifest_path):
+            return None, None
+        stat = os.stat(manifest_path)
+        signature = ("bundle", stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._bundles.get(bundle_folder)
+        if cached is None or cached[0] != signature:
+            try:
+                bundle = Bundle(bundle_folder)
+            except ValueError:
+                # Built by another bundle version: read the source files
+                bundle = None
+            cached = (signature, bundle)
+            with self._lock:
+                self._bundles[bundle_folder] = cached
+        return cached
+
+    def _source(self, path):
+        """Signature and reader for a dataset, preferring a current bundle"""
+        data_folder, name = os.path.split(path)
+        signature, bundle = self._bundle(data_folder)
+        if bundle is not None and bundle.is_current(name, data_folder):
+            # Memory-mapped with mmap_mode="r", so already read-only
+            return signature, lambda: bundle.load(name)
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size), lambda: _freeze(_read_file(path))
+
+    def _entry(self, file_name):
+        path = os.path.abspath(file_name)
+        tracked = getattr(self._tracked, "paths", None)
+        if tracked is not None and path not in tracked:
+            tracked.append(path)
+        signature, read = self._source(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self.invalidations += 1
+            self.misses += 1
+        # Read outside the lock so slow parses don't block other datasets
+        data = read()
+        entry = (signature, data, _data_size(data))
+        if data is not None:
+            with self._lock:
+                self._entries[path] = entry
+        return entry
+
+    def get(self, file_name):
+        return self._entry(file_name)[1]
+
+    def get_derived(self, file_names, build):
+        """build(*datasets) for the datasets in file_names, cached until any of
+        the files change"""
+        if isinstance(file_names, str):
+            file_names = (file_names,)
+        entries = [self._entry(file_name) for file_name in file_names]
+        key = (tuple(os.path.abspath(file_name) for file_name in file_names), build)
+        signatures = tuple(entry[0] for entry in entries)
+        with self._lock:
+            derived = self._derived.get(key)
+            if derived is not None and derived[0] == signatures:
+                return derived[1]
+        result = build(*[entry[1] for entry in entries])
+        with self._lock:
+            self._derived[key] = (signatures, result)
+        return result
+
+    @contextlib.contextmanager
+    def track_files(self):
+        """Context manager collecting, into the list it yields, the paths of
+        the datasets this thread reads during its block"""
+        outer = getattr(self._tracked, "paths", None)
+        self._tracked.paths = paths = []
+        try:
+            yield paths
+        finally:
+            self._tracked.paths = outer
+            if outer is not None:
+                outer.extend(path for path in paths if path not in outer)
+
+    def signatures(self, file_names):
+        """The current signatures of the files, None for a missing one; they
+        differ from the ones a dataset was read with once it changed"""
+        signatures = []
+        for file_name in file_names:
+            try:
+                signatures.append(self._source(os.path.abspath(file_name))[0])
+            except FileNotFoundError:
+                signatures.append(None)
+        return tuple(signatures)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bundles.clear()
+            self._derived.clear()
+
+    @property
+    def bytes_held(self):
+        with self._lock:
+            return sum(entry[2] for entry in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes_held": sum(entry[2] for entry in self._entries.values()),
+            }
+
+
+DATA_CACHE = DataCache()
+
+
 def load_data(file_name, local=True):
+    """Load a csv, json or npz dataset, served from the process-wide DATA_CACHE"""
     if local:
-        if fnmatch(file_name, "*.csv"):
-            return pd.read_csv(file_name)
-        elif fnmatch(file_name, "*.json"):
-            with open(file_name, "r") as file:
-                return json.load(file)
-        else:
-            print(f'{file_name} has wrong file extension! Only supports "*.csv" or "*.json"')
+        return DATA_CACHE.get(file_name)
+
+
+def load_derived(file_names, build):
+    """Structure built by build(*datasets) from one or more datasets (e.g. a
+    lookup index), shared process-wide and rebuilt only when a file changes"""
+    return DATA_CACHE.get_derived(file_names, build)
+
+# DataFrames of the chart being converted by chart_to_spec in this thread
+_spec_datasets = threading.local()
+# Enabling a data transformer is process-wide, so one conversion at a time
+_transformer_lock = threading.Lock()
+
+
+def _dataset_id_transform(data):
+    _spec_datasets.current[id(data)] = data
+    return {"name": str(id(data))}
+
+
+def chart_to_spec(chart):
+    """Vega-Lite spec of an altair chart, with its data kept as DataFrames in
+    spec["datasets"] (as st.altair_chart does), ready for st.vega_lite_chart"""
+    import altair as alt
+
+    enable_nesta_theme()
+    datasets = {}
+    with _transformer_lock:
+        # Registered here rather than on import, like the theme; registering
+        # again just replaces it
+        alt.data_transformers.register("dataset_id", _dataset_id_transform)
+        with alt.data_transformers.enable("dataset_id"):
+            _spec_datasets.current = datasets
+            try:
+                spec = chart.to_dict()
+            finally:
+                _spec_datasets.current = None
+    spec["datasets"] = datasets
+    return spec
+
+
+class ChartSpecCache:
+    """Process-wide LRU cache of finished chart specs, keyed on the chart
+    builder and its arguments (the current selections)"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._specs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self._specs:
+                self._specs.move_to_end(key)
+                self.hits += 1
+                return self._specs[key]
+            self.misses += 1
+        result = build()
+        with self._lock:
+            self._specs[key] = result
+            self._specs.move_to_end(key)
+            while len(self._specs) > self.max_size:
+                self._specs.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._specs.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._specs),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+CHART_CACHE = ChartSpecCache()
+
+
+def _to_specs(result):
+    import altair as alt
+
+    if isinstance(result, alt.TopLevelMixin):
+        return chart_to_spec(result)
+    if isinstance(result, tuple):
+        return tuple(_to_specs(r) for r in result)
+    return result
+
+
+def memoize_chart(builder):
+    """Memoize a chart builder in CHART_CACHE. Altair charts it returns (alone
+    or in a tuple) are replaced by their Vega-Lite spec dicts, to be drawn with
+    st.vega_lite_chart. Arguments must be hashable; lookup indexes are keyed
+    on identity, so a rebuilt index (changed data file) is a cache miss."""
+
+    @functools.wraps(builder)
+    def memoized_builder(*args, **kwargs):
+        # Key on the code object too: builders in the streamlit script are
+        # redefined on every rerun, and an edited builder must not hit
+        key = (
+            builder.__module__,
+            builder.__qualname__,
+            builder.__code__,
+            args,
+            tuple(sorted(kwargs.items())),
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return _to_specs(builder(*args, **kwargs))
+        return CHART_CACHE.get(key, lambda: _to_specs(builder(*args, **kwargs)))
+
+    return memoized_builder
+
 
 def nestafont(font:str = "Century Gothic"):
     """Define Nesta fonts"""
@@ -55,8 +381,14 @@ def nestafont(font:str = "Century Gothic"):
     }
 
 
-alt.themes.register("nestafont", nestafont)
-alt.themes.enable("nestafont")
+def enable_nesta_theme():
+    """Register and enable the nestafont altair theme, on drawing the first
+    chart rather than on import"""
+    import altair as alt
+
+    if alt.themes.active != "nestafont":
+        alt.themes.register("nestafont", nestafont)
+        alt.themes.enable("nestafont")
 
 
 def configure_plots(
@@ -0,0 +1,11 @@
+"""The scripts in streamlit_viz/ and app/ import their siblings by module
+name, as they do when run with streamlit, so those folders go on the path."""
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for folder in ("streamlit_viz", "app"):
+    path = os.path.join(PROJECT_DIR, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import app_batch_extract
+from app_batch_extract import read_jsonl_adverts, run
+
+
+@pytest.fixture
+def adverts_path(tmp_path):
+    path = tmp_path / "adverts.jsonl"
+    lines = [
+        json.dumps({"job_id": "a", "description": "first"}),
+        "",
+        json.dumps({"job_id": "b", "description": "second"}),
+        "   ",
+        "",
+        json.dumps({"job_id": "c", "description": "third"}),
+        json.dumps({"job_id": "d", "description": "fourth"}),
+        "",
+    ]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("adverts_done", [0, 1, 2, 3, 4])
+def test_resume_skips_the_adverts_already_done(adverts_path, adverts_done):
+    # As --resume does with the checkpoint's count of adverts written
+    done = list(read_jsonl_adverts(adverts_path))[:adverts_done]
+    rest = list(read_jsonl_adverts(adverts_path, skip=adverts_done))
+    assert done + rest == [
+        ("a", "first"),
+        ("b", "second"),
+        ("c", "third"),
+        ("d", "fourth"),
+    ]
+
+
+def test_ids_without_an_id_column_count_adverts_not_lines(tmp_path):
+    path = tmp_path / "adverts.jsonl"
+    path.write_text(
+        "\n".join(["", json.dumps({"text": "first"}), "", json.dumps({"text": "second"})])
+    )
+    assert list(read_jsonl_adverts(str(path))) == [(0, "first"), (1, "second")]
+    assert list(read_jsonl_adverts(str(path), skip=1)) == [(1, "second")]
+
+
+def test_run_shuts_the_pool_down_after_an_error(adverts_path, tmp_path, monkeypatch):
+    shut_down = []
+
+    def extract_chunks(self, chunks):
+        raise RuntimeError("worker died")
+        yield
+
+    monkeypatch.setattr(app_batch_extract.PoolExtractor, "extract_chunks", extract_chunks)
+    monkeypatch.setattr(
+        app_batch_extract.ExtractionPool, "shutdown", lambda pool: shut_down.append(pool)
+    )
+    with pytest.raises(RuntimeError, match="worker died"):
+        run(adverts_path, str(tmp_path / "skills.jsonl"), workers=2)
+    assert len(shut_down) == 1
@@ -0,0 +1,141 @@
+import re
+from collections import OrderedDict
+
+import pytest
+
+import app_utils
+from app_utils import (
+    ExtractionCache,
+    PhraseMappingCache,
+    cached_extract_skills,
+    extract_and_map_skills,
+    extract_skills_by_sentence,
+    merge_sentence_skills,
+    split_sentences,
+)
+
+
+def test_merge_sentence_skills_keeps_each_skill_once():
+    sentence_skills = [
+        {
+            "SKILL": [
+                ["communication", ["communication skills", "S1.2"]],
+                ["teamwork", ["work in teams", "S4.8"]],
+            ],
+            "EXPERIENCE": ["2 years"],
+        },
+        {
+            # Found again in a later sentence, with a different match
+            "SKILL": [["communication", ["communicate", "S1.1"]]],
+            "EXPERIENCE": ["2 years", "5 years"],
+        },
+        {"SKILL": [["python", ["Python", "S5.1"]]]},
+    ]
+    assert merge_sentence_skills(sentence_skills) == {
+        "SKILL": [
+            ["communication", ["communication skills", "S1.2"]],
+            ["teamwork", ["work in teams", "S4.8"]],
+            ["python", ["Python", "S5.1"]],
+        ],
+        "EXPERIENCE": ["2 years", "5 years"],
+    }
+
+
+def test_merge_sentence_skills_of_no_sentences():
+    assert merge_sentence_skills([]) == {}
+    assert merge_sentence_skills([{"SKILL": []}]) == {"SKILL": []}
+
+
+class FakeExtractor:
+    """Stands in for ExtractSkills: a phrase following "e.g." is a skill, so
+    splitting a sentence after "e.g." would lose it, and "x and y skills" is
+    a multiskill"""
+
+    taxonomy_name = "fake"
+
+    def get_skills(self, job_adverts):
+        return [
+            {
+                "SKILL": re.findall(r"e\.g\. (\w+ \w+)", advert),
+                "MULTISKILL": re.findall(r"(\w+ and \w+) skills", advert),
+                "EXPERIENCE": re.findall(r"\d+ years", advert),
+            }
+            for advert in job_adverts
+        ]
+
+    def map_skills(self, predicted_skills):
+        # Multiskills are matched differently to skills, as in the library
+        mapped_skills = []
+        for skills in predicted_skills:
+            mapped = [
+                (phrase.lower(), (phrase.title(), f"{kind}-{phrase.lower()}"))
+                for kind in ("SKILL", "MULTISKILL")
+                for phrase in skills[kind]
+            ]
+            # Empty entries are left out, and so is everything with no skills
+            advert_skills = {"SKILL": mapped, "EXPERIENCE": skills["EXPERIENCE"]}
+            mapped_skills.append(
+                {k: v for k, v in advert_skills.items() if v} if mapped else {}
+            )
+        return mapped_skills
+
+    def extract_skills(self, job_adverts):
+        return self.map_skills(self.get_skills(job_adverts))
+
+
+@pytest.fixture
+def caches(tmp_path, monkeypatch):
+    """A fresh extraction cache, with the phrase cache moved to tmp_path"""
+    monkeypatch.setattr(
+        app_utils.PHRASE_CACHE, "path", str(tmp_path / "phrases.sqlite3")
+    )
+    monkeypatch.setattr(app_utils.PHRASE_CACHE, "_db_ready", False)
+    monkeypatch.setattr(app_utils.PHRASE_CACHE, "_memory", OrderedDict())
+    return ExtractionCache(cache_dir=str(tmp_path / "extractions"))
+
+
+def test_split_sentences_keeps_abbreviations():
+    assert split_sentences(
+        "Skills e.g. Python programming; SQL. Team player, i.e. kind!\nApply now"
+    ) == [
+        "Skills e.g. Python programming; SQL.",
+        "Team player, i.e. kind!",
+        "Apply now.",
+    ]
+
+
+def test_sentence_extraction_matches_whole_advert(caches):
+    es = FakeExtractor()
+    advert = (
+        "Tools, e.g. Python programming; 3 years with Excel, e.g. pivot "
+        "tables.\nTeamwork and communication skills"
+    )
+    (extracted_skills,) = cached_extract_skills(es, [advert], cache=caches)
+    assert extract_skills_by_sentence(es, advert, cache=caches) == [extracted_skills]
+    assert [skill for skill, _ in extracted_skills["SKILL"]] == [
+        "python programming",
+        "pivot tables",
+        "teamwork and communication",
+    ]
+
+
+def test_phrase_cache_maps_like_the_library(tmp_path):
+    es = FakeExtractor()
+    adverts = [
+        "Tools, e.g. Python programming.\nTeamwork and communication skills, "
+        "e.g. written reports, over 2 years",
+        "Nothing to see here",
+        "Teamwork and communication skills",
+    ]
+    phrase_cache = PhraseMappingCache(path=str(tmp_path / "phrases.sqlite3"))
+    expected = es.extract_skills(adverts)
+    assert expected[0]["SKILL"][-1] == (
+        "teamwork and communication",
+        ("Teamwork And Communication", "MULTISKILL-teamwork and communication"),
+    )
+    assert extract_and_map_skills(es, adverts, phrase_cache=phrase_cache) == expected
+    # Again from the memory tier, then from the table alone
+    assert extract_and_map_skills(es, adverts, phrase_cache=phrase_cache) == expected
+    phrase_cache = PhraseMappingCache(path=str(tmp_path / "phrases.sqlite3"))
+    assert extract_and_map_skills(es, adverts, phrase_cache=phrase_cache) == expected
+    assert phrase_cache.stats()["misses"] == 0
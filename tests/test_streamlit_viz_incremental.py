@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from streamlit_viz_aggregate import SkillHierarchy, aggregate
+from streamlit_viz_incremental import AggregateStore
+
+SKILL_CODES = {
+    "skill_id_00001": [["S", "S1", "S1.2", "S1.2.3"]],
+    "skill_id_00002": [["S", "S4", "S4.8", None], ["T", "T1", "T1.1", None]],
+    "skill_id_00003": [["K", "K08", "K081", None]],
+}
+MATCHES = [
+    ("communication", "skill_id_00001"),
+    ("teamwork", "skill_id_00002"),
+    ("agriculture", "skill_id_00003"),
+    ("management skills", "S4.8"),
+    ("digital skills", "S5"),
+]
+
+
+def _adverts(first_id, num_adverts, sectors, regions, seed):
+    rng = np.random.default_rng(seed)
+    skills, metadata = [], []
+    for advert_id in range(first_id, first_id + num_adverts):
+        matches = [MATCHES[i] for i in rng.choice(len(MATCHES), 3)]
+        # Each skill is [raw skill, [taxonomy skill, taxonomy id]]
+        skills.append(
+            {"id": advert_id, "SKILL": [[match[0], list(match)] for match in matches]}
+        )
+        metadata.append(
+            {
+                "id": advert_id,
+                "sector": sectors[rng.integers(len(sectors))],
+                "region": regions[rng.integers(len(regions))],
+            }
+        )
+    return skills, metadata
+
+
+def _write_batch(folder, name, skills, metadata):
+    skills_path = str(folder / f"{name}.jsonl")
+    with open(skills_path, "w") as file:
+        file.writelines(json.dumps(advert) + "\n" for advert in skills)
+    metadata = pd.DataFrame(metadata)
+    metadata.index = metadata.pop("id").astype(str)
+    for column in ("sector", "region"):
+        metadata[column] = metadata[column].astype("category")
+    return skills_path, metadata
+
+
+def _counts(skill_counts, concepts):
+    """({group: number of adverts}, {(group, concept): number of adverts}),
+    without empty groups or counts"""
+    counts = skill_counts.counts.tocoo()
+    return (
+        {
+            str(name): int(num_ads)
+            for name, num_ads in zip(skill_counts.names, skill_counts.num_ads)
+            if num_ads
+        },
+        {
+            (str(skill_counts.names[row]), concepts.keys[col]): int(value)
+            for row, col, value in zip(counts.row, counts.col, counts.data)
+            if value
+        },
+    )
+
+
+@pytest.fixture
+def batches():
+    # The second batch brings a new sector and a new region
+    first = _adverts(0, 40, ["Nurse", "Teacher"], ["London", "Kent"], seed=0)
+    second = _adverts(40, 30, ["Teacher", "Chef"], ["Kent", "Devon"], seed=1)
+    return first, second
+
+
+def test_two_batches_add_up_to_one_full_aggregate(tmp_path, batches):
+    hierarchy = SkillHierarchy(SKILL_CODES)
+    store = AggregateStore(str(tmp_path / "aggregates"), hierarchy)
+    changed = []
+    for batch_num, (skills, metadata) in enumerate(batches):
+        changed.append(
+            store.add_batch(
+                *_write_batch(tmp_path, f"batch_{batch_num}", skills, metadata),
+                chunk_size=7,
+            )
+        )
+    assert sorted(changed[1]["sectors"]) == ["Chef", "Teacher"]
+
+    all_skills = batches[0][0] + batches[1][0]
+    all_metadata = batches[0][1] + batches[1][1]
+    concepts, sectors, regions, total = aggregate(
+        *_write_batch(tmp_path, "all", all_skills, all_metadata), hierarchy
+    )
+    assert sorted(store.concepts.keys) == sorted(concepts.keys)
+    assert _counts(store.sectors, store.concepts) == _counts(sectors, concepts)
+    assert _counts(store.regions, store.concepts) == _counts(regions, concepts)
+    assert _counts(store.total, store.concepts) == _counts(total, concepts)
+
+
+def test_saved_store_reloads_and_refuses_a_repeated_batch(tmp_path, batches):
+    hierarchy = SkillHierarchy(SKILL_CODES)
+    state_folder = str(tmp_path / "aggregates")
+    store = AggregateStore(state_folder, hierarchy)
+    batch = _write_batch(tmp_path, "batch_0", *batches[0])
+    store.add_batch(*batch)
+    store.update_neighbours(store.sectors.names, top_k=1)
+    store.save()
+
+    loaded = AggregateStore.load(state_folder, hierarchy)
+    assert loaded.batches == ["batch_0.jsonl"]
+    assert _counts(loaded.sectors, loaded.concepts) == _counts(store.sectors, store.concepts)
+    np.testing.assert_array_equal(
+        loaded.neighbours["cosine"][0], store.neighbours["cosine"][0]
+    )
+    with pytest.raises(ValueError):
+        loaded.add_batch(*batch)
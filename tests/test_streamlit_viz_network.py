@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from streamlit_viz_network import SimilarityNetwork
+
+
+@pytest.fixture
+def sector_similarity():
+    rng = np.random.default_rng(0)
+    sectors = [f"Sector {i}" for i in range(30)] + ["Other"]
+    pairs = [
+        (source, target)
+        for i, source in enumerate(sectors)
+        for target in sectors[i + 1 :]
+        if rng.random() < 0.3
+    ]
+    return pd.DataFrame(
+        {
+            "source": [source for source, _ in pairs],
+            "target": [target for _, target in pairs],
+            # Two decimal places, so some weights equal the thresholds
+            "weight": rng.integers(0, 101, len(pairs)) / 100,
+        }
+    )
+
+
+@pytest.fixture
+def network(sector_similarity):
+    names = set(sector_similarity["source"]) | set(sector_similarity["target"])
+    return SimilarityNetwork(
+        sector_similarity,
+        {name: f"Domain {len(name) % 3}" for name in names},
+        {name: 0.5 for name in names},
+    )
+
+
+def _baseline(sector_similarity, threshold):
+    """(node names, edge pairs) drawn before the network was prebuilt: the
+    rows above the threshold, without "Other" """
+    high_sector_similarity = sector_similarity[
+        (sector_similarity["weight"] > threshold)
+        & (sector_similarity["target"] != "Other")
+        & (sector_similarity["source"] != "Other")
+    ]
+    edges = set(zip(high_sector_similarity["source"], high_sector_similarity["target"]))
+    nodes = set(high_sector_similarity["source"]) | set(high_sector_similarity["target"])
+    return nodes, edges
+
+
+@pytest.mark.parametrize("threshold", [0.1, 0.4, 0.5, 0.75, 0.9, 1.0])
+def test_threshold_graph_matches_the_baseline(network, sector_similarity, threshold):
+    nodes, edges = network.graph(threshold)
+    baseline_nodes, baseline_edges = _baseline(sector_similarity, threshold)
+    assert network.num_edges_above(threshold) == len(baseline_edges)
+    assert len(edges) == len(baseline_edges)
+    assert len(nodes) == len(baseline_nodes)
+    assert {node.id for node in nodes} == baseline_nodes
+    assert {(edge.source, edge.to) for edge in edges} == baseline_edges
+
+
+@pytest.mark.parametrize("strategy", ["top_k", "spanning_tree", "disparity"])
+def test_sparsified_graphs_stay_above_the_threshold(network, sector_similarity, strategy):
+    threshold = 0.5
+    _, baseline_edges = _baseline(sector_similarity, threshold)
+    nodes, edges = network.graph(threshold, strategy)
+    assert {(edge.source, edge.to) for edge in edges} <= baseline_edges
+    assert {node.id for node in nodes} == {edge.source for edge in edges} | {
+        edge.to for edge in edges
+    }
+
+
+def test_graph_caps_the_edges_strongest_first(network, sector_similarity):
+    _, edges = network.graph(0.1, max_edges=10)
+    weights = [edge.weight for edge in edges]
+    assert len(edges) == 10
+    assert weights == sorted(weights, reverse=True)
+    assert weights[-1] >= sector_similarity["weight"].nlargest(10).min()
+
+
+@pytest.mark.parametrize("threshold", [0.3, 0.6])
+def test_disparity_filters_the_thresholded_graph(sector_similarity, threshold):
+    def network_of(rows):
+        names = set(rows["source"]) | set(rows["target"])
+        return SimilarityNetwork(
+            rows, {name: "Domain" for name in names}, {name: 0.5 for name in names}
+        )
+
+    above = sector_similarity[sector_similarity["weight"] > threshold]
+    _, edges = network_of(sector_similarity).graph(threshold, "disparity", alpha=0.2)
+    _, expected = network_of(above).graph(threshold, "disparity", alpha=0.2)
+    assert {(edge.source, edge.to) for edge in edges} == {
+        (edge.source, edge.to) for edge in expected
+    }
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from streamlit_viz_similarity import top_k_neighbours, update_top_k_neighbours
+
+
+def _profiles(num_sectors, seed):
+    return sparse.random(
+        num_sectors, 40, density=0.3, format="csr", random_state=seed
+    )
+
+
+@pytest.mark.parametrize("metric", ["euclidean", "cosine"])
+@pytest.mark.parametrize("changed", [[], [3], [0, 7, 8, 20]])
+def test_update_matches_a_full_rebuild(metric, changed):
+    k = 5
+    profiles = _profiles(30, seed=0)
+    indices, values = top_k_neighbours(profiles, metric, k, block_size=7)
+
+    # Change some sectors' profiles and add two new sectors
+    updated = sparse.lil_matrix(sparse.vstack([profiles, _profiles(2, seed=1)]))
+    replacement = _profiles(len(changed), seed=2) if changed else None
+    for row, sector in enumerate(changed):
+        updated[sector] = replacement[row]
+    updated = updated.tocsr()
+
+    new_indices, new_values = update_top_k_neighbours(
+        updated, changed, indices, values, metric, k, block_size=7
+    )
+    expected_indices, expected_values = top_k_neighbours(updated, metric, k)
+    np.testing.assert_array_equal(new_indices, expected_indices)
+    np.testing.assert_allclose(new_values, expected_values)
+
+
+def test_blocks_in_worker_processes_match_one_process():
+    profiles = _profiles(25, seed=3)
+    indices, values = top_k_neighbours(profiles, "cosine", 4, block_size=5)
+    pooled_indices, pooled_values = top_k_neighbours(
+        profiles, "cosine", 4, block_size=5, workers=2
+    )
+    np.testing.assert_array_equal(pooled_indices, indices)
+    np.testing.assert_allclose(pooled_values, values)
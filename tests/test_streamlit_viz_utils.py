@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from streamlit_viz_bundle import Bundle, build_bundle
+from streamlit_viz_utils import DataCache, _read_file
+
+
+def _write_csv(path, df, mtime_ns):
+    df.to_csv(path, index=False)
+    # Explicit mtimes, so a rewrite is seen even within the clock's resolution
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _table():
+    return pd.DataFrame(
+        {
+            "region": ["London", "Surrey", None, "London", "Kent"],
+            "skill": ["S1", "S2", "S1", "S3", None],
+            "num_ads": [10, 20, 30, 40, 50],
+            "skill_percent": [0.1, 0.25, np.nan, 0.5, 1.0],
+        }
+    )
+
+
+def test_data_cache_rereads_a_changed_file(tmp_path):
+    path = str(tmp_path / "table.csv")
+    _write_csv(path, pd.DataFrame({"a": [1, 2]}), 1_000_000_000)
+    cache = DataCache()
+
+    first = cache.get(path)
+    assert cache.get(path) is first
+    assert (cache.hits, cache.misses, cache.invalidations) == (1, 1, 0)
+    signatures = cache.signatures([path])
+
+    _write_csv(path, pd.DataFrame({"a": [1, 2, 3]}), 2_000_000_000)
+    assert cache.signatures([path]) != signatures
+    second = cache.get(path)
+    assert second["a"].tolist() == [1, 2, 3]
+    assert (cache.hits, cache.misses, cache.invalidations) == (1, 2, 1)
+
+
+def test_data_cache_rebuilds_derived_data_of_a_changed_file(tmp_path):
+    path = str(tmp_path / "table.csv")
+    _write_csv(path, pd.DataFrame({"a": [1, 2]}), 1_000_000_000)
+    cache = DataCache()
+    builds = []
+
+    def total(df):
+        builds.append(df)
+        return int(df["a"].sum())
+
+    assert cache.get_derived(path, total) == 3
+    assert cache.get_derived(path, total) == 3
+    assert len(builds) == 1
+
+    _write_csv(path, pd.DataFrame({"a": [1, 2, 3]}), 2_000_000_000)
+    assert cache.get_derived(path, total) == 6
+    assert len(builds) == 2
+
+
+def test_data_cache_tracks_the_files_read(tmp_path):
+    paths = [str(tmp_path / name) for name in ("a.csv", "b.csv")]
+    for path in paths:
+        _write_csv(path, pd.DataFrame({"a": [1]}), 1_000_000_000)
+    cache = DataCache()
+
+    with cache.track_files() as outer:
+        cache.get(paths[0])
+        with cache.track_files() as inner:
+            cache.get(paths[1])
+            cache.get(paths[1])
+    assert inner == [paths[1]]
+    assert outer == paths
+
+
+def test_bundle_round_trip_matches_the_csv(tmp_path):
+    data_folder = str(tmp_path)
+    path = os.path.join(data_folder, "table.csv")
+    _write_csv(path, _table(), 1_000_000_000)
+    bundle = Bundle(build_bundle(data_folder))
+    assert bundle.is_current("table.csv", data_folder)
+
+    loaded = bundle.load("table.csv")
+    expected = _read_file(path)
+    for column_name in ("region", "skill"):
+        assert isinstance(loaded[column_name].dtype, pd.CategoricalDtype)
+        loaded[column_name] = loaded[column_name].astype(object)
+    pd.testing.assert_frame_equal(loaded, expected)
+    # Each string column keeps only its own categories
+    assert sorted(bundle.categories("table.csv", "skill")) == ["S1", "S2", "S3"]
+
+
+def test_bundle_columns_are_not_copied(tmp_path, monkeypatch):
+    data_folder = str(tmp_path)
+    # Several columns of each dtype, which pandas could consolidate into one
+    # block (copying the memory maps)
+    table = pd.concat([_table(), _table().add_suffix("_2")], axis=1)
+    _write_csv(os.path.join(data_folder, "table.csv"), table, 1_000_000_000)
+    bundle = Bundle(build_bundle(data_folder))
+
+    # The memory maps load opens (each column() call maps the file afresh)
+    mapped = {}
+    column = bundle.column
+
+    def recording_column(file_name, column_name):
+        mapped[column_name] = column(file_name, column_name)
+        return mapped[column_name]
+
+    monkeypatch.setattr(bundle, "column", recording_column)
+    loaded = bundle.load("table.csv")
+    assert list(mapped) == list(loaded.columns)
+    for column_name, memmap in mapped.items():
+        assert isinstance(memmap, np.memmap)
+        values = loaded[column_name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.codes
+        assert np.shares_memory(values.to_numpy(), memmap), column_name
+
+
+def test_data_cache_frames_are_read_only(tmp_path):
+    path = str(tmp_path / "table.csv")
+    _write_csv(path, _table(), 1_000_000_000)
+    frame = DataCache().get(path)
+    for column_name in ("num_ads", "skill_percent"):
+        assert not frame[column_name].to_numpy().flags.writeable
+
+
+def test_data_cache_reads_a_stale_bundle_from_the_csv(tmp_path):
+    data_folder = str(tmp_path)
+    path = os.path.join(data_folder, "table.csv")
+    _write_csv(path, _table(), 1_000_000_000)
+    build_bundle(data_folder)
+    cache = DataCache()
+    assert isinstance(cache.get(path)["region"].dtype, pd.CategoricalDtype)
+
+    _write_csv(path, _table().iloc[:2], 2_000_000_000)
+    reloaded = cache.get(path)
+    assert len(reloaded) == 2
+    assert reloaded["region"].dtype == object